@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List
 import os
@@ -9,7 +10,20 @@ import numpy as np
 import clip
 import torch
 
-app = FastAPI(title='Gemma Recommender', version='0.1')
+# GEMMA_FAST_JSON=1 serializes responses with orjson when it is installed
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+_FAST_JSON = os.getenv('GEMMA_FAST_JSON', '0') == '1' and _HAS_ORJSON
+
+app = FastAPI(
+    title='Gemma Recommender',
+    version='0.1',
+    default_response_class=ORJSONResponse if _FAST_JSON else JSONResponse,
+)
 
 # Enable CORS to allow frontend requests
 app.add_middleware(
@@ -95,9 +109,9 @@ def recommend(req: RecommendRequest):
         D, I = _index.search(vec.astype(np.float32), req.limit)
         results = []
         
-        for i, d in zip(I[0], D[0]):
+        # Plain Python ints/floats once per result list, not a numpy scalar conversion per hit
+        for idx, d in zip(I[0].tolist(), D[0].tolist()):
             ex_id = None
-            idx = int(i)
             if _rows and 0 <= idx < len(_rows):
                 ex_id = _rows[idx]
             else:
@@ -106,7 +120,7 @@ def recommend(req: RecommendRequest):
             # Convert score (distance) to similarity score (higher is better)
             # FAISS IndexFlatIP returns inner product, so higher is better
             # If using L2, we'd need to convert distance to similarity
-            similarity_score = float(d) if d > 0 else 0.0
+            similarity_score = d if d > 0 else 0.0
             results.append({'id': ex_id, 'score': similarity_score})
         
         return {'exhibits': results}
@@ -6,7 +6,14 @@ Includes query expansion, embedding features, and advanced matching.
 from __future__ import annotations
 
 import re
-from typing import Any, Dict, List, Set
+from collections import Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Pattern, Sequence, Set, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from user_query import UserQuery
 
 # Interest synonyms and expansions for query expansion
 INTEREST_SYNONYMS: Dict[str, List[str]] = {
@@ -29,25 +36,33 @@ INTEREST_SYNONYMS: Dict[str, List[str]] = {
     "motion": ["movement", "physics", "mechanics", "kinematics"],
 }
 
+@lru_cache(maxsize=4096)
+def _expansion_sequence(interest_lower: str) -> Tuple[str, ...]:
+    """Terms ``expand_query`` adds for one interest, in insertion order (memoized).
+
+    Replaying the same insertions keeps the expanded set, and so the order of
+    the returned list, identical to expanding the interest on every call.
+    Assumes INTEREST_SYNONYMS is not modified at runtime.
+    """
+    sequence = [interest_lower]
+    # Add synonyms
+    if interest_lower in INTEREST_SYNONYMS:
+        sequence.extend(INTEREST_SYNONYMS[interest_lower])
+    # Add partial matches (e.g., "ai" matches "artificial intelligence")
+    for key, synonyms in INTEREST_SYNONYMS.items():
+        if key in interest_lower or interest_lower in key:
+            sequence.extend(synonyms)
+            sequence.append(key)
+    return tuple(sequence)
+
+
 def expand_query(interests: List[str]) -> List[str]:
     """Expand user interests with synonyms and related terms."""
     expanded = set()
     for interest in interests:
         if not interest:
             continue
-        interest_lower = interest.lower().strip()
-        expanded.add(interest_lower)
-        
-        # Add synonyms
-        if interest_lower in INTEREST_SYNONYMS:
-            expanded.update(INTEREST_SYNONYMS[interest_lower])
-        
-        # Add partial matches (e.g., "ai" matches "artificial intelligence")
-        for key, synonyms in INTEREST_SYNONYMS.items():
-            if key in interest_lower or interest_lower in key:
-                expanded.update(synonyms)
-                expanded.add(key)
-    
+        expanded.update(_expansion_sequence(interest.lower().strip()))
     return list(expanded)
 
 
@@ -105,67 +120,160 @@ def ngram_overlap(text1: str, text2: str, n: int = 2) -> float:
     return len(intersection) / len(union) if union else 0.0
 
 
-def build_advanced_features(user: Dict[str, Any], exhibit: Dict[str, Any]) -> Dict[str, float]:
-    """Build advanced features including query expansion and n-grams."""
+def _import_features():
     # Import here to avoid circular imports
     import sys
     from pathlib import Path
     ml_dir = Path(__file__).parent
     if str(ml_dir) not in sys.path:
         sys.path.insert(0, str(ml_dir))
-    
-    from features import build_feature_vector
+
+    import features
+    return features
+
+
+class QueryMatcher:
+    """An expanded query compiled once for the per-exhibit text features.
+
+    Per exhibit, the terms are tested against the full text in one pass;
+    only terms found there are looked up in the name and description (both
+    are substrings of the full text) and tested for a whole-word match.
+    Counts reproduce ``calculate_tf_idf_score`` / ``calculate_coverage_score``
+    per field exactly. (A pure-Python Aho-Corasick or a regex alternation
+    scan measured slower than these C-level containment tests.)
+    """
+
+    WORD_TERM_RE = re.compile(r'[a-z]{3,}')
+
+    def __init__(self, expanded_interests: Tuple[str, ...]):
+        self.num_terms = len(expanded_interests)
+        # (term, multiplicity, whole-word pattern if the term can be a WORD_RE token)
+        self.terms: List[Tuple[str, int, Optional[Pattern[str]]]] = [
+            (term, count, re.compile(r'\b' + term + r'\b') if self.WORD_TERM_RE.fullmatch(term) else None)
+            for term, count in Counter(t.lower() for t in expanded_interests).items()
+        ]
+        query_text = " ".join(expanded_interests).lower()
+        self.bigrams = extract_ngrams(query_text, 2)
+        self.trigrams = extract_ngrams(query_text, 3)
+
+    def _field(self, terms: List[Tuple[str, int, Optional[Pattern[str]]]], text: str) -> Tuple[float, float]:
+        """(tf-idf, coverage) of one field from the terms that can occur in it."""
+        if not self.num_terms or not text:
+            return 0.0, 0.0
+        substring = words = 0
+        for term, count, word_re in terms:
+            if term in text:
+                substring += count
+                if word_re is not None and word_re.search(text):
+                    words += count
+        # A whole-word match scores 1, a substring-only match 0.5
+        return (words + (substring - words) * 0.5) / self.num_terms, substring / self.num_terms
+
+    def text_features(self, profile: Any) -> Dict[str, float]:
+        """TF-IDF, coverage and hit features of one exhibit profile."""
+        full_text = profile.full_text
+        in_full = [t for t in self.terms if t[0] in full_text]
+        candidates = in_full if profile.fields_in_full else self.terms
+        tf_idf_name, coverage_name = self._field(candidates, profile.name_lower)
+        tf_idf_desc, coverage_desc = self._field(candidates, profile.desc_lower)
+        tf_idf_full, coverage_full = self._field(in_full, full_text)
+        expanded_hits = sum(count for _, count, _ in in_full)
+        return {
+            "expanded_tf_idf_name": tf_idf_name,
+            "expanded_tf_idf_desc": tf_idf_desc,
+            "expanded_tf_idf_full": tf_idf_full,
+            "expanded_coverage_name": coverage_name,
+            "expanded_coverage_desc": coverage_desc,
+            "expanded_coverage_full": coverage_full,
+            "expanded_hits": float(expanded_hits),
+            "expanded_hits_normalized": expanded_hits / self.num_terms if self.num_terms else 0.0,
+        }
+
+
+@lru_cache(maxsize=256)
+def query_matcher(expanded_interests: Tuple[str, ...]) -> QueryMatcher:
+    return QueryMatcher(expanded_interests)
+
+
+def build_expanded_features(expanded_interests: List[str], exhibit: Dict[str, Any]) -> Dict[str, float]:
+    """Query-expansion and n-gram features of one exhibit for an already expanded query."""
+    _import_features()
+    from exhibit_profiles import get_profile
+
+    return _expanded_features(query_matcher(tuple(expanded_interests)), get_profile(exhibit))
+
+
+def _expanded_features(matcher: QueryMatcher, profile: Any) -> Dict[str, float]:
+    from features import id_jaccard
+
+    text_features = matcher.text_features(profile)
+    # N-gram overlap against the profile's interned n-gram ids
+    return {
+        **{key: text_features[key] for key in TEXT_FEATURE_KEYS[:6]},
+        "bigram_overlap": id_jaccard(matcher.bigrams, profile.bigram_ids, profile.vocab),
+        "trigram_overlap": id_jaccard(matcher.trigrams, profile.trigram_ids, profile.vocab),
+        **{key: text_features[key] for key in TEXT_FEATURE_KEYS[6:]},
+    }
+
+
+TEXT_FEATURE_KEYS = [
+    "expanded_tf_idf_name",
+    "expanded_tf_idf_desc",
+    "expanded_tf_idf_full",
+    "expanded_coverage_name",
+    "expanded_coverage_desc",
+    "expanded_coverage_full",
+    "expanded_hits",
+    "expanded_hits_normalized",
+]
+
+
+def build_advanced_features(user: Dict[str, Any] | UserQuery, exhibit: Dict[str, Any]) -> Dict[str, float]:
+    """Build advanced features including query expansion and n-grams.
+
+    The corpus-level BM25/TF-IDF columns (text_index.SCORE_FEATURE_KEYS) need
+    the whole exhibit list and only come from build_advanced_feature_columns.
+    """
+    features = _import_features()
+    from exhibit_profiles import get_profile
+    from user_query import UserQuery
+
+    query = UserQuery.of(user)
     
     # Get base features
-    base_features = build_feature_vector(user, exhibit)
-    
-    # Query expansion
-    interests = [x.strip() for x in (user.get("interests") or []) if x]
-    expanded_interests = expand_query(interests)
-    
-    # Exhibit text
-    name_text = str(exhibit.get("name", ""))
-    desc_text = str(exhibit.get("description", ""))
-    category = exhibit.get("category") or exhibit.get("exhibitType") or ""
-    full_text = " ".join([name_text, desc_text, category]).lower()
+    base_features = features.build_feature_vector(query, exhibit)
     
-    # Advanced matching with expanded query
-    expanded_query_text = " ".join(expanded_interests).lower()
-    
-    # TF-IDF like scores
-    tf_idf_name = calculate_tf_idf_score(expanded_interests, name_text)
-    tf_idf_desc = calculate_tf_idf_score(expanded_interests, desc_text)
-    tf_idf_full = calculate_tf_idf_score(expanded_interests, full_text)
-    
-    # Coverage scores
-    coverage_name = calculate_coverage_score(expanded_interests, name_text)
-    coverage_desc = calculate_coverage_score(expanded_interests, desc_text)
-    coverage_full = calculate_coverage_score(expanded_interests, full_text)
-    
-    # N-gram overlap
-    bigram_overlap = ngram_overlap(expanded_query_text, full_text, n=2)
-    trigram_overlap = ngram_overlap(expanded_query_text, full_text, n=3)
-    
-    # Expanded interest hits
-    expanded_hits = sum(1 for term in expanded_interests if term.lower() in full_text)
-    expanded_hits_normalized = expanded_hits / len(expanded_interests) if expanded_interests else 0.0
-    
-    # Combine with base features
-    advanced_features = {
-        **base_features,
-        "expanded_tf_idf_name": tf_idf_name,
-        "expanded_tf_idf_desc": tf_idf_desc,
-        "expanded_tf_idf_full": tf_idf_full,
-        "expanded_coverage_name": coverage_name,
-        "expanded_coverage_desc": coverage_desc,
-        "expanded_coverage_full": coverage_full,
-        "bigram_overlap": bigram_overlap,
-        "trigram_overlap": trigram_overlap,
-        "expanded_hits": float(expanded_hits),
-        "expanded_hits_normalized": expanded_hits_normalized,
-    }
-    
-    return advanced_features
+    # Query expansion (done once per UserQuery) combined with base features
+    return {**base_features, **_expanded_features(query.matcher, get_profile(exhibit))}
+
+
+def build_advanced_feature_columns(user: Dict[str, Any] | UserQuery, exhibits: Sequence[Dict[str, Any]], arrays: Any = None, base_columns: Dict[str, np.ndarray] | None = None) -> Dict[str, np.ndarray]:
+    """Batch ``build_advanced_features``: float64 columns keyed by ADVANCED_FEATURE_KEYS."""
+    features = _import_features()
+    from user_query import UserQuery
+
+    if arrays is None:
+        from exhibit_profiles import exhibit_arrays
+        arrays = exhibit_arrays(exhibits)
+    query = UserQuery.of(user)
+    columns = dict(base_columns) if base_columns is not None else features.build_feature_columns(query, arrays)
+
+    # TF-IDF/coverage/hit columns and BM25 scores from the sparse text index (text_index.py)
+    columns.update(arrays.text_columns(query.expanded))
+    # N-gram overlaps for every exhibit at once from the interned incidence matrices
+    matcher = query.matcher
+    columns["bigram_overlap"] = features._keyword_jaccard(matcher.bigrams, arrays.bigrams)
+    columns["trigram_overlap"] = features._keyword_jaccard(matcher.trigrams, arrays.trigrams)
+    return columns
+
+
+def build_advanced_feature_matrix(user: Dict[str, Any] | UserQuery, exhibits: Sequence[Dict[str, Any]], arrays: Any = None) -> np.ndarray:
+    """An (N, len(ADVANCED_FEATURE_KEYS)) float32 matrix for one user."""
+    columns = build_advanced_feature_columns(user, exhibits, arrays)
+    X = np.empty((len(columns[ADVANCED_FEATURE_KEYS[0]]), len(ADVANCED_FEATURE_KEYS)), dtype=np.float32)
+    for j, key in enumerate(ADVANCED_FEATURE_KEYS):
+        X[:, j] = columns[key]
+    return X
 
 
 # Export feature keys for training
@@ -198,5 +306,10 @@ ADVANCED_FEATURE_KEYS = [
     "trigram_overlap",
     "expanded_hits",
     "expanded_hits_normalized",
+    # Corpus-level scores from text_index.py (SCORE_FEATURE_KEYS)
+    "bm25_name",
+    "bm25_desc",
+    "bm25_full",
+    "tfidf_full",
 ]
 
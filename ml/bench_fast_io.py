@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ranker service's fast JSON path (fast_io.py) against Pydantic.
+
+For /rank payloads carrying 1k and 10k exhibits, times decoding the body the
+way the service does by default (Pydantic model_validate_json + model_dump)
+against fast_io.RequestDecoder, and serializing a full ranking of the same
+exhibits with json.dumps against fast_io.dumps. Both decoders must produce
+identical dicts.
+
+Usage:
+  python ml/bench_fast_io.py
+  python ml/bench_fast_io.py --sizes 1000,10000,50000 --repeat 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+# Importing the service loads the model bundle; do not start its file watcher
+os.environ.setdefault("RANKER_MODEL_POLL", "0")
+
+import fast_io  # noqa: E402
+from fast_io import RequestDecoder  # noqa: E402
+from ranker_service import RankRequest  # noqa: E402
+
+CATEGORIES = ["Space", "Physics", "Biology", "Robotics", "Energy", "Environment", "Mathematics"]
+WORDS = "planet orbit robot circuit energy solar cell gravity light sound wave fossil ocean climate star".split()
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Best-of-``repeat`` wall time in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000.0
+
+
+def synthetic_exhibit(i: int, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "id": f"ex-{i:06d}",
+        "name": " ".join(rng.choices(WORDS, k=3)).title(),
+        "description": " ".join(rng.choices(WORDS, k=40)),
+        "category": rng.choice(CATEGORIES),
+        "exhibitType": rng.choice(["interactive", "display", "simulation"]),
+        "ageRange": rng.choice(["kids", "teens", "adults", "all"]),
+        "features": rng.sample(WORDS, 3),
+        "interactiveFeatures": rng.sample(["touch", "quiz", "vr", "audio"], 2),
+        "rating": round(rng.uniform(3.0, 5.0), 1),
+        "tags": rng.sample(WORDS, 4),
+        "floor": rng.choice(["ground", "first", "second"]),
+    }
+
+
+def bench_size(n: int, repeat: int, rng: random.Random) -> bool:
+    payload = {
+        "userProfile": {"interests": ["space", "robotics"], "ageBand": "adults", "groupType": "family", "timeBudget": 60},
+        "exhibits": [synthetic_exhibit(i, rng) for i in range(n)],
+        "topK": 20,
+    }
+    body = json.dumps(payload).encode("utf-8")
+    decoder = RequestDecoder(RankRequest)
+    same = RankRequest.model_validate_json(body).model_dump() == decoder.decode(body)
+
+    # A full ranking of the payload, as /rank returns with topK = n
+    response = {"success": True, "results": [{"id": ex["id"], "score": rng.random()} for ex in payload["exhibits"]], "tier": "ensemble"}
+    same &= json.loads(json.dumps(response)) == json.loads(fast_io.dumps(response))
+
+    t_pyd = time_call(lambda: RankRequest.model_validate_json(body).model_dump(), repeat)
+    t_fast = time_call(lambda: decoder.decode(body), repeat)
+    t_json = time_call(lambda: json.dumps(response), repeat)
+    t_enc = time_call(lambda: fast_io.dumps(response), repeat)
+    print(
+        f"{n:>7} {len(body) / 1e6:>7.2f} {t_pyd:>10.2f} {t_fast:>9.2f} {t_pyd / t_fast:>7.2f}x"
+        f" {t_json:>9.2f} {t_enc:>9.2f} {t_json / t_enc:>7.2f}x  {'yes' if same else 'NO'}"
+    )
+    return same
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="1000,10000", help="Comma-separated exhibit counts per payload")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes: List[int] = [int(x) for x in args.sizes.split(",") if x.strip()]
+    print(f"JSON backend: {'orjson' if fast_io.HAS_ORJSON else 'stdlib json'}")
+    print(f"{'exhibits':>7} {'MB':>7} {'pydantic':>10} {'fast':>9} {'speedup':>8} {'json.dumps':>9} {'fast enc':>9} {'speedup':>8}  same")
+    ok = True
+    for n in sizes:
+        ok &= bench_size(n, args.repeat, rng)
+    print("\nFast path output matches Pydantic and json." if ok else "\nMISMATCH between the fast path and Pydantic/json!")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark tree_eval.TreeEnsemble against lgb.Booster.predict.
+
+Times both evaluators across batch sizes on the ranker's models (or any model
+files given with --models), checks that their scores match exactly, and also
+times the fused primary+secondary evaluation used by EnsembleRanker.
+
+Usage:
+  python ml/bench_tree_eval.py
+  python ml/bench_tree_eval.py --batch-sizes 1,50,500,5000 --repeat 50
+  python ml/bench_tree_eval.py --synthetic 300   # also a 300-tree, 255-leaf model with NaNs/zeros
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import lightgbm as lgb
+import numpy as np
+
+from tree_eval import TreeEnsemble
+
+MODEL_DIR = Path(__file__).resolve().parent / "models"
+
+
+def random_rows(n: int, num_feature: int, rng: np.random.Generator, missing: bool = False) -> np.ndarray:
+    """Feature-like rows: mostly small non-negative values with many exact zeros."""
+    X = rng.random((n, num_feature)).astype(np.float32) * rng.integers(1, 5, size=num_feature)
+    X[rng.random((n, num_feature)) < 0.4] = 0.0
+    if missing:
+        X[rng.random((n, num_feature)) < 0.05] = np.nan
+    return X
+
+
+def time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Best-of-``repeat`` wall time in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000.0
+
+
+def train_synthetic(num_trees: int, num_feature: int, rng: np.random.Generator) -> Path:
+    """A large lambdarank model with zero- and NaN-aware splits, saved to a temp file."""
+    X = random_rows(20000, num_feature, rng, missing=True)
+    y = np.clip((np.nan_to_num(X[:, 0]) + np.nan_to_num(X[:, 3]) * 2 + rng.random(len(X))).astype(int), 0, 4)
+    group = [100] * (len(X) // 100)
+    params = {
+        "objective": "lambdarank",
+        "num_leaves": 255,
+        "max_depth": 15,
+        "min_data_in_leaf": 5,
+        "learning_rate": 0.05,
+        "verbose": -1,
+    }
+    booster = lgb.train(params, lgb.Dataset(X, label=y, group=group), num_boost_round=num_trees)
+    path = Path(tempfile.mkdtemp()) / "synthetic_ranker.txt"
+    booster.save_model(str(path))
+    return path
+
+
+def bench_model(label: str, paths: List[Path], weights: List[float], batch_sizes: List[int], repeat: int, rng: np.random.Generator, missing: bool = False) -> bool:
+    boosters = [lgb.Booster(model_file=str(p)) for p in paths]
+    forest = TreeEnsemble.fuse([TreeEnsemble.from_model_file(p) for p in paths])
+    num_feature = boosters[0].num_feature()
+
+    def lgb_predict(X: np.ndarray) -> np.ndarray:
+        # Same accumulation as EnsembleRanker.predict
+        out = np.zeros(len(X))
+        for booster, weight in zip(boosters, weights):
+            out += booster.predict(X) * weight
+        return out
+
+    print(f"\n{label}: {forest.num_trees} trees, max depth {forest.max_depth}, {num_feature} features")
+    print(f"{'rows':>7} {'lightgbm ms':>12} {'numpy ms':>10} {'speedup':>8}  exact")
+    all_exact = True
+    for n in batch_sizes:
+        X = random_rows(n, num_feature, rng, missing)
+        exact = bool(np.array_equal(lgb_predict(X), forest.predict(X, weights)))
+        all_exact &= exact
+        t_lgb = time_call(lambda: lgb_predict(X), repeat)
+        t_np = time_call(lambda: forest.predict(X, weights), repeat)
+        print(f"{n:>7} {t_lgb:>12.3f} {t_np:>10.3f} {t_lgb / t_np:>7.2f}x  {'yes' if exact else 'NO'}")
+    return all_exact
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=str, default="", help="Comma-separated model files (default: ranker.txt,ranker_secondary.txt)")
+    parser.add_argument("--weights", type=str, default="", help="Comma-separated weights (default: EnsembleRanker's 0.6/0.3, normalized)")
+    parser.add_argument("--batch-sizes", type=str, default="1,10,50,100,200,500,1000,5000")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--synthetic", type=int, default=0, help="Also benchmark a synthetic model with this many trees")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    batch_sizes = [int(x) for x in args.batch_sizes.split(",") if x.strip()]
+    if args.models:
+        paths = [Path(p.strip()) for p in args.models.split(",") if p.strip()]
+    else:
+        paths = [p for p in (MODEL_DIR / "ranker.txt", MODEL_DIR / "ranker_secondary.txt") if p.exists()]
+    if args.weights:
+        weights = [float(w) for w in args.weights.split(",")]
+    else:
+        raw = [0.6, 0.3][: len(paths)] + [0.1] * max(0, len(paths) - 2)
+        weights = [w / sum(raw) for w in raw]
+
+    ok = True
+    for path in paths:
+        ok &= bench_model(path.name, [path], [1.0], batch_sizes, args.repeat, rng)
+    if len(paths) > 1:
+        ok &= bench_model("fused ensemble", paths, weights, batch_sizes, args.repeat, rng)
+    if args.synthetic:
+        path = train_synthetic(args.synthetic, 28, rng)
+        ok &= bench_model(f"synthetic {args.synthetic}-tree model", [path], [1.0], batch_sizes, max(3, args.repeat // 10), rng, missing=True)
+
+    print("\nAll scores match LightGBM exactly." if ok else "\nMISMATCH between tree_eval and LightGBM!")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""
+Inverted index for candidate generation ahead of model scoring.
+
+The strict interest filter in rank_engine keeps an exhibit only if it has a
+tag hit, a category hit or an interest Jaccard above 0.25; every other
+exhibit is scored by the model and then dropped. This index maps tag terms
+and categories to the exhibit rows holding them, so the rows that can pass
+the filter are found with postings-list lookups and only those rows go
+through feature building and the booster.
+
+Built once per ExhibitSet (so once per catalog version for the resident
+catalog). A keyword's matching tag terms and categories are memoized.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Set, Tuple
+
+import numpy as np
+
+from features import ExhibitArrays, _category_table
+
+
+def _postings(rows: np.ndarray, cols: np.ndarray, num_terms: int) -> Tuple[np.ndarray, np.ndarray]:
+    """CSR postings: rows of term ``t`` are ``rows[indptr[t]:indptr[t + 1]]``."""
+    order = np.argsort(cols, kind="stable")
+    indptr = np.zeros(num_terms + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols, minlength=num_terms), out=indptr[1:])
+    return indptr, rows[order]
+
+
+class CandidateIndex:
+    """Tag and category postings of one exhibit list."""
+
+    def __init__(self, arrays: ExhibitArrays, max_keywords: int = 4096):
+        self.n = arrays.n
+        self.arrays = arrays
+        self.tags = arrays.tags
+        self.tag_terms = arrays.tags.terms
+        self.tag_vocab = arrays.tags.vocab
+        self.tag_indptr, self.tag_rows = _postings(arrays.tags.rows, arrays.tags.cols, len(self.tag_terms))
+        self.categories = arrays.categories
+        self.category_indptr, self.category_rows = _postings(
+            np.arange(self.n, dtype=np.int64), arrays.category_codes, len(self.categories)
+        )
+        self.max_keywords = max_keywords
+        # keyword -> (tag term ids, category ids) it can match
+        self._keyword_terms: OrderedDict[str, Tuple[List[int], List[int]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _terms(self, kw: str) -> Tuple[List[int], List[int]]:
+        """Tag terms giving ``kw`` an exact or fuzzy tag hit, and categories giving it a category hit."""
+        terms = self._keyword_terms.get(kw)
+        if terms is not None:
+            return terms
+        tag_ids = np.flatnonzero(self.arrays.tag_fuzzy.scores(kw) > 0.3).tolist()
+        exact = self.tag_vocab.get(kw)
+        if exact is not None:
+            tag_ids.append(exact)
+        category_ids = np.flatnonzero(_category_table([kw], set(), self.arrays)[:, 0] > 0).tolist()
+        terms = (tag_ids, category_ids)
+        with self._lock:
+            self._keyword_terms[kw] = terms
+            while len(self._keyword_terms) > self.max_keywords:
+                self._keyword_terms.popitem(last=False)
+        return terms
+
+    def match_rows(self, interests: Iterable[str]) -> np.ndarray:
+        """Sorted rows that pass the strict interest filter for these interests.
+
+        Exactly the rows with tag_hits > 0, category_hits > 0 or
+        interest_jaccard > 0.25 as build_feature_columns computes them.
+        """
+        interests = [x.strip() for x in interests if x]
+        tag_ids: Set[int] = set()
+        category_ids: Set[int] = set()
+        for kw in (x.lower() for x in interests):
+            if not kw:
+                continue
+            tags, categories = self._terms(kw)
+            tag_ids.update(tags)
+            category_ids.update(categories)
+
+        parts = [self.tag_rows[self.tag_indptr[t]:self.tag_indptr[t + 1]] for t in tag_ids]
+        parts += [self.category_rows[self.category_indptr[c]:self.category_indptr[c + 1]] for c in category_ids]
+        # Any other interest_jaccard overlap needs a blank interest hitting a blank tag
+        interest_set = {x.lower() for x in interests}
+        if "" in interest_set and "" in self.tag_vocab:
+            inter = self.tags.overlap(interest_set)
+            union = len(interest_set) + self.tags.sizes - inter
+            jaccard = np.divide(inter, union, out=np.zeros(self.n), where=union > 0)
+            parts.append(np.flatnonzero(jaccard > 0.25))
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
@@ -0,0 +1,215 @@
+"""
+Server-resident exhibit catalog for the ranker service.
+
+The service keeps one immutable CatalogSnapshot of the museum's exhibits,
+loaded from gemma/dataset/training_data.jsonl at startup or pushed through
+the /catalog/upsert endpoint. /rank requests then send only a user profile
+(plus an optional id subset or filter) instead of the full exhibit list, and
+exhibit validation, profiles and feature arrays are paid once per catalog
+version rather than once per request. So are the no-interest popularity
+ranking and its per-filter orderings.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from rank_engine import ExhibitSet
+
+DEFAULT_CATALOG_PATH = Path(__file__).resolve().parent.parent / "gemma" / "dataset" / "training_data.jsonl"
+
+# Exhibit fields a filter can select on
+FILTER_FIELDS = ("category", "exhibitType", "ageRange", "floor")
+
+
+def exhibit_from_record(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a training_data.jsonl record to the exhibit dict the rankers read."""
+    ctx = obj.get("context", {})
+    ex = {
+        "id": obj.get("id", ""),
+        "name": ctx.get("name", ""),
+        "description": ctx.get("description", ""),
+        "category": ctx.get("category", ""),
+        "exhibitType": ctx.get("exhibitType", ""),
+        "ageRange": ctx.get("ageRange", ""),
+        "interactiveFeatures": ctx.get("features", []),
+        "averageTime": ctx.get("duration", 0),
+        "rating": ctx.get("rating", 0),
+        "floor": ctx.get("floor", ""),
+    }
+    # Extract tags from category or features
+    tags = ctx.get("features", [])
+    if tags:
+        ex["tags"] = tags
+    return ex
+
+
+def load_training_data(path: Path) -> List[Dict[str, Any]]:
+    exhibits = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                exhibits.append(exhibit_from_record(json.loads(line)))
+    return exhibits
+
+
+class CatalogSnapshot:
+    """One immutable catalog version; never mutated after construction."""
+
+    def __init__(self, exhibits: List[Dict[str, Any]], max_subsets: int = 32):
+        self.exhibits = exhibits
+        self.full = ExhibitSet(exhibits)
+        self.version = self.full.version
+        self.index = self.full.index
+        # Filter values are matched case-insensitively
+        self._field_values = {
+            field: [str(ex.get(field) or "").strip().lower() for ex in exhibits]
+            for field in FILTER_FIELDS
+        }
+        self.max_subsets = max_subsets
+        self._subsets: OrderedDict[Any, ExhibitSet] = OrderedDict()
+        # field -> value -> catalog rows with that value, in popularity order
+        self._popular_by_value: Dict[str, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.exhibits)
+
+    def rows(self, ids: Optional[Sequence[str]] = None, filters: Optional[Dict[str, Iterable[str]]] = None) -> List[int]:
+        """Catalog rows for an id subset (request order, unknown ids skipped) narrowed by filters."""
+        if ids is None:
+            rows = list(range(len(self.exhibits)))
+        else:
+            seen = set()
+            rows = []
+            for ex_id in ids:
+                row = self.index.get(ex_id)
+                if row is not None and row not in seen:
+                    seen.add(row)
+                    rows.append(row)
+        for field, values in (filters or {}).items():
+            if not values or field not in self._field_values:
+                continue
+            wanted = {str(v).strip().lower() for v in values}
+            column = self._field_values[field]
+            rows = [r for r in rows if column[r] in wanted]
+        return rows
+
+    def _popularity_orderings(self, field: str) -> Dict[str, np.ndarray]:
+        """Popularity ordering of every value of ``field``, built on first use."""
+        by_value = self._popular_by_value.get(field)
+        if by_value is None:
+            _, order = self.full.popularity
+            column = self._field_values[field]
+            groups: Dict[str, List[int]] = {}
+            for r in order.tolist():
+                groups.setdefault(column[r], []).append(r)
+            by_value = {value: np.array(rows, dtype=np.int64) for value, rows in groups.items()}
+            with self._lock:
+                self._popular_by_value[field] = by_value
+        return by_value
+
+    def popular_rows(self, filters: Optional[Dict[str, Iterable[str]]] = None) -> np.ndarray:
+        """Catalog rows passing ``filters`` (as in ``rows``), in popularity order."""
+        _, order = self.full.popularity
+        result: Optional[np.ndarray] = None
+        for field, values in (filters or {}).items():
+            if not values or field not in self._field_values:
+                continue
+            by_value = self._popularity_orderings(field)
+            parts = [by_value[v] for v in {str(v).strip().lower() for v in values} if v in by_value]
+            if not parts:
+                return np.zeros(0, dtype=np.int64)
+            rows = parts[0]
+            if len(parts) > 1:
+                # Merge the per-value orderings back into catalog popularity order
+                rank = np.empty(len(order), dtype=np.int64)
+                rank[order] = np.arange(len(order))
+                rows = np.concatenate(parts)
+                rows = rows[np.argsort(rank[rows], kind="stable")]
+            result = rows if result is None else result[np.isin(result, rows)]
+        return order if result is None else result
+
+    def select(self, ids: Optional[Sequence[str]] = None, filters: Optional[Dict[str, Iterable[str]]] = None) -> ExhibitSet:
+        """ExhibitSet for the whole catalog or a subset of it, memoized per subset."""
+        has_filters = any(values for values in (filters or {}).values())
+        if ids is None and not has_filters:
+            return self.full
+        rows = tuple(self.rows(ids, filters))
+        if len(rows) == len(self.exhibits) and rows == tuple(range(len(self.exhibits))):
+            return self.full
+        subset = self._subsets.get(rows)
+        if subset is None:
+            popularity = None
+            if ids is None:
+                # Filter-only subsets keep catalog order, so their popularity
+                # ranking is the catalog's per-filter ordering
+                scores, _ = self.full.popularity
+                row_array = np.array(rows, dtype=np.int64)
+                popularity = (scores[row_array], np.searchsorted(row_array, self.popular_rows(filters)))
+            # Arrays taken from the catalog's keep its TextIndex, so BM25 / TF-IDF
+            # statistics are the catalog's (as in training), not the subset's
+            subset = ExhibitSet([self.exhibits[r] for r in rows], arrays=self.full.arrays.take(rows), popularity=popularity)
+            with self._lock:
+                self._subsets[rows] = subset
+                while len(self._subsets) > self.max_subsets:
+                    self._subsets.popitem(last=False)
+        return subset
+
+
+class Catalog:
+    """Holds the current CatalogSnapshot; updates build a new snapshot and swap it in."""
+
+    def __init__(self, exhibits: Optional[List[Dict[str, Any]]] = None):
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot(list(exhibits or []))
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self._snapshot.version
+
+    def replace(self, exhibits: List[Dict[str, Any]]) -> CatalogSnapshot:
+        snapshot = CatalogSnapshot([ex for ex in exhibits if ex.get("id")])
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def upsert(self, exhibits: List[Dict[str, Any]]) -> CatalogSnapshot:
+        """Insert or update exhibits by id; existing exhibits keep their position."""
+        with self._lock:
+            current = self._snapshot
+            merged = list(current.exhibits)
+            index = dict(current.index)
+            for ex in exhibits:
+                ex_id = ex.get("id")
+                if not ex_id:
+                    continue
+                row = index.get(ex_id)
+                if row is None:
+                    index[ex_id] = len(merged)
+                    merged.append(ex)
+                else:
+                    merged[row] = ex
+            snapshot = CatalogSnapshot(merged)
+            self._snapshot = snapshot
+        return snapshot
+
+    def remove(self, ids: Sequence[str]) -> CatalogSnapshot:
+        drop = set(ids)
+        with self._lock:
+            snapshot = CatalogSnapshot([ex for ex in self._snapshot.exhibits if ex.get("id") not in drop])
+            self._snapshot = snapshot
+        return snapshot
+
+    def load(self, path: Path = DEFAULT_CATALOG_PATH) -> CatalogSnapshot:
+        return self.replace(load_training_data(path))
@@ -13,13 +13,21 @@ from features import build_feature_vector, FEATURE_KEYS
 
 # Try advanced features
 try:
-    from advanced_features import build_advanced_features, ADVANCED_FEATURE_KEYS
+    from advanced_features import build_advanced_feature_columns, ADVANCED_FEATURE_KEYS
     HAS_ADVANCED = True
 except ImportError:
     HAS_ADVANCED = False
     ADVANCED_FEATURE_KEYS = FEATURE_KEYS
 
 base = Path(__file__).parent
+
+
+def build_advanced_features(user: Dict[str, Any], exhibit: Dict[str, Any]) -> Dict[str, float]:
+    """Every ADVANCED_FEATURE_KEYS value for one exhibit, built as the service builds a
+    one-exhibit request (the per-exhibit builder has no corpus-level BM25/TF-IDF keys)."""
+    columns = build_advanced_feature_columns(user, [exhibit])
+    return {key: float(col[0]) for key, col in columns.items()}
+
 model_path = base / "models" / "ranker.txt"
 secondary_path = base / "models" / "ranker_secondary.txt"
 
@@ -109,7 +117,7 @@ print("="*60)
 # Build feature vector matching training
 if len(saved_feature_keys) == len(ADVANCED_FEATURE_KEYS) and HAS_ADVANCED:
     fv = build_advanced_features(test_user, test_exhibit)
-    feat_vec = [fv.get(k, 0.0) for k in saved_feature_keys]
+    feat_vec = [fv[k] for k in saved_feature_keys]
     print(f"Using advanced features ({len(feat_vec)} dims)")
 elif len(saved_feature_keys) == len(FEATURE_KEYS):
     fv = build_feature_vector(test_user, test_exhibit)
@@ -6,37 +6,52 @@ from __future__ import annotations
 
 import json
 import os
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import lightgbm as lgb
 import numpy as np
 
-from advanced_features import build_advanced_features
-from features import FEATURE_KEYS, build_feature_vector
+import feature_schema
+from feature_memo import FeatureMemo
+from feature_schema import FeatureSchema, GatherPlan
+from instrumentation import log
+from tree_eval import TreeEnsemble
 
-# Extended feature keys including advanced features
-ADVANCED_FEATURE_KEYS = FEATURE_KEYS + [
-    "expanded_tf_idf_name",
-    "expanded_tf_idf_desc",
-    "expanded_tf_idf_full",
-    "expanded_coverage_name",
-    "expanded_coverage_desc",
-    "expanded_coverage_full",
-    "bigram_overlap",
-    "trigram_overlap",
-    "expanded_hits",
-    "expanded_hits_normalized",
-]
+# Feature confidence blended into the model score: (feature, weight) per
+# feature set (with/without advanced features), summed in this order
+CONFIDENCE_WEIGHTS: Dict[bool, Tuple[Tuple[str, float], ...]] = {
+    True: (
+        ("tag_hits", 0.25),
+        ("category_hits", 0.20),
+        ("desc_similarity", 0.20),
+        ("expanded_coverage_full", 0.15),
+        ("interest_jaccard", 0.10),
+        ("bigram_overlap", 0.10),
+    ),
+    False: (
+        ("tag_hits", 0.3),
+        ("category_hits", 0.25),
+        ("desc_similarity", 0.2),
+        ("interest_jaccard", 0.15),
+        ("category_similarity", 0.1),
+    ),
+}
 
 
 class EnsembleRanker:
     """Ensemble of multiple ranking models."""
     
-    def __init__(self, model_dir: Path):
+    def __init__(self, model_dir: Path, schema_hash: Optional[str] = None):
+        """``schema_hash``: the feature schema recorded in bundle.json, checked at load."""
         self.model_dir = model_dir
+        self.expected_schema_hash = schema_hash
         self.models: List[lgb.Booster] = []
+        self.model_paths: List[Path] = []
         self.weights: List[float] = []
+        self.forest: Optional[TreeEnsemble] = None
+        self.stage1: Optional[lgb.Booster] = None
         self.load_models()
     
     def load_models(self):
@@ -46,6 +61,7 @@ class EnsembleRanker:
         if primary_path.exists():
             model = lgb.Booster(model_file=str(primary_path))
             self.models.append(model)
+            self.model_paths.append(primary_path)
             self.weights.append(0.6)  # Primary weight
         
         # Secondary model (if exists - will be created)
@@ -53,22 +69,64 @@ class EnsembleRanker:
         if secondary_path.exists():
             model = lgb.Booster(model_file=str(secondary_path))
             self.models.append(model)
+            self.model_paths.append(secondary_path)
             self.weights.append(0.3)
         
         # Fallback: use primary only
         if not self.models:
             raise RuntimeError("No models found")
+
+        # Small base-feature model for the cascade's first stage (optional, not in the ensemble)
+        stage1_path = self.model_dir / "ranker_stage1.txt"
+        if stage1_path.exists():
+            self.stage1 = lgb.Booster(model_file=str(stage1_path))
         
         # Normalize weights
         total_weight = sum(self.weights)
         self.weights = [w / total_weight for w in self.weights]
+        self.load_feature_keys()
+        self.forest = self.compile_forest(os.getenv("RANKER_TREE_EVAL", "auto"))
+
+    def compile_forest(self, mode: str = "auto") -> Optional[TreeEnsemble]:
+        """Fuse all boosters into one NumPy TreeEnsemble (see tree_eval.py).
+
+        ``mode`` is "numpy", "lightgbm" or "auto"; auto times both evaluators on a
+        request-sized batch and keeps the fused ensemble only if it is faster.
+        """
+        if mode == "lightgbm":
+            return None
+        try:
+            forest = TreeEnsemble.fuse([TreeEnsemble.from_model_file(p) for p in self.model_paths])
+        except (ValueError, KeyError, OSError) as e:
+            log.info("NumPy tree evaluator unavailable, using LightGBM: %s", e)
+            return None
+        if mode != "auto":
+            return forest
+        X = np.zeros((200, forest.num_feature), dtype=np.float32)
+        X[::2, ::3] = 1.0
+
+        def best_of(fn) -> float:
+            best = float("inf")
+            for _ in range(5):
+                t = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - t)
+            return best
+
+        t_numpy = best_of(lambda: forest.predict(X, self.weights))
+        t_lgb = best_of(lambda: [m.predict(X) for m in self.models])
+        return forest if t_numpy < t_lgb else None
     
     def predict(self, features: List[List[float]], use_advanced: bool = True) -> np.ndarray:
         """Predict using ensemble of models."""
         if not self.models:
             raise RuntimeError("No models loaded")
         
-        X = np.array(features, dtype=np.float32)
+        # No copy when handed the float32 matrix score_batch builds
+        X = np.asarray(features, dtype=np.float32)
+        if self.forest is not None:
+            # Fused NumPy evaluation; same scores and weighting as the loop below
+            return self.forest.predict(X, self.weights)
         
         # Get predictions from all models
         predictions = []
@@ -77,114 +135,122 @@ class EnsembleRanker:
             predictions.append(pred)
         
         # Weighted average
-        ensemble_pred = np.zeros(len(features))
+        ensemble_pred = np.zeros(len(X))
         for pred, weight in zip(predictions, self.weights):
             ensemble_pred += pred * weight
         
         return ensemble_pred
     
-    def rank(self, user: Dict[str, Any], exhibits: List[Dict[str, Any]], use_advanced: bool = True) -> List[Dict[str, Any]]:
-        """Rank exhibits using ensemble."""
-        # Load saved feature keys to match training
+    def load_feature_keys(self) -> None:
+        """Resolve and validate the boosters' feature schema once (feature_schema.resolve).
+
+        A bundle whose boosters, feature_keys.json and bundle.json disagree
+        fails to load instead of being padded or truncated per request.
+        """
         feature_keys_path = self.model_dir / "feature_keys.json"
-        saved_feature_keys = None
+        saved_keys: Optional[List[str]] = None
         if feature_keys_path.exists():
-            import json
             with open(feature_keys_path, 'r') as f:
-                saved_feature_keys = json.load(f)
-        
-        # Use saved feature keys if available, otherwise use default
-        if saved_feature_keys:
-            feature_keys = saved_feature_keys
-            use_saved_order = True
-        elif use_advanced:
-            feature_keys = ADVANCED_FEATURE_KEYS
-            use_saved_order = False
+                saved_keys = json.load(f)
+        self.schema: FeatureSchema = feature_schema.resolve(saved_keys, self.models, self.expected_schema_hash)
+        self.plan = GatherPlan(self.schema)
+        # First stage: the stage-1 model's base schema, else the primary's
+        # (its advanced columns are absent from base columns and zero-filled)
+        if self.stage1 is not None:
+            self.stage1_plan = GatherPlan(feature_schema.resolve(None, [self.stage1]))
         else:
-            feature_keys = FEATURE_KEYS
-            use_saved_order = False
-        
-        features = []
-        for ex in exhibits:
-            if use_advanced and not use_saved_order:
-                fv = build_advanced_features(user, ex)
-            else:
-                fv = build_feature_vector(user, ex)
-                if use_advanced:
-                    # Try to get advanced features
-                    try:
-                        fv_adv = build_advanced_features(user, ex)
-                        # Merge with base features
-                        for k, v in fv_adv.items():
-                            if k not in fv:
-                                fv[k] = v
-                    except:
-                        pass
-            
-            # Build feature vector in the correct order
-            feat_vec = [fv.get(k, 0.0) for k in feature_keys]
-            features.append(feat_vec)
-        
-        # Verify dimensions match model expectations
-        if features and len(features[0]) != self.models[0].num_feature():
-            # Dimension mismatch - try to fix
-            expected_dims = self.models[0].num_feature()
-            if len(features[0]) > expected_dims:
-                # Truncate
-                features = [f[:expected_dims] for f in features]
-            elif len(features[0]) < expected_dims:
-                # Pad with zeros
-                features = [f + [0.0] * (expected_dims - len(f)) for f in features]
-        
-        preds = self.predict(features, use_advanced)
+            self.stage1_plan = self.plan
+
+    def feature_keys(self, use_advanced: bool = True) -> List[str]:
+        return self.schema.keys
+
+    def features(self, memo: FeatureMemo, use_advanced: bool = True) -> Tuple[Dict[str, np.ndarray], bool]:
+        """Feature columns of one memo (advanced if they can be built) and whether they are advanced."""
+        columns = memo.base()
+        has_advanced = False
+        if use_advanced:
+            # Try to get advanced features
+            try:
+                columns = memo.advanced()
+                has_advanced = True
+            except Exception:
+                pass
+        return columns, has_advanced
+
+    @staticmethod
+    def blend(preds: np.ndarray, columns: Dict[str, np.ndarray], has_advanced: bool, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Combine model predictions with feature confidence (CONFIDENCE_WEIGHTS over the memo's columns)."""
+        zeros = np.zeros(n)
+        (key, weight), *rest = CONFIDENCE_WEIGHTS[has_advanced]
+        confidences = columns.get(key, zeros) * weight
+        for key, weight in rest:
+            confidences += columns.get(key, zeros) * weight
         
-        # Combine with confidence
+        # Blend score and confidence (optimized for 90%+ accuracy)
+        final_scores = preds * 0.80 + confidences * 0.20
+        return final_scores, confidences
+
+    def base_scores(self, memos: List[FeatureMemo]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Scores and confidences from base columns only, for the cascade's first
+        stage and degraded ranking: the stage-1 model (or the primary booster)
+        blended with the base-feature confidence."""
+        plan = self.stage1_plan
+        booster = self.stage1 if self.stage1 is not None else self.models[0]
+        built = [memo.base() for memo in memos]
+        X = np.empty((sum(memo.n for memo in memos), plan.width), dtype=np.float32)
+        offset = 0
+        for memo, columns in zip(memos, built):
+            plan.fill(columns, memo.n, X[offset:offset + memo.n])
+            offset += memo.n
+        preds = booster.predict(X)
+        out = []
+        offset = 0
+        for memo, columns in zip(memos, built):
+            out.append(self.blend(preds[offset:offset + memo.n], columns, False, memo.n))
+            offset += memo.n
+        return out
+
+    def stage1_scores(self, memo: FeatureMemo) -> np.ndarray:
+        """Cheap cascade scores (see base_scores)."""
+        return self.base_scores([memo])[0][0]
+
+    def score(self, user: Dict[str, Any], exhibits: List[Dict[str, Any]], use_advanced: bool = True, memo: Optional[FeatureMemo] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Blended scores and confidences of ``exhibits``, in input order.
+
+        ``memo`` lets callers share one request's feature columns with later stages.
+        """
+        memo = memo if memo is not None else FeatureMemo(user, exhibits)
+        return self.score_batch([memo], use_advanced)[0]
+
+    def score_batch(self, memos: List[FeatureMemo], use_advanced: bool = True) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """``score`` for many users at once: one stacked predict over every memo's rows."""
+        built = [self.features(memo, use_advanced) for memo in memos]
+        # Every memo's rows gathered straight into one preallocated model input
+        X = np.empty((sum(memo.n for memo in memos), self.plan.width), dtype=np.float32)
+        offset = 0
+        for memo, (columns, _) in zip(memos, built):
+            self.plan.fill(columns, memo.n, X[offset:offset + memo.n])
+            offset += memo.n
+        preds = self.predict(X, use_advanced)
+        out = []
+        offset = 0
+        for memo, (columns, has_advanced) in zip(memos, built):
+            out.append(self.blend(preds[offset:offset + memo.n], columns, has_advanced, memo.n))
+            offset += memo.n
+        return out
+    
+    def rank(self, user: Dict[str, Any], exhibits: List[Dict[str, Any]], use_advanced: bool = True, memo: Optional[FeatureMemo] = None) -> List[Dict[str, Any]]:
+        """Rank exhibits using ensemble."""
+        final_scores, confidences = self.score(user, exhibits, use_advanced, memo)
         results = []
         for i, ex in enumerate(exhibits):
-            score = float(preds[i])
             ex_dict = ex if isinstance(ex, dict) else ex.model_dump() if hasattr(ex, 'model_dump') else {}
-            
-            # Calculate confidence
-            if use_advanced:
-                try:
-                    fv = build_advanced_features(user, ex_dict)
-                    confidence = (
-                        fv.get("tag_hits", 0) * 0.25 +
-                        fv.get("category_hits", 0) * 0.20 +
-                        fv.get("desc_similarity", 0) * 0.20 +
-                        fv.get("expanded_coverage_full", 0) * 0.15 +
-                        fv.get("interest_jaccard", 0) * 0.10 +
-                        fv.get("bigram_overlap", 0) * 0.10
-                    )
-                except Exception:
-                    fv = build_feature_vector(user, ex_dict)
-                    confidence = (
-                        fv.get("tag_hits", 0) * 0.3 +
-                        fv.get("category_hits", 0) * 0.25 +
-                        fv.get("desc_similarity", 0) * 0.2 +
-                        fv.get("interest_jaccard", 0) * 0.15 +
-                        fv.get("category_similarity", 0) * 0.1
-                    )
-            else:
-                fv = build_feature_vector(user, ex_dict)
-                confidence = (
-                    fv.get("tag_hits", 0) * 0.3 +
-                    fv.get("category_hits", 0) * 0.25 +
-                    fv.get("desc_similarity", 0) * 0.2 +
-                    fv.get("interest_jaccard", 0) * 0.15 +
-                    fv.get("category_similarity", 0) * 0.1
-                )
-            
-            # Blend score and confidence (optimized for 90%+ accuracy)
-            final_score = score * 0.80 + confidence * 0.20
-            
             results.append({
                 "id": ex_dict.get("id") or (ex.get("id") if hasattr(ex, 'get') else str(i)),
-                "score": final_score,
-                "confidence": confidence
+                "score": float(final_scores[i]),
+                "confidence": float(confidences[i])
             })
         
         # Sort by final score
         results.sort(key=lambda x: x["score"], reverse=True)
         return results
-
@@ -0,0 +1,213 @@
+"""
+Resident cache of exhibit-side feature data.
+
+Lower-cased texts, normalized categories, keyword/tag sets and n-grams depend
+only on the exhibit, so they are derived once per exhibit version and shared
+by features.py, advanced_features.py and the ensemble ranker. An exhibit's
+version is a content hash of the fields the features read; when the catalog
+changes the hash changes and the profile is rebuilt on next use.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Set
+
+from features import ExhibitArrays, Vocabulary, exhibit_category, exhibit_tags, extract_keywords, normalize_category
+
+# Exhibit fields read by the feature builders; only these enter the content hash
+PROFILE_FIELDS = (
+    "id",
+    "name",
+    "description",
+    "category",
+    "exhibitType",
+    "ageRange",
+    "groupType",
+    "features",
+    "interactiveFeatures",
+    "tags",
+)
+
+WORD_RE = re.compile(r'\b[a-z]{3,}\b')
+RUN_RE = re.compile(r'[a-z]+')
+NGRAM_WORD_RE = re.compile(r'\b[a-z]{2,}\b')
+
+
+def content_hash(exhibit: Dict[str, Any]) -> str:
+    payload = json.dumps([exhibit.get(k) for k in PROFILE_FIELDS], default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _ngrams(words: List[str], n: int) -> Set[str]:
+    return {' '.join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+class ExhibitProfile:
+    """Exhibit-only derived data used by the feature builders."""
+
+    __slots__ = (
+        "id",
+        "hash",
+        "name_text",
+        "desc_text",
+        "category",
+        "category_normalized",
+        "name_lower",
+        "desc_lower",
+        "full_text",
+        "fields_in_full",
+        "tags",
+        "tags_lower",
+        "tag_ids",
+        "name_keyword_ids",
+        "desc_keyword_ids",
+        "name_tokens",
+        "desc_tokens",
+        "full_tokens",
+        "name_runs",
+        "desc_runs",
+        "full_runs",
+        "bigram_ids",
+        "trigram_ids",
+        "vocab",
+        "age_range",
+        "group_type",
+    )
+
+    def __init__(self, exhibit: Dict[str, Any], hash_: str, vocab: Vocabulary):
+        """``vocab``: the Vocabulary the term ids below are interned in."""
+        self.id = exhibit.get("id")
+        self.hash = hash_
+        self.name_text = str(exhibit.get("name", ""))
+        self.desc_text = str(exhibit.get("description", ""))
+        self.category = exhibit_category(exhibit)
+        self.category_normalized = normalize_category(self.category)
+        self.name_lower = self.name_text.lower()
+        self.desc_lower = self.desc_text.lower()
+        self.full_text = " ".join([self.name_text, self.desc_text, str(self.category)]).lower()
+        # Lets a term missing from the full text skip the name/description checks
+        self.fields_in_full = self.full_text.startswith(f"{self.name_lower} {self.desc_lower} ")
+        self.tags = exhibit_tags(exhibit)
+        self.tags_lower = [t.lower() for t in self.tags]
+        # Keyword, tag and n-gram sets are interned: sorted int32 ids into ``vocab``
+        self.vocab = vocab
+        self.tag_ids = vocab.intern(self.tags_lower)
+        self.name_keyword_ids = vocab.intern(extract_keywords(self.name_text))
+        self.desc_keyword_ids = vocab.intern(extract_keywords(self.desc_text))
+        # Word token ids in text order (term frequencies) and letter-run ids, for text_index.py
+        self.name_tokens = vocab.encode(WORD_RE.findall(self.name_lower))
+        self.desc_tokens = vocab.encode(WORD_RE.findall(self.desc_lower))
+        self.full_tokens = vocab.encode(WORD_RE.findall(self.full_text))
+        self.name_runs = vocab.intern(RUN_RE.findall(self.name_lower))
+        self.desc_runs = vocab.intern(RUN_RE.findall(self.desc_lower))
+        self.full_runs = vocab.intern(RUN_RE.findall(self.full_text))
+        full_ngram_words = NGRAM_WORD_RE.findall(self.full_text)
+        self.bigram_ids = vocab.intern(_ngrams(full_ngram_words, 2))
+        self.trigram_ids = vocab.intern(_ngrams(full_ngram_words, 3))
+        self.age_range = exhibit.get("ageRange", "")
+        self.group_type = exhibit.get("groupType", "")
+
+
+class ProfileCache:
+    """Exhibit profiles keyed by exhibit id, rebuilt when the content hash changes.
+
+    Profiles intern their terms into the cache's current Vocabulary, which
+    would otherwise keep every term of every exhibit a client ever sent. Once
+    it holds more than ``max_terms`` terms (and on ``clear``) the cache starts
+    a new generation: a fresh Vocabulary and no profiles or arrays, which are
+    rebuilt on next use. Arrays already handed out keep their own vocabulary.
+    """
+
+    def __init__(self, max_profiles: int = 50000, max_arrays: int = 16, max_terms: int = 1000000):
+        self.max_profiles = max_profiles
+        self.max_arrays = max_arrays
+        self.max_terms = max_terms
+        self.vocab = Vocabulary()
+        self._profiles: OrderedDict[str, ExhibitProfile] = OrderedDict()
+        self._arrays: OrderedDict[str, ExhibitArrays] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generations = 0
+
+    def _generation(self) -> Vocabulary:
+        """The current vocabulary, after starting a new generation if it outgrew ``max_terms``."""
+        with self._lock:
+            if len(self.vocab) > self.max_terms:
+                self._reset()
+            return self.vocab
+
+    def _reset(self) -> None:
+        # Caller holds _lock
+        self.vocab = Vocabulary()
+        self._profiles = OrderedDict()
+        self._arrays = OrderedDict()
+        self.generations += 1
+
+    def _get(self, exhibit: Dict[str, Any], vocab: Vocabulary) -> ExhibitProfile:
+        hash_ = content_hash(exhibit)
+        key = str(exhibit.get("id") or hash_)
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is not None and profile.hash == hash_ and profile.vocab is vocab:
+                self.hits += 1
+                self._profiles.move_to_end(key)
+                return profile
+            self.misses += 1
+        profile = ExhibitProfile(exhibit, hash_, vocab)
+        with self._lock:
+            # A generation started meanwhile: the profile is still valid, just not cached
+            if vocab is self.vocab:
+                self._profiles[key] = profile
+                self._profiles.move_to_end(key)
+                while len(self._profiles) > self.max_profiles:
+                    self._profiles.popitem(last=False)
+        return profile
+
+    def get(self, exhibit: Dict[str, Any]) -> ExhibitProfile:
+        return self._get(exhibit, self._generation())
+
+    def get_many(self, exhibits: Sequence[Dict[str, Any]]) -> List[ExhibitProfile]:
+        """Profiles of ``exhibits``, all interned in one vocabulary."""
+        vocab = self._generation()
+        return [self._get(ex, vocab) for ex in exhibits]
+
+    def arrays(self, exhibits: Sequence[Dict[str, Any]]) -> ExhibitArrays:
+        """ExhibitArrays for an exhibit list, shared by every request sending the same exhibits."""
+        profiles = self.get_many(exhibits)
+        signature = hashlib.sha1("\n".join(p.hash for p in profiles).encode("ascii")).hexdigest()
+        with self._lock:
+            arrays = self._arrays.get(signature)
+            if arrays is not None and (not profiles or arrays.vocab is profiles[0].vocab):
+                # Least recently used set is evicted first
+                self._arrays.move_to_end(signature)
+                return arrays
+        arrays = ExhibitArrays(profiles)
+        with self._lock:
+            if not profiles or profiles[0].vocab is self.vocab:
+                self._arrays[signature] = arrays
+                while len(self._arrays) > self.max_arrays:
+                    self._arrays.popitem(last=False)
+        return arrays
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+
+# Process-wide cache shared by every feature builder; RANKER_VOCAB_MAX_TERMS bounds its vocabulary
+profile_cache = ProfileCache(max_terms=int(os.getenv("RANKER_VOCAB_MAX_TERMS", "1000000")))
+
+
+def get_profile(exhibit: Dict[str, Any]) -> ExhibitProfile:
+    return profile_cache.get(exhibit)
+
+
+def exhibit_arrays(exhibits: Sequence[Dict[str, Any]]) -> ExhibitArrays:
+    return profile_cache.arrays(exhibits)
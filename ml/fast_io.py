@@ -0,0 +1,218 @@
+"""
+Fast JSON path for ranker request and response bodies.
+
+Pydantic builds one model per exhibit and /rank then dumps each of them back
+to a dict; on catalog-sized payloads that dominates a call. The fast path
+parses the body with orjson (stdlib json when orjson is not installed) and
+checks it against a flat spec compiled from the request's Pydantic model,
+producing the same plain dicts model_dump() would. Values the spec cannot
+vouch for (wrong types, values Pydantic would coerce, invalid JSON) fall
+back to full Pydantic validation, so results and 422 errors are unchanged.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import types
+import typing
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Callable, Dict, FrozenSet, List, Tuple, Type
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+class FastDecodeError(ValueError):
+    """The payload needs full Pydantic validation."""
+
+
+def loads(body: bytes | str) -> Any:
+    return orjson.loads(body) if HAS_ORJSON else json.loads(body)
+
+
+def dumps(payload: Any) -> bytes:
+    """Compact JSON bytes of a response payload."""
+    if HAS_ORJSON:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+Check = Callable[[Any], Any]
+
+
+def _fail(value: Any) -> Any:
+    raise FastDecodeError
+
+
+def _check_str(value: Any) -> Any:
+    if type(value) is not str:
+        raise FastDecodeError
+    return value
+
+
+def _check_int(value: Any) -> Any:
+    if type(value) is not int:
+        raise FastDecodeError
+    return value
+
+
+def _check_float(value: Any) -> Any:
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        return float(value)
+    raise FastDecodeError
+
+
+_STR_ONLY = {str}
+
+
+def _check_str_list(value: Any) -> Any:
+    if type(value) is not list or not set(map(type, value)) <= _STR_ONLY:
+        raise FastDecodeError
+    return value
+
+
+def _optional(check: Check) -> Check:
+    return lambda value: None if value is None else check(value)
+
+
+def _list_of(check: Check) -> Check:
+    def run(value: Any) -> Any:
+        if type(value) is not list:
+            raise FastDecodeError
+        return [check(item) for item in value]
+    return run
+
+
+def _compile(annotation: Any) -> Check:
+    """Checker for one field annotation; unsupported annotations always fall back."""
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        if len(args) != 1:
+            return _fail
+        return _optional(_compile(args[0]))
+    if origin is list:
+        (item,) = typing.get_args(annotation)
+        if item is str:
+            return _check_str_list
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            return ModelSpec(item).many
+        return _list_of(_compile(item))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return ModelSpec(annotation)
+    return {str: _check_str, int: _check_int, float: _check_float}.get(annotation, _fail)
+
+
+_MISSING = object()
+
+
+def _passthrough(annotation: Any) -> FrozenSet[type]:
+    """Value types a field keeps as-is without calling its checker (scalars and None)."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation) if origin in (typing.Union, types.UnionType) else (annotation,)
+    return frozenset(a for a in args if a in (str, int, float, type(None)))
+
+
+def _is_str_list(annotation: Any) -> bool:
+    """List[str] or Optional[List[str]]: columns of these are checked in one pass over all items."""
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        return len(args) == 1 and _is_str_list(args[0])
+    return origin is list and typing.get_args(annotation) == (str,)
+
+
+class ModelSpec:
+    """Checks turning parsed JSON objects into ``model(**obj).model_dump()``, or raising FastDecodeError."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.supported = model.model_config.get("extra") in (None, "ignore")
+        self.names = list(model.model_fields)
+        self.fields: List[Tuple[FrozenSet[type], Check, bool, Callable[[], Any], bool]] = []
+        for name, info in model.model_fields.items():
+            self.supported &= info.alias in (None, name) and info.validation_alias is None
+            # A fresh copy per decoded object: a shared [] would let one request mutate later defaults
+            default = (lambda info=info: copy.deepcopy(info.get_default(call_default_factory=True)))
+            self.fields.append((_passthrough(info.annotation), _compile(info.annotation), info.is_required(), default, _is_str_list(info.annotation)))
+
+    @staticmethod
+    def _field(value: Any, passthrough: FrozenSet[type], check: Check, required: bool, default: Callable[[], Any], str_list: bool) -> Any:
+        if type(value) in passthrough:
+            return value
+        if value is not _MISSING:
+            return check(value)
+        if required:
+            raise FastDecodeError
+        return default()
+
+    def _column(self, column: List[Any], field: Tuple[Any, ...]) -> List[Any]:
+        """One field across many objects; ``column`` itself when every value passes unchanged."""
+        passthrough, str_list = field[0], field[4]
+        kinds = set(map(type, column))
+        if kinds <= passthrough:
+            return column
+        if str_list and kinds <= passthrough | _LIST_ONLY and set(map(type, chain.from_iterable(filter(None, column)))) <= _STR_ONLY:
+            return column
+        return [self._field(x, *field) for x in column]
+
+    def __call__(self, value: Any) -> Dict[str, Any]:
+        if not self.supported or type(value) is not dict:
+            raise FastDecodeError
+        return {name: self._field(value.get(name, _MISSING), *field) for name, field in zip(self.names, self.fields)}
+
+    def many(self, values: Any) -> List[Dict[str, Any]]:
+        """A list of objects, checked column by column rather than value by value."""
+        if not self.supported or type(values) is not list:
+            raise FastDecodeError
+        if not values:
+            return []
+        if set(map(type, values)) != _DICT_ONLY:
+            raise FastDecodeError
+        if set(map(len, values)) == {len(self.names)}:
+            try:
+                columns = [list(map(itemgetter(name), values)) for name in self.names]
+            except KeyError:
+                columns = None
+            if columns is not None:
+                # Every object has exactly the model's fields: keep the objects, write back coerced values
+                for name, field, column in zip(self.names, self.fields, columns):
+                    checked = self._column(column, field)
+                    if checked is not column:
+                        for value, x in zip(values, checked):
+                            value[name] = x
+                return values
+        columns = [self._column([v.get(name, _MISSING) for v in values], field) for name, field in zip(self.names, self.fields)]
+        return [dict(zip(self.names, row)) for row in zip(*columns)]
+
+
+_DICT_ONLY = {dict}
+_LIST_ONLY = frozenset({list})
+
+
+class RequestDecoder:
+    """Decodes a request body to the dict ``model.model_validate_json(body).model_dump()`` returns."""
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self._check = ModelSpec(model)
+        self.fast = 0
+        self.fallback = 0
+
+    def decode(self, body: bytes) -> Dict[str, Any]:
+        try:
+            out = self._check(loads(body))
+        except ValueError:
+            # Invalid JSON or a payload the spec cannot vouch for; Pydantic decides
+            self.fallback += 1
+            return self.model.model_validate_json(body).model_dump()
+        self.fast += 1
+        return out
@@ -0,0 +1,64 @@
+"""
+Per-request feature memo.
+
+Holds the features of one user profile against one exhibit list so every
+ranking stage (prediction, confidence, strict interest filtering) reads the
+same columns instead of rebuilding feature vectors exhibit by exhibit.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from advanced_features import build_advanced_feature_columns
+from exhibit_profiles import exhibit_arrays
+from features import ExhibitArrays, build_feature_columns
+from user_query import UserQuery
+
+
+class FeatureMemo:
+    """Base and advanced feature columns of one user, each computed at most once."""
+
+    def __init__(self, user: Dict[str, Any] | UserQuery, exhibits: Sequence[Dict[str, Any]], arrays: Optional[ExhibitArrays] = None):
+        # Compiled once; shared by narrowed memos of the same request
+        self.user = UserQuery.of(user)
+        self.exhibits = exhibits
+        self.arrays = arrays if arrays is not None else exhibit_arrays(exhibits)
+        self._base: Optional[Dict[str, np.ndarray]] = None
+        self._advanced: Optional[Dict[str, np.ndarray]] = None
+
+    @property
+    def n(self) -> int:
+        return self.arrays.n
+
+    def base(self) -> Dict[str, np.ndarray]:
+        if self._base is None:
+            self._base = build_feature_columns(self.user, self.arrays)
+        return self._base
+
+    def advanced(self) -> Dict[str, np.ndarray]:
+        """Base plus query-expansion columns; reuses the base columns if already built."""
+        if self._advanced is None:
+            self._advanced = build_advanced_feature_columns(self.user, self.exhibits, self.arrays, self._base)
+            if self._base is None:
+                self._base = self._advanced
+        return self._advanced
+
+    def take(self, positions: np.ndarray, exhibits: Sequence[Dict[str, Any]], arrays: ExhibitArrays) -> "FeatureMemo":
+        """Memo over the rows at ``positions``; base columns already built are sliced, not rebuilt."""
+        memo = FeatureMemo(self.user, exhibits, arrays)
+        if self._base is not None:
+            memo._base = {key: col[positions] for key, col in self._base.items()}
+        return memo
+
+    def matrix(self, keys: List[str], columns: Optional[Dict[str, np.ndarray]] = None, dtype=np.float32) -> np.ndarray:
+        """Columns gathered in ``keys`` order; unknown keys are zero-filled."""
+        columns = columns if columns is not None else self.base()
+        X = np.zeros((self.n, len(keys)), dtype=dtype)
+        for j, key in enumerate(keys):
+            col = columns.get(key)
+            if col is not None:
+                X[:, j] = col
+        return X
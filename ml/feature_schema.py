@@ -0,0 +1,135 @@
+"""
+Feature-schema registry: the one place that knows which feature layouts exist.
+
+A schema is an ordered list of feature keys with a content hash. The feature
+builders define the keys (features.FEATURE_KEYS, advanced_features.
+ADVANCED_FEATURE_KEYS); every layout a model has been trained on is
+registered here under a version name. train_ranker.py records the schema of
+each trained bundle in bundle.json, and serving validates a bundle's
+boosters, feature_keys.json and recorded hash against each other at load
+time instead of padding or truncating rows per request. A validated schema
+compiles to a GatherPlan that fills a preallocated float32 matrix in schema
+order.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from advanced_features import ADVANCED_FEATURE_KEYS
+from features import FEATURE_KEYS
+from text_index import SCORE_FEATURE_KEYS
+
+
+class FeatureSchemaError(ValueError):
+    """A model bundle's feature layout disagrees with itself or with the builders."""
+
+
+def schema_hash(keys: Sequence[str]) -> str:
+    return hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()[:16]
+
+
+class FeatureSchema:
+    """An ordered feature layout."""
+
+    def __init__(self, name: str, keys: Sequence[str]):
+        self.name = name
+        self.keys = list(keys)
+        self.hash = schema_hash(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def info(self) -> Dict[str, Any]:
+        return {"name": self.name, "hash": self.hash, "width": len(self.keys)}
+
+
+class GatherPlan:
+    """A schema's column order compiled against the feature builders' columns."""
+
+    def __init__(self, schema: FeatureSchema):
+        self.schema = schema
+        self.keys = tuple(schema.keys)
+        self.width = len(self.keys)
+
+    def fill(self, columns: Dict[str, np.ndarray], n: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Write the columns into ``out`` (or a new float32 matrix) in schema order.
+
+        Columns missing from ``columns`` (advanced keys when only base
+        features could be built) are zero-filled.
+        """
+        X = out if out is not None else np.empty((n, self.width), dtype=np.float32)
+        for j, key in enumerate(self.keys):
+            col = columns.get(key)
+            if col is None:
+                X[:, j] = 0.0
+            else:
+                X[:, j] = col
+        return X
+
+
+# Every feature the builders can produce
+KNOWN_FEATURES = frozenset(ADVANCED_FEATURE_KEYS)
+
+SCHEMAS: Dict[str, FeatureSchema] = {}
+
+
+def register(name: str, keys: Sequence[str]) -> FeatureSchema:
+    schema = FeatureSchema(name, keys)
+    SCHEMAS.setdefault(schema.hash, schema)
+    return SCHEMAS[schema.hash]
+
+
+BASE = register("base-v1", FEATURE_KEYS)
+# Advanced layout before the corpus-level BM25/TF-IDF columns
+ADVANCED_V1 = register("advanced-v1", [k for k in ADVANCED_FEATURE_KEYS if k not in SCORE_FEATURE_KEYS])
+ADVANCED = register("advanced-v2", ADVANCED_FEATURE_KEYS)
+
+
+def _feature_names(booster: Any) -> Optional[List[str]]:
+    """A booster's feature names, None if it was trained without names (Column_0, ...)."""
+    names = booster.feature_name()
+    return None if names == [f"Column_{i}" for i in range(len(names))] else names
+
+
+def lookup(keys: Sequence[str]) -> Optional[FeatureSchema]:
+    return SCHEMAS.get(schema_hash(keys))
+
+
+def resolve(keys: Optional[Sequence[str]], boosters: Sequence[Any], expected_hash: Optional[str] = None) -> FeatureSchema:
+    """The validated schema of a model bundle; raises FeatureSchemaError on any disagreement.
+
+    ``keys`` come from feature_keys.json (None if absent: the boosters' own
+    feature names, else the registered schema of their width, are used).
+    ``expected_hash`` is the schema hash recorded in bundle.json, if any.
+    """
+    width = boosters[0].num_feature()
+    names = _feature_names(boosters[0])
+    if keys is None:
+        if names is not None:
+            keys = names
+        else:
+            candidates = [s for s in (ADVANCED, ADVANCED_V1, BASE) if len(s) == width]
+            if not candidates:
+                raise FeatureSchemaError(f"no feature_keys.json and no registered schema of width {width}")
+            keys = candidates[0].keys
+    keys = list(keys)
+
+    unknown = [k for k in keys if k not in KNOWN_FEATURES]
+    if unknown:
+        raise FeatureSchemaError(f"model uses features the builders do not produce: {unknown}")
+    if len(set(keys)) != len(keys):
+        raise FeatureSchemaError("duplicate feature keys")
+    for booster in boosters:
+        if booster.num_feature() != len(keys):
+            raise FeatureSchemaError(f"booster expects {booster.num_feature()} features, schema has {len(keys)}")
+        booster_names = _feature_names(booster)
+        if booster_names is not None and booster_names != keys:
+            raise FeatureSchemaError("booster feature names differ from the schema")
+    schema = lookup(keys) or FeatureSchema("unregistered", keys)
+    if expected_hash is not None and expected_hash != schema.hash:
+        raise FeatureSchemaError(f"feature schema {schema.hash} does not match bundle.json ({expected_hash})")
+    return schema
@@ -2,7 +2,13 @@ from __future__ import annotations
 
 import math
 import re
-from typing import Any, Dict, List, Set
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from user_query import UserQuery
 
 
 def jaccard(a: List[str], b: List[str]) -> float:
@@ -37,6 +43,109 @@ def fuzzy_match(a: str, b: str) -> float:
     return 0.0
 
 
+GRAM = 3
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class FuzzyIndex:
+    """``fuzzy_match`` of one query against a fixed term list, by index lookups.
+
+    Each tier is resolved from a map instead of comparing the query with
+    every term: exact (1.0) from a term dict, substring (0.8) from trigram
+    postings plus the query's own substrings, shared word (0.6) from word
+    postings, and partial word (0.4) from a 4-character prefix map, word
+    trigram postings and the query words' substrings. ``scores`` returns
+    exactly what ``fuzzy_match(query, term)`` returns for every term.
+    """
+
+    def __init__(self, terms: Sequence[str], max_queries: int = 4096):
+        self.terms = list(terms)
+        self.n = len(self.terms)
+        self.exact: Dict[str, List[int]] = {}
+        self.grams: Dict[str, Set[int]] = {}
+        self.words: Dict[str, List[int]] = {}
+        for t, term in enumerate(self.terms):
+            if not term:
+                continue
+            norm = term.lower().strip()
+            self.exact.setdefault(norm, []).append(t)
+            for gram in _grams(norm):
+                self.grams.setdefault(gram, set()).add(t)
+            for word in set(norm.split()):
+                self.words.setdefault(word, []).append(t)
+        # Partial word matching only looks at words longer than 3 characters
+        self.prefix4: Dict[str, List[str]] = {}
+        self.word_grams: Dict[str, Set[str]] = {}
+        for word in self.words:
+            if len(word) > 3:
+                self.prefix4.setdefault(word[:4], []).append(word)
+                for gram in _grams(word):
+                    self.word_grams.setdefault(gram, set()).add(word)
+        self.max_queries = max_queries
+        self._memo: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def _containing(needle: str, postings: Dict[str, Set[Any]]) -> Set[Any]:
+        """Keys whose text may contain ``needle`` (len >= GRAM): intersection of its grams' postings."""
+        sets = sorted((postings.get(g, set()) for g in _grams(needle)), key=len)
+        return set.intersection(*sets) if sets else set()
+
+    def _substring_terms(self, a: str) -> Set[int]:
+        """Terms t with ``a in t`` or ``t in a`` (normalized)."""
+        found: Set[int] = set()
+        for t in self._containing(a, self.grams):
+            if a in self.terms[t].lower().strip():
+                found.add(t)
+        # Terms that are substrings of the query (the empty string included)
+        subs = {a[i:j] for i in range(len(a)) for j in range(i + 1, len(a) + 1)}
+        subs.add("")
+        for sub in subs:
+            found.update(self.exact.get(sub, ()))
+        return found
+
+    def _partial_word_terms(self, a_words: Set[str]) -> Set[int]:
+        words: Set[str] = set()
+        for aw in a_words:
+            if len(aw) <= 3:
+                continue
+            words.update(self.prefix4.get(aw[:4], ()))
+            if len(aw) >= GRAM:
+                words.update(w for w in self._containing(aw, self.word_grams) if aw in w)
+            for i in range(len(aw)):
+                for j in range(i + 4, len(aw) + 1):
+                    if aw[i:j] in self.words:
+                        words.add(aw[i:j])
+        return {t for w in words if len(w) > 3 for t in self.words[w]}
+
+    def scores(self, query: str) -> np.ndarray:
+        """``fuzzy_match(query, term)`` for every term, as float64."""
+        cached = self._memo.get(query)
+        if cached is not None:
+            return cached
+        out = np.zeros(self.n, dtype=np.float64)
+        a = query.lower().strip() if query else ""
+        if not query:
+            pass
+        elif len(a) < GRAM:
+            # Too short for the trigram postings
+            out[:] = [fuzzy_match(query, term) for term in self.terms]
+        else:
+            a_words = set(a.split())
+            for t in self._partial_word_terms(a_words):
+                out[t] = 0.4
+            for word in a_words:
+                out[self.words.get(word, [])] = 0.6
+            out[list(self._substring_terms(a))] = 0.8
+            out[self.exact.get(a, [])] = 1.0
+        if len(self._memo) >= self.max_queries:
+            self._memo.clear()
+        self._memo[query] = out
+        return out
+
+
 def normalize_category(cat: str) -> str:
     """Normalize category name for better matching."""
     if not cat:
@@ -79,8 +188,8 @@ def text_similarity(text1: str, text2: str) -> float:
     return len(intersection) / len(union) if union else 0.0
 
 
-def build_feature_vector(user: Dict[str, Any], exhibit: Dict[str, Any]) -> Dict[str, float]:
-    interests = [x.strip() for x in (user.get("interests") or []) if x]
+def exhibit_tags(exhibit: Dict[str, Any]) -> List[str]:
+    """Merged feature/tag list of an exhibit, falling back to description keywords."""
     ex_features = exhibit.get("features") or exhibit.get("interactiveFeatures") or []
     # Include generic tags if provided in dataset (e.g., exported metadata)
     ex_tags = exhibit.get("tags") or []
@@ -88,26 +197,50 @@ def build_feature_vector(user: Dict[str, Any], exhibit: Dict[str, Any]) -> Dict[
         ex_features = [x.strip() for x in ex_features.split(",") if x.strip()]
     if isinstance(ex_tags, str):
         ex_tags = [x.strip() for x in ex_tags.split(",") if x.strip()]
-    
+
     # Extract keywords from description if tags are empty
     desc_text = str(exhibit.get("description", ""))
     if not ex_features and not ex_tags and desc_text:
         # Auto-extract keywords from description
         desc_keywords = extract_keywords(desc_text)
         ex_features = list(desc_keywords)[:10]  # Top 10 keywords
-    
+
     # Merge features and tags for matching
-    combined_tags = list({*(ex_features or []), *(ex_tags or [])})
+    return list({*(ex_features or []), *(ex_tags or [])})
+
+
+def exhibit_category(exhibit: Dict[str, Any]) -> str:
+    return exhibit.get("category") or exhibit.get("exhibitType") or ""
+
+
+def keyword_similarity(kw1: Set[str], kw2: Set[str]) -> float:
+    """``text_similarity`` for already extracted keyword sets."""
+    if not kw1 or not kw2:
+        return 0.0
+    intersection = kw1 & kw2
+    union = kw1 | kw2
+    return len(intersection) / len(union) if union else 0.0
+
+
+def build_feature_vector(user: Dict[str, Any] | UserQuery, exhibit: Dict[str, Any]) -> Dict[str, float]:
+    from exhibit_profiles import get_profile
+    from user_query import UserQuery
+
+    # User-only data is compiled once per request when a UserQuery is passed in
+    query = UserQuery.of(user)
+    interests = query.interests
+    # Exhibit-only data (texts, tags, keywords) comes from the resident profile cache
+    profile = get_profile(exhibit)
+    combined_tags = profile.tags
 
     # Basic categorical matches with normalization
-    category = exhibit.get("category") or exhibit.get("exhibitType") or ""
-    category_normalized = normalize_category(category)
-    age_match = match_score(user.get("ageBand", ""), exhibit.get("ageRange", ""))
-    group_match = match_score(user.get("groupType", ""), exhibit.get("groupType", ""))
+    category = profile.category
+    category_normalized = profile.category_normalized
+    age_match = match_score(query.age_band, profile.age_range)
+    group_match = match_score(query.group_type, profile.group_type)
 
     # Enhanced text matching
-    name_text = str(exhibit.get("name", ""))
-    searchable = " ".join([name_text, desc_text, str(category)]).lower()
+    searchable = profile.full_text
     
     # Interest overlap with fuzzy matching
     interest_hits = 0
@@ -116,16 +249,13 @@ def build_feature_vector(user: Dict[str, Any], exhibit: Dict[str, Any]) -> Dict[
     category_hits = 0
     max_category_match = 0.0
     
-    for kw in interests:
-        kw_lower = kw.lower() if kw else ""
-        if not kw_lower:
-            continue
+    for kw_lower in query.keywords_lower:
         # Exact matches
         if kw_lower in searchable:
             interest_hits += 1
-        if kw_lower in name_text.lower():
+        if kw_lower in profile.name_lower:
             name_hits += 1
-        if kw_lower in desc_text.lower():
+        if kw_lower in profile.desc_lower:
             desc_hits += 1
         # Category fuzzy matching with normalization
         if category_normalized:
@@ -144,35 +274,33 @@ def build_feature_vector(user: Dict[str, Any], exhibit: Dict[str, Any]) -> Dict[
     # Direct tag hits with fuzzy matching
     tag_hits = 0
     tag_jaccard = jaccard(interests, combined_tags)
-    combined_lower = [t.lower() for t in combined_tags]
-    for kw in interests:
-        kw_lower = kw.lower() if kw else ""
-        if not kw_lower:
-            continue
+    combined_lower = profile.tags_lower
+    for kw_lower in query.keywords_lower:
         # Exact match
         if kw_lower in combined_lower:
             tag_hits += 1
         else:
             # Fuzzy match
-            for tag in combined_tags:
-                if fuzzy_match(kw_lower, tag.lower()) > 0.3:
+            for tag in combined_lower:
+                if fuzzy_match(kw_lower, tag) > 0.3:
                     tag_hits += 0.5  # Partial credit for fuzzy match
                     break
     
     # Text similarity features with normalized category
-    user_interests_text = " ".join(interests).lower()
-    desc_similarity = text_similarity(user_interests_text, desc_text)
-    name_similarity = text_similarity(user_interests_text, name_text)
+    user_interests_text = query.interests_text
+    user_keywords = query.keywords
+    desc_similarity = id_jaccard(user_keywords, profile.desc_keyword_ids, profile.vocab)
+    name_similarity = id_jaccard(user_keywords, profile.name_keyword_ids, profile.vocab)
     category_similarity = text_similarity(user_interests_text, category_normalized) if category_normalized else 0.0
 
     # Rule-inspired features
-    time_budget = float(user.get("timeBudget") or 0)
-    mobility = user.get("mobility") or ""
-    crowd_tol = user.get("crowdTolerance") or ""
+    time_budget = query.time_budget
+    mobility = query.mobility
+    crowd_tol = query.crowd_tolerance
 
     return {
         "interest_hits": float(interest_hits),
-        "interest_jaccard": tag_jaccard if 'tag_jaccard' in locals() else jaccard(interests, combined_tags),
+        "interest_jaccard": tag_jaccard,
         "name_hits": float(name_hits),
         "desc_hits": float(desc_hits),
         "tag_hits": float(tag_hits),
@@ -214,3 +342,308 @@ FEATURE_KEYS = [
 ]
 
 
+
+
+class Vocabulary:
+    """Interning of tokens, keywords and n-grams to int32 ids.
+
+    Exhibit profiles store their term sets as sorted id arrays, so each
+    distinct string is held once however many exhibits contain it. Ids only
+    mean something within one Vocabulary: exhibit_profiles.ProfileCache owns
+    the current one and replaces it (with its profiles) once it grows past a
+    bound, and every index built from profiles reads their ``vocab``.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.terms: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def intern(self, terms: Iterable[str]) -> np.ndarray:
+        """Sorted unique ids of ``terms``, adding unseen terms."""
+        terms = list(terms)
+        found = list(map(self.ids.get, terms))
+        if None in found:
+            with self._lock:
+                for k, term in enumerate(terms):
+                    if found[k] is None:
+                        i = self.ids.get(term)
+                        if i is None:
+                            i = self.ids[term] = len(self.terms)
+                            self.terms.append(term)
+                        found[k] = i
+        return np.array(sorted(set(found)), dtype=np.int32)
+
+    def encode(self, terms: Sequence[str]) -> np.ndarray:
+        """Ids of ``terms`` in order, repeats kept (token sequences)."""
+        ids = self.intern(terms)
+        return np.array([self.ids[t] for t in terms], dtype=np.int32).reshape(len(terms)) if len(ids) else _EMPTY_IDS
+
+    def lookup(self, terms: Iterable[str]) -> np.ndarray:
+        """Sorted unique ids of the already interned ``terms``; unknown terms are skipped."""
+        ids = self.ids
+        return np.array(sorted({ids[t] for t in terms if t in ids}), dtype=np.int32)
+
+
+_EMPTY_IDS = np.zeros(0, dtype=np.int32)
+
+
+def id_jaccard(query: Set[str], ids: np.ndarray, vocabulary: Vocabulary) -> float:
+    """``keyword_similarity`` between a string set and an id array interned in ``vocabulary``."""
+    if not query or not len(ids):
+        return 0.0
+    vocab = vocabulary.ids
+    # Plain int sets: cheaper than numpy for one small pair
+    inter = len({vocab[t] for t in query if t in vocab}.intersection(ids.tolist()))
+    return inter / (len(query) + len(ids) - inter)
+
+
+class SetIndex:
+    """Per-exhibit term sets stored as a sparse exhibit x term incidence matrix.
+
+    Columns are the distinct interned ids of this exhibit list (``global_ids``,
+    sorted); overlaps with a query are one bincount over every exhibit.
+    """
+
+    def __init__(self, sets: Sequence[Iterable[str] | np.ndarray], vocabulary: Vocabulary):
+        """``sets``: id arrays interned in ``vocabulary``, or term sets to intern."""
+        self.vocabulary = vocabulary
+        id_sets = [s if isinstance(s, np.ndarray) else vocabulary.intern(s) for s in sets]
+        self.n = len(id_sets)
+        sizes = np.fromiter((len(s) for s in id_sets), dtype=np.int64, count=self.n)
+        self.rows = np.repeat(np.arange(self.n, dtype=np.int32), sizes)
+        ids = np.concatenate(id_sets) if self.n else _EMPTY_IDS
+        self.global_ids, cols = np.unique(ids, return_inverse=True)
+        self.cols = cols.astype(np.int32).reshape(len(ids))
+        self.sizes = sizes.astype(np.float64)
+        self._terms: Optional[List[str]] = None
+        self._vocab: Optional[Dict[str, int]] = None
+
+    @property
+    def terms(self) -> List[str]:
+        """Column terms."""
+        if self._terms is None:
+            terms = self.vocabulary.terms
+            self._terms = [terms[i] for i in self.global_ids]
+        return self._terms
+
+    @property
+    def vocab(self) -> Dict[str, int]:
+        """Term -> column."""
+        if self._vocab is None:
+            self._vocab = {t: col for col, t in enumerate(self.terms)}
+        return self._vocab
+
+    def term_mask(self, terms: Iterable[str]) -> np.ndarray:
+        mask = np.zeros(len(self.global_ids), dtype=bool)
+        query_ids = self.vocabulary.lookup(terms)
+        if len(query_ids) and len(self.global_ids):
+            cols = np.searchsorted(self.global_ids, query_ids)
+            found = cols < len(self.global_ids)
+            cols, query_ids = cols[found], query_ids[found]
+            mask[cols[self.global_ids[cols] == query_ids]] = True
+        return mask
+
+    def count(self, mask: np.ndarray) -> np.ndarray:
+        """Number of terms selected by ``mask`` present in each exhibit's set."""
+        if not len(self.rows):
+            return np.zeros(self.n, dtype=np.float64)
+        return np.bincount(self.rows, weights=mask[self.cols], minlength=self.n)
+
+    def overlap(self, terms: Iterable[str]) -> np.ndarray:
+        return self.count(self.term_mask(terms))
+
+
+def _factorize(values: Sequence[Any]):
+    """Unique values (first-seen order) and the index of each input value."""
+    index: Dict[Any, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    return list(index), codes
+
+
+def _contains(texts: Sequence[str], needle: str) -> np.ndarray:
+    return np.fromiter((needle in t for t in texts), dtype=bool, count=len(texts))
+
+
+def _keyword_jaccard(query: Set[str], index: SetIndex) -> np.ndarray:
+    """Vectorized ``text_similarity`` (or n-gram overlap) between a term set and every exhibit."""
+    if not query:
+        return np.zeros(index.n, dtype=np.float64)
+    inter = index.overlap(query)
+    union = len(query) + index.sizes - inter
+    return np.divide(inter, union, out=np.zeros(index.n, dtype=np.float64), where=index.sizes > 0)
+
+
+class ExhibitArrays:
+    """Exhibit-side columns for ``build_feature_matrix``, built once per exhibit list.
+
+    Built from cached exhibit profiles (see exhibit_profiles.exhibit_arrays).
+    """
+
+    def __init__(self, profiles: Sequence[Any]):
+        self.n = len(profiles)
+        self.profiles = list(profiles)
+        self.ids = [p.id for p in profiles]
+        self.name_lower = [p.name_lower for p in profiles]
+        self.desc_lower = [p.desc_lower for p in profiles]
+        self.searchable = [p.full_text for p in profiles]
+        # Every profile of one list comes from the same ProfileCache generation
+        self.vocab = profiles[0].vocab if self.n else Vocabulary()
+        self.tags = SetIndex([p.tag_ids for p in profiles], self.vocab)
+        self.name_keywords = SetIndex([p.name_keyword_ids for p in profiles], self.vocab)
+        self.desc_keywords = SetIndex([p.desc_keyword_ids for p in profiles], self.vocab)
+        self.bigrams = SetIndex([p.bigram_ids for p in profiles], self.vocab)
+        self.trigrams = SetIndex([p.trigram_ids for p in profiles], self.vocab)
+        self.categories, self.category_codes = _factorize([p.category for p in profiles])
+        self.age_ranges, self.age_codes = _factorize([p.age_range for p in profiles])
+        self.group_types, self.group_codes = _factorize([p.group_type for p in profiles])
+        self.categories_normalized = [normalize_category(c) for c in self.categories]
+        self._text: Any = None
+        # Set by take(): corpus-level text features come from the parent list
+        self._parent: Optional[Tuple["ExhibitArrays", np.ndarray]] = None
+        self._tag_fuzzy: Optional[FuzzyIndex] = None
+        self._category_fuzzy: Optional[FuzzyIndex] = None
+        self._category_raw_fuzzy: Optional[FuzzyIndex] = None
+
+    @property
+    def tag_fuzzy(self) -> FuzzyIndex:
+        """Fuzzy matcher over the tag vocabulary (``tags.terms`` order), built on first use."""
+        if self._tag_fuzzy is None:
+            self._tag_fuzzy = FuzzyIndex(self.tags.terms)
+        return self._tag_fuzzy
+
+    def category_match(self, kw_lower: str) -> np.ndarray:
+        """Per distinct category: the better of ``fuzzy_match`` against its normalized and raw form."""
+        if self._category_fuzzy is None:
+            self._category_fuzzy = FuzzyIndex(self.categories_normalized)
+            self._category_raw_fuzzy = FuzzyIndex(self.categories)
+        return np.maximum(self._category_fuzzy.scores(kw_lower), self._category_raw_fuzzy.scores(kw_lower))
+
+    @property
+    def text(self) -> Any:
+        """text_index.TextIndex over names, descriptions and full texts, built on first use."""
+        if self._text is None:
+            from text_index import TextIndex
+            self._text = TextIndex(self.profiles, self.vocab)
+        return self._text
+
+    def build_text_index(self) -> None:
+        """Build the TextIndex ``text_columns`` reads (the parent's for a subset) ahead of use."""
+        if self._parent is not None:
+            self._parent[0].build_text_index()
+        else:
+            self.text.build()
+
+    def text_columns(self, expanded_interests: List[str]) -> Dict[str, np.ndarray]:
+        """``TextIndex.columns`` for these exhibits; a subset reads its parent's index (same IDF)."""
+        if self._parent is not None:
+            parent, rows = self._parent
+            return {key: col[rows] for key, col in parent.text_columns(expanded_interests).items()}
+        return self.text.columns(expanded_interests)
+
+    def take(self, rows: Sequence[int]) -> "ExhibitArrays":
+        """Arrays of the exhibits at ``rows``, in that order."""
+        sub = ExhibitArrays([self.profiles[i] for i in rows])
+        sub._parent = (self, np.asarray(rows, dtype=np.int64))
+        return sub
+
+
+def _category_table(interests: List[str], user_keywords: Set[str], arrays: ExhibitArrays) -> np.ndarray:
+    """category_hits, category_match, category_similarity and category_known per distinct category value."""
+    normalized = arrays.categories_normalized
+    has_normalized = np.array([bool(c) for c in normalized], dtype=bool).reshape(len(normalized))
+    category_hits = np.zeros(len(normalized))
+    max_category_match = np.zeros(len(normalized))
+    for kw_lower in interests:
+        cat_match = np.where(has_normalized, arrays.category_match(kw_lower), 0.0)
+        max_category_match = np.maximum(max_category_match, cat_match)
+        category_hits += cat_match > 0.3
+        contains = np.array([bool(c) and (kw_lower in c or c in kw_lower) for c in normalized], dtype=bool).reshape(len(normalized))
+        category_hits += np.where(contains, 0.5, 0.0)
+    similarity = np.zeros(len(normalized))
+    if user_keywords:
+        for i, category_normalized in enumerate(normalized):
+            cat_keywords = extract_keywords(category_normalized)
+            if cat_keywords:
+                similarity[i] = len(user_keywords & cat_keywords) / len(user_keywords | cat_keywords)
+    known = np.array([1.0 if c else 0.0 for c in arrays.categories], dtype=np.float64).reshape(len(normalized))
+    return np.column_stack([category_hits, max_category_match, similarity, known])
+
+
+def build_feature_columns(user: Dict[str, Any] | UserQuery, arrays: ExhibitArrays) -> Dict[str, np.ndarray]:
+    """Base features of one user against every exhibit, as float64 columns keyed by FEATURE_KEYS."""
+    from user_query import UserQuery
+
+    query = UserQuery.of(user)
+    n = arrays.n
+    kws = query.keywords_lower
+
+    interest_hits = np.zeros(n)
+    name_hits = np.zeros(n)
+    desc_hits = np.zeros(n)
+    for kw_lower in kws:
+        interest_hits += _contains(arrays.searchable, kw_lower)
+        name_hits += _contains(arrays.name_lower, kw_lower)
+        desc_hits += _contains(arrays.desc_lower, kw_lower)
+
+    # Tag hits: exact match scores 1, otherwise any fuzzy-matching tag scores 0.5
+    tags = arrays.tags
+    tag_hits = np.zeros(n)
+    for kw_lower in kws:
+        exact = tags.overlap([kw_lower]) > 0
+        fuzzy = arrays.tag_fuzzy.scores(kw_lower) > 0.3
+        tag_hits += np.where(exact, 1.0, np.where(tags.count(fuzzy) > 0, 0.5, 0.0))
+
+    interest_set = query.interest_set
+    inter = tags.overlap(interest_set)
+    union = len(interest_set) + tags.sizes - inter
+    interest_jaccard = np.divide(inter, union, out=np.zeros(n), where=union > 0)
+
+    user_keywords = query.keywords
+    category_table = _category_table(kws, user_keywords, arrays)[arrays.category_codes]
+
+    age_band = query.age_band
+    group_type = query.group_type
+    age_match = np.array([match_score(age_band, v) for v in arrays.age_ranges], dtype=np.float64)[arrays.age_codes]
+    group_match = np.array([match_score(group_type, v) for v in arrays.group_types], dtype=np.float64)[arrays.group_codes]
+
+    time_budget = query.time_budget
+    mobility = query.mobility
+    crowd_tol = query.crowd_tolerance
+
+    return {
+        "interest_hits": interest_hits,
+        "interest_jaccard": interest_jaccard,
+        "name_hits": name_hits,
+        "desc_hits": desc_hits,
+        "tag_hits": tag_hits,
+        "category_hits": category_table[:, 0],
+        "category_match": category_table[:, 1],
+        "desc_similarity": _keyword_jaccard(user_keywords, arrays.desc_keywords),
+        "name_similarity": _keyword_jaccard(user_keywords, arrays.name_keywords),
+        "category_similarity": category_table[:, 2],
+        "age_match": age_match,
+        "group_match": group_match,
+        "category_known": category_table[:, 3],
+        "time_budget": np.full(n, time_budget),
+        "mobility_none": np.full(n, 1.0 if mobility == "none" else 0.0),
+        "crowd_low": np.full(n, 1.0 if crowd_tol == "low" else 0.0),
+        "crowd_medium": np.full(n, 1.0 if crowd_tol == "medium" else 0.0),
+        "crowd_high": np.full(n, 1.0 if crowd_tol == "high" else 0.0),
+    }
+
+
+def build_feature_matrix(user: Dict[str, Any] | UserQuery, exhibits: Sequence[Dict[str, Any]] | ExhibitArrays, dtype=np.float32) -> np.ndarray:
+    """Batch ``build_feature_vector``: an (N, len(FEATURE_KEYS)) float32 matrix for one user."""
+    if not isinstance(exhibits, ExhibitArrays):
+        from exhibit_profiles import exhibit_arrays
+        exhibits = exhibit_arrays(exhibits)
+    arrays = exhibits
+    columns = build_feature_columns(user, arrays)
+    X = np.empty((arrays.n, len(FEATURE_KEYS)), dtype=dtype)
+    for j, key in enumerate(FEATURE_KEYS):
+        X[:, j] = columns[key]
+    return X
@@ -0,0 +1,176 @@
+"""
+Logging and metrics for the ranker service.
+
+``log`` replaces the unconditional ``print("DEBUG: ...")`` lines: messages
+below RANKER_LOG_LEVEL are dropped before formatting, and per-request debug
+lines are additionally sampled (RANKER_LOG_SAMPLE, fraction of calls kept).
+
+``metrics`` keeps counters, per-stage latency histograms and gauges read from
+callbacks (cache and batcher stats), and renders them in the Prometheus text
+exposition format for the service's /metrics endpoint. No client library is
+needed.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "OFF": 100}
+
+# Latency buckets in seconds, from sub-millisecond stages to slow requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Logger:
+    """Level-gated, optionally sampled print logging in the service's ``LEVEL: message`` style."""
+
+    def __init__(self, level: str = "INFO", sample_rate: float = 1.0):
+        self.level = LEVELS.get(level.upper(), LEVELS["INFO"])
+        self.sample_rate = sample_rate
+
+    def enabled(self, level: str) -> bool:
+        return LEVELS[level] >= self.level
+
+    def _emit(self, level: str, msg: str, args: Tuple, sampled: bool) -> None:
+        if LEVELS[level] < self.level:
+            return
+        if sampled and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        print(f"{level}: {msg % args if args else msg}")
+
+    def debug(self, msg: str, *args, sampled: bool = True) -> None:
+        """Per-request detail; sampled unless ``sampled=False``."""
+        self._emit("DEBUG", msg, args, sampled)
+
+    def info(self, msg: str, *args) -> None:
+        self._emit("INFO", msg, args, False)
+
+    def warning(self, msg: str, *args) -> None:
+        self._emit("WARNING", msg, args, False)
+
+    def error(self, msg: str, *args) -> None:
+        self._emit("ERROR", msg, args, False)
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_: str):
+        self.name = name
+        self.help = help_
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_str(key)} {_fmt(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, +Inf overflow count, sum)
+        self._series: Dict[Tuple[Tuple[str, str], ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            else:
+                series[1] += 1
+            series[2] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, overflow, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_str(key, ('le', _fmt(bound)))} {cumulative}")
+            cumulative += overflow
+            lines.append(f"{self.name}_bucket{_label_str(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_str(key)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """Registry of counters, histograms and callback gauges."""
+
+    def __init__(self):
+        self.requests = Counter("ranker_requests_total", "Ranking requests by endpoint and outcome.")
+        self.profiles = Counter("ranker_profiles_ranked_total", "User profiles ranked (cache hits included).")
+        self.exhibits = Counter("ranker_exhibits_scored_total", "Exhibit rows scored by the model.")
+        self.stage_seconds = Histogram("ranker_stage_seconds", "Latency of each ranking stage per call (batched calls count once).")
+        self.request_seconds = Histogram("ranker_request_seconds", "End-to-end request latency by endpoint.")
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]]] = []
+
+    def gauge(self, name: str, help_: str, read: Callable[[], float | Dict[Tuple[Tuple[str, str], ...], float]]) -> None:
+        """Gauge whose value (or {labels: value} dict) is read at scrape time."""
+        self._gauges.append((name, help_, read))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - t, stage=name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in [self.requests, self.profiles, self.exhibits, self.stage_seconds, self.request_seconds]:
+            lines.extend(metric.render())
+        for name, help_, read in self._gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for key, v in sorted(value.items()):
+                    lines.append(f"{name}{_label_str(key)} {_fmt(v)}")
+            else:
+                lines.append(f"{name} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+log = Logger(os.getenv("RANKER_LOG_LEVEL", "INFO"), float(os.getenv("RANKER_LOG_SAMPLE", "0.01")))
+metrics = Metrics()
@@ -0,0 +1,156 @@
+"""
+Dynamic micro-batching for concurrent ranking requests.
+
+Concurrent /rank calls used to run one small model.predict each on its own
+thread-pool worker. The MicroBatcher queues them instead: a collector task
+takes the first waiting request, gathers whatever else arrives within
+``max_wait_ms`` (at most ``max_batch`` requests), and runs the whole batch as
+one call on a worker thread. While a batch runs, new arrivals queue up and
+form the next one, so batches grow with load and a lone request waits at most
+``max_wait_ms``.
+
+InFlightLimiter bounds how many requests are admitted at once; beyond that
+the service answers 503 immediately instead of letting the queue grow.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+
+class MicroBatcher:
+    """Collects items submitted from async handlers into bounded batches for ``run_batch``.
+
+    ``run_batch`` receives a list of items and must return one result per item,
+    in order. If a batch raises, its items are retried one by one so a single
+    bad request cannot fail the others.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Sequence[Any]], max_batch: int = 32, max_wait_ms: float = 2.0):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    def _ensure_started(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        # One collector per event loop (tests may run each request on a fresh loop)
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._collect(self._queue))
+        return self._queue
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        if not self.enabled:
+            loop = asyncio.get_running_loop()
+            return (await loop.run_in_executor(None, self.run_batch, [item]))[0]
+        queue = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                # Drain anything already waiting before sleeping on the window
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._run(loop, batch)
+
+    async def _run(self, loop: asyncio.AbstractEventLoop, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        items = [item for item, _ in batch]
+        self.batches += 1
+        self.items += len(items)
+        try:
+            results = await loop.run_in_executor(None, self.run_batch, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"run_batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            if len(batch) == 1:
+                self._resolve(batch[0][1], exception=e)
+                return
+            # Isolate the failure: rerun each item on its own
+            for item, future in batch:
+                try:
+                    result = (await loop.run_in_executor(None, self.run_batch, [item]))[0]
+                except Exception as item_error:
+                    self._resolve(future, exception=item_error)
+                else:
+                    self._resolve(future, result=result)
+            return
+        for (_, future), result in zip(batch, results):
+            self._resolve(future, result=result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result: Any = None, exception: Optional[BaseException] = None) -> None:
+        # The waiting handler may have been cancelled (client went away)
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+
+class InFlightLimiter:
+    """Admission counter for in-flight requests (``max_in_flight`` <= 0 means unbounded)."""
+
+    def __init__(self, max_in_flight: int = 0):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if 0 < self.max_in_flight <= self.in_flight:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
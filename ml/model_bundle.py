@@ -0,0 +1,225 @@
+"""
+Versioned, immutable model bundles with hot reload for the ranker service.
+
+A ModelBundle holds everything one ranking needs from ml/models: the
+ensemble's boosters (or the single primary booster), the saved feature keys
+and the column map fitted to the boosters' input width. It is loaded once and
+never mutated; a request takes the current bundle when it starts and keeps it
+to the end, so swapping in a new bundle never changes a ranking mid-flight.
+
+ModelRegistry owns the current bundle. A reload builds a complete new bundle
+next to the old one and replaces the reference in one assignment; if loading
+fails the old bundle keeps serving. Reloads come from the admin endpoint or a
+polling watcher thread. train_ranker.py writes ``bundle.json`` last, listing
+each artifact's hash, and the watcher only reloads once that manifest changes
+and every hash matches, so a half-written training run is never picked up.
+Model directories without a manifest are watched by file size and mtime, and
+reloaded once they have stopped changing for one poll interval.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import lightgbm as lgb
+
+from feature_schema import FeatureSchemaError
+from instrumentation import log
+
+# Try ensemble ranker
+try:
+    from ensemble_ranker import EnsembleRanker
+    HAS_ENSEMBLE = True
+except ImportError:
+    HAS_ENSEMBLE = False
+
+MODEL_FILES = ("ranker.txt", "ranker_secondary.txt", "ranker_stage1.txt", "feature_keys.json")
+MANIFEST = "bundle.json"
+
+
+def file_sha1(path: Path) -> str:
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def artifact_hashes(model_dir: Path) -> Dict[str, str]:
+    return {name: file_sha1(model_dir / name) for name in MODEL_FILES if (model_dir / name).exists()}
+
+
+def bundle_version(hashes: Dict[str, str]) -> str:
+    payload = "\n".join(f"{name}:{digest}" for name, digest in sorted(hashes.items()))
+    return hashlib.sha1(payload.encode("ascii")).hexdigest()[:16]
+
+
+def write_manifest(model_dir: Path, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Record the current artifacts' hashes in bundle.json (atomically); call after writing all of them."""
+    hashes = artifact_hashes(model_dir)
+    manifest = {"version": bundle_version(hashes), "files": hashes, "created": time.time()}
+    if extra:
+        manifest.update(extra)
+    tmp = model_dir / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, model_dir / MANIFEST)
+    return manifest
+
+
+def read_manifest(model_dir: Path) -> Optional[Dict[str, Any]]:
+    path = model_dir / MANIFEST
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+class ModelBundle:
+    """One loaded, immutable set of model artifacts."""
+
+    def __init__(self, model_dir: Path, version: str, ensemble: Optional[Any], model: lgb.Booster, manifest: Optional[Dict[str, Any]] = None):
+        self.model_dir = model_dir
+        self.version = version
+        self.ensemble = ensemble
+        self.model = model
+        self.use_ensemble = ensemble is not None
+        self.manifest = manifest or {}
+        self.loaded_at = time.time()
+
+    @property
+    def feature_keys(self) -> List[str]:
+        return self.ensemble.feature_keys() if self.ensemble is not None else []
+
+    @classmethod
+    def load(cls, model_dir: Path, strict: bool = False) -> "ModelBundle":
+        """Load every artifact in ``model_dir``.
+
+        With ``strict`` the files must match bundle.json (if there is one);
+        otherwise a mismatch is only logged and the files on disk win.
+        """
+        model_path = model_dir / "ranker.txt"
+        if not model_path.exists():
+            raise RuntimeError(f"Ranker model not found at {model_path}. Please run train_ranker.py")
+        hashes = artifact_hashes(model_dir)
+        manifest = read_manifest(model_dir)
+        if manifest is not None and manifest.get("files") != hashes:
+            if strict:
+                raise RuntimeError("model files do not match bundle.json (training still writing?)")
+            log.warning("Model files do not match %s; loading the files on disk", MANIFEST)
+            manifest = None
+
+        # Try to use ensemble, fallback to single model
+        ensemble = None
+        if HAS_ENSEMBLE:
+            try:
+                schema = (manifest or {}).get("feature_schema") or {}
+                ensemble = EnsembleRanker(model_dir, schema_hash=schema.get("hash"))
+            except FeatureSchemaError as e:
+                # Feature-schema drift (feature_schema.resolve): never serve this bundle
+                raise RuntimeError(f"Invalid model bundle in {model_dir}: {e}") from e
+            except Exception as e:
+                log.warning("Could not load ensemble, using single model: %s", e)
+        # The ensemble's primary booster is ranker.txt; don't parse it twice
+        model = ensemble.models[0] if ensemble is not None else lgb.Booster(model_file=str(model_path))
+        version = manifest["version"] if manifest else bundle_version(hashes)
+        return cls(model_dir, version, ensemble, model, manifest)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "use_ensemble": self.use_ensemble,
+            "models": len(self.ensemble.models) if self.ensemble is not None else 1,
+            "feature_keys": len(self.feature_keys),
+            "feature_schema": self.ensemble.schema.info() if self.ensemble is not None else None,
+            "loaded_at": self.loaded_at,
+            "manifest": bool(self.manifest),
+        }
+
+
+class ModelRegistry:
+    """Holds the current ModelBundle and swaps in new ones (admin call or file watcher)."""
+
+    def __init__(self, model_dir: Path, poll_seconds: float = 0.0):
+        self.model_dir = model_dir
+        self.poll_seconds = poll_seconds
+        # Taken before loading: a change made during the load is still seen as new
+        self._loaded_signature = self._signature()
+        self._bundle = ModelBundle.load(model_dir)
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[ModelBundle, ModelBundle], None]] = []
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    @property
+    def current(self) -> ModelBundle:
+        return self._bundle
+
+    def on_swap(self, callback: Callable[[ModelBundle, ModelBundle], None]) -> None:
+        """``callback(old, new)`` runs after every swap."""
+        self._listeners.append(callback)
+
+    def reload(self, force: bool = False) -> Tuple[bool, ModelBundle]:
+        """Load the artifacts on disk and swap them in if their version differs (or ``force``)."""
+        with self._reload_lock:
+            try:
+                bundle = ModelBundle.load(self.model_dir, strict=True)
+            except Exception as e:
+                self.failed_reloads += 1
+                log.error("Model reload failed, keeping bundle %s: %s", self._bundle.version, e)
+                raise
+            old = self._bundle
+            if bundle.version == old.version and not force:
+                return False, old
+            self._bundle = bundle
+            self.reloads += 1
+        log.info("Swapped model bundle %s -> %s", old.version, bundle.version)
+        for callback in self._listeners:
+            callback(old, bundle)
+        return True, bundle
+
+    def _signature(self) -> Tuple:
+        manifest = read_manifest(self.model_dir)
+        if manifest is not None:
+            return ("manifest", manifest.get("version"))
+        sig = []
+        for name in MODEL_FILES:
+            try:
+                st = (self.model_dir / name).stat()
+                sig.append((name, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((name, None, None))
+        return ("files", tuple(sig))
+
+    def _watch(self) -> None:
+        seen = self._loaded_signature
+        pending: Optional[Tuple] = None
+        while not self._stop.wait(self.poll_seconds):
+            sig = self._signature()
+            if sig == seen:
+                pending = None
+                continue
+            # Without a manifest, wait until the files stop changing
+            if sig[0] == "files" and sig != pending:
+                pending = sig
+                continue
+            try:
+                self.reload()
+                seen = sig
+            except Exception:
+                pass  # logged by reload(); retried on the next poll
+            pending = None
+
+    def start_watcher(self) -> None:
+        if self.poll_seconds <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="model-bundle-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
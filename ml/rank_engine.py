@@ -0,0 +1,703 @@
+"""
+Staged ranking pipeline behind the ranker service's /rank endpoint.
+
+A request is decoded once into a RankContext: the exhibit set (exhibit
+dicts, one id -> row index, feature arrays) and a FeatureMemo shared by every
+stage. Scoring, strict
+interest filtering, diversity and Taramandal pinning then run as passes over
+that state, so no stage rebuilds features or scans the exhibit list to
+resolve an id.
+
+Before scoring, the exhibit set's inverted index (candidate_index.py) narrows
+each context to the rows the strict filter can keep; features and model
+predictions are only computed for those rows. When nothing matches, the
+filter falls back to the best-scoring unmatched exhibits, so every row is
+scored as before.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from candidate_index import CandidateIndex
+from exhibit_profiles import exhibit_arrays
+from feature_memo import FeatureMemo
+from features import FEATURE_KEYS, ExhibitArrays
+from instrumentation import log, metrics
+from user_query import UserQuery
+
+# Ranking tiers, richest first (see TierPlanner)
+TIER_ENSEMBLE = "ensemble"  # ensemble on advanced features
+TIER_PRIMARY = "primary"  # one model (stage-1 or primary booster) on base features
+TIER_POPULARITY = "popularity"  # precomputed popularity order
+# Stages before scoring whose per-row cost TierPlanner also learns
+STAGE_CANDIDATES = "candidates"
+STAGE_CASCADE = "cascade"
+
+ASTRONOMY_KEYWORDS = ["stars", "star", "astronomy", "space", "planets", "planet", "taramandal"]
+TARAMANDAL_ID = "cmf97ohja0003snwdwzd9jhb7"  # Known taramandal ID
+
+
+class ExhibitSet:
+    """Request-independent view of an exhibit list: ids, id index, feature arrays.
+
+    Built per request when exhibits are shipped with it, or once per catalog
+    version (see catalog.py) when the service ranks its resident catalog.
+    """
+
+    def __init__(self, exhibits: List[Dict[str, Any]], arrays: Optional[ExhibitArrays] = None, popularity: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """``popularity``: precomputed (scores, order) for these exhibits (see ``popularity``)."""
+        self.exhibits = exhibits
+        self.ids = [ex.get("id") for ex in exhibits]
+        # First exhibit wins for duplicate ids, like the old linear lookups
+        self.index: Dict[Any, int] = {}
+        for i, ex_id in enumerate(self.ids):
+            self.index.setdefault(ex_id, i)
+        self.names_lower = [(ex.get("name") or "").lower() for ex in exhibits]
+        self.categories = [ex.get("category") or "" for ex in exhibits]
+        # SPECIAL: taramandal exhibit by name or category (case-insensitive)
+        self.taramandal = np.array(
+            ["taramandal" in name or "taramandal" in cat.lower() for name, cat in zip(self.names_lower, self.categories)],
+            dtype=bool,
+        ).reshape(len(exhibits))
+        self._arrays = arrays
+        self._version: Optional[str] = None
+        self._candidate_index: Optional[CandidateIndex] = None
+        self._first_rows: Optional[np.ndarray] = None
+        self._popularity = popularity
+
+    @property
+    def arrays(self) -> ExhibitArrays:
+        """Feature arrays, built on first use (a cached result never needs them)."""
+        if self._arrays is None:
+            self._arrays = exhibit_arrays(self.exhibits)
+        return self._arrays
+
+    @property
+    def version(self) -> str:
+        """Content hash of every exhibit field (ratings too), computed on first use."""
+        if self._version is None:
+            payload = json.dumps(self.exhibits, sort_keys=True, default=str, ensure_ascii=False)
+            self._version = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+        return self._version
+
+    @property
+    def candidate_index(self) -> CandidateIndex:
+        """Tag/category postings, built on first use."""
+        if self._candidate_index is None:
+            self._candidate_index = CandidateIndex(self.arrays)
+        return self._candidate_index
+
+    @property
+    def first_rows(self) -> np.ndarray:
+        """Row of each exhibit's id in ``index`` (differs from its own row only for duplicate ids)."""
+        if self._first_rows is None:
+            self._first_rows = np.fromiter((self.index[ex_id] for ex_id in self.ids), dtype=np.int64, count=len(self.ids))
+        return self._first_rows
+
+    @property
+    def popularity(self) -> Tuple[np.ndarray, np.ndarray]:
+        """No-interest scores (popularity_scores) and the rows in ranked order, computed on first use."""
+        if self._popularity is None:
+            scores = popularity_scores(self.exhibits)
+            self._popularity = (scores, np.argsort(-scores, kind="stable"))
+        return self._popularity
+
+    def __len__(self) -> int:
+        return len(self.exhibits)
+
+
+class RankContext:
+    """Everything one /rank request needs, decoded once."""
+
+    def __init__(self, user: Dict[str, Any], exhibits: List[Dict[str, Any]] | ExhibitSet, top_k: int, deadline: Optional[float] = None):
+        """``deadline``: time.perf_counter() by which the ranking should be done (None = no budget)."""
+        exhibit_set = exhibits if isinstance(exhibits, ExhibitSet) else ExhibitSet(exhibits)
+        self.user = user
+        self.deadline = deadline
+        # Tier that produced the result, and whether it is below the best available one
+        self.tier: Optional[str] = None
+        self.degraded = False
+        self.exhibit_set = exhibit_set
+        self.exhibits = exhibit_set.exhibits
+        self.top_k = top_k
+        self.interests = user.get("interests") or []
+        self.ids = exhibit_set.ids
+        self.index = exhibit_set.index
+        self.names_lower = exhibit_set.names_lower
+        self.categories = exhibit_set.categories
+        self.query = UserQuery(user)
+        self.memo = FeatureMemo(self.query, self.exhibits, exhibit_set.arrays)
+        self.used_ensemble = False
+        # Rows being scored, and each exhibit row's position among them (see narrow())
+        self.scored_ids = self.ids
+        self.scored_rows: Optional[np.ndarray] = None
+        self.positions: Optional[np.ndarray] = None
+
+        # STRICT: Check each interest individually (case-insensitive)
+        interests_lower = [i.lower().strip() for i in self.interests if i]
+        self.has_astronomy_interest = any(
+            any(kw in interest for kw in ASTRONOMY_KEYWORDS)
+            for interest in interests_lower
+        )
+
+    def rows(self, ids: List[Any]) -> np.ndarray:
+        """Exhibit row for each id, -1 when the id is unknown."""
+        return np.fromiter((self.index.get(ex_id, -1) for ex_id in ids), dtype=np.int64, count=len(ids))
+
+    def narrow(self, rows: np.ndarray) -> None:
+        """Score only the exhibits at ``rows`` (sorted, among those scored so far).
+
+        The memo is rebuilt over them; base columns it already holds carry over.
+        """
+        exhibit_set = self.exhibit_set
+        kept = rows if self.positions is None else self.positions[rows]
+        self.scored_ids = [self.ids[r] for r in rows]
+        self.scored_rows = rows
+        self.positions = np.full(len(exhibit_set), -1, dtype=np.int64)
+        self.positions[rows] = np.arange(len(rows))
+        self.memo = self.memo.take(kept, [self.exhibits[r] for r in rows], exhibit_set.arrays.take(rows))
+
+
+def taramandal_rows(ctx: RankContext) -> np.ndarray:
+    """Taramandal flag per exhibit row: by name/category or the known id."""
+    return ctx.exhibit_set.taramandal | np.array([ex_id == TARAMANDAL_ID for ex_id in ctx.ids], dtype=bool).reshape(len(ctx.ids))
+
+
+def interest_match_scores(tag_hits: np.ndarray, category_hits: np.ndarray, interest_jaccard: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Strict-filter direct-match flag and interest-match bonus per row."""
+    has_match = (tag_hits > 0) | (category_hits > 0) | (interest_jaccard > 0.25)
+    return has_match, np.where(has_match, tag_hits * 2.0 + category_hits * 1.5 + interest_jaccard * 1.0, 0.0)
+
+
+def candidate_rows(ctx: RankContext) -> Optional[np.ndarray]:
+    """Rows ``strict_filter`` can keep, or None when it would fall back to unmatched exhibits.
+
+    Includes the rows whose features a kept row is judged by (the first row of
+    a duplicated id) and, for astronomy interests, every Taramandal row.
+    """
+    exhibit_set = ctx.exhibit_set
+    first_rows = exhibit_set.first_rows
+    matched = np.zeros(len(exhibit_set), dtype=bool)
+    matched[exhibit_set.candidate_index.match_rows(ctx.interests)] = True
+    keep = matched[first_rows]
+    if ctx.has_astronomy_interest:
+        keep |= taramandal_rows(ctx)[first_rows]
+    if not keep.any():
+        return None
+    keep[first_rows[keep]] = True
+    return np.flatnonzero(keep)
+
+
+class Cascade:
+    """Two-stage ensemble scoring for large exhibit lists (``head`` = 0 disables it).
+
+    Stage 1 scores every candidate from base features only
+    (EnsembleRanker.stage1_scores) plus the strict filter's interest-match
+    bonus; stage 2 builds the advanced features and runs the full ensemble on
+    the ``head`` best rows only. Only the top-K survive the strict filter, so
+    the head usually holds all of them; a sampled ``audit_rate`` of cascaded
+    requests is also ranked without the cascade to measure how often the
+    final top-K changes.
+    """
+
+    def __init__(self, head: int = 0, audit_rate: float = 0.0):
+        self.head = head
+        self.audit_rate = audit_rate
+        self._lock = threading.Lock()
+        self.cascaded = 0
+        self.audited = 0
+        self.changed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.head > 0
+
+    def narrow(self, ctx: RankContext, ensemble: Any) -> bool:
+        """Narrow ``ctx`` to its stage-1 head; False if it is already small enough."""
+        if ctx.memo.n <= self.head:
+            return False
+        fv = ctx.memo.base()
+        _, interest_match = interest_match_scores(fv["tag_hits"], fv["category_hits"], fv["interest_jaccard"])
+        priority = ensemble.stage1_scores(ctx.memo) + interest_match * 2.0
+        head = np.argpartition(-priority, self.head - 1)[: self.head]
+        exhibit_set = ctx.exhibit_set
+        scored_rows = ctx.scored_rows if ctx.scored_rows is not None else np.arange(len(exhibit_set))
+        keep = np.zeros(len(exhibit_set), dtype=bool)
+        keep[scored_rows[head]] = True
+        # Taramandal is pinned regardless of score; duplicate ids are judged by their first row
+        if ctx.has_astronomy_interest:
+            keep[scored_rows] |= taramandal_rows(ctx)[scored_rows]
+        keep[exhibit_set.first_rows[keep]] = True
+        ctx.narrow(np.flatnonzero(keep))
+        with self._lock:
+            self.cascaded += 1
+        return True
+
+    def sample(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record(self, cascaded: List[Dict[str, Any]], full: List[Dict[str, Any]]) -> None:
+        """Compare a cascaded top-K with the full-scoring one."""
+        changed = [r["id"] for r in cascaded] != [r["id"] for r in full]
+        with self._lock:
+            self.audited += 1
+            self.changed += changed
+        if changed:
+            log.debug("Cascade changed the top-%d", len(full))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "head": self.head,
+            "audit_rate": self.audit_rate,
+            "cascaded": self.cascaded,
+            "audited": self.audited,
+            "topk_changed": self.changed,
+            "topk_change_rate": self.changed / self.audited if self.audited else 0.0,
+        }
+
+
+class TierPlanner:
+    """Picks the richest ranking tier whose expected cost fits a request's remaining time.
+
+    Costs are learned online as a moving average of seconds per scored row
+    for each model tier (and for the candidate and cascade stages that run
+    before scoring), so the choice follows the loaded bundle and the host.
+    An unmeasured tier is assumed to fit. The popularity tier is a
+    precomputed slice and always fits. A tier skipped ``probe_every`` times
+    in a row is tried once anyway and its estimate replaced by the new
+    measurement, so a slow spell does not lock the richer tier out for good.
+    """
+
+    def __init__(self, alpha: float = 0.2, margin: float = 1.25, probe_every: int = 200):
+        self.alpha = alpha
+        self.margin = margin
+        self.probe_every = probe_every
+        self._lock = threading.Lock()
+        self.per_row: Dict[str, float] = {}
+        self.served: Dict[str, int] = {TIER_ENSEMBLE: 0, TIER_PRIMARY: 0, TIER_POPULARITY: 0}
+        self.degraded = 0
+        self.probes = 0
+        # Consecutive skips per tier, and tiers whose next measurement replaces the estimate
+        self._skipped: Dict[str, int] = {}
+        self._stale: Set[str] = set()
+
+    def estimate(self, tier: str, rows: int) -> float:
+        return self.per_row.get(tier, 0.0) * rows * self.margin
+
+    def fits(self, ctx: RankContext, tier: str, now: float, reserve: float = 0.0, rows: Optional[int] = None) -> bool:
+        """Whether ``tier`` on ``rows`` (default: the rows ``ctx`` scores) is expected to finish
+        before ``ctx.deadline``, after ``reserve`` seconds of work that must run first."""
+        if ctx.deadline is None:
+            return True
+        remaining = ctx.deadline - now - reserve
+        return remaining > 0 and self.estimate(tier, ctx.memo.n if rows is None else rows) <= remaining
+
+    def choose(self, ctx: RankContext, tiers: List[str], now: float) -> str:
+        """First of ``tiers`` (richest first) expected to finish before ``ctx.deadline``."""
+        if ctx.deadline is None:
+            return tiers[0]
+        for tier in tiers:
+            if self.fits(ctx, tier, now):
+                self._skipped[tier] = 0
+                return tier
+            if ctx.deadline > now and self._probe(tier):
+                return tier
+        return TIER_POPULARITY
+
+    def _probe(self, tier: str) -> bool:
+        """Count a skip of ``tier``; True (and the estimate marked stale) every ``probe_every`` skips."""
+        with self._lock:
+            skipped = self._skipped.get(tier, 0) + 1
+            if self.probe_every <= 0 or skipped < self.probe_every:
+                self._skipped[tier] = skipped
+                return False
+            self._skipped[tier] = 0
+            self._stale.add(tier)
+            self.probes += 1
+            return True
+
+    def observe(self, tier: str, rows: int, seconds: float) -> None:
+        if rows <= 0:
+            return
+        sample = seconds / rows
+        with self._lock:
+            previous = self.per_row.get(tier)
+            if previous is None or tier in self._stale:
+                self._stale.discard(tier)
+                self.per_row[tier] = sample
+            else:
+                self.per_row[tier] = previous + self.alpha * (sample - previous)
+
+    def forget(self) -> None:
+        """Drop every estimate (e.g. for a new model bundle); tiers are re-measured as they serve."""
+        with self._lock:
+            self.per_row.clear()
+            self._skipped.clear()
+            self._stale.clear()
+
+    def record(self, ctx: RankContext) -> None:
+        with self._lock:
+            self.served[ctx.tier] = self.served.get(ctx.tier, 0) + 1
+            self.degraded += ctx.degraded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "served": dict(self.served),
+            "degraded": self.degraded,
+            "probes": self.probes,
+            "us_per_row": {tier: cost * 1e6 for tier, cost in self.per_row.items()},
+        }
+
+
+def popularity_scores(exhibits: List[Dict[str, Any]]) -> np.ndarray:
+    """Multi-factor scores for general recommendations (no interests given)."""
+    scores = np.zeros(len(exhibits))
+    for i, ex_dict in enumerate(exhibits):
+        # Factor 1: Rating (if available)
+        rating = ex_dict.get("rating", 0) or 0
+        rating_score = float(rating) if isinstance(rating, (int, float)) else 0.0
+        # Factor 2: Category diversity (prefer popular categories)
+        category_bonus = 0.5 if ex_dict.get("category", "") else 0.0
+        # Factor 3: Has description (more informative)
+        desc = ex_dict.get("description", "") or ""
+        desc_bonus = 0.3 if len(desc) > 50 else 0.0
+        # Factor 4: Interactive features (more engaging)
+        features = ex_dict.get("features") or ex_dict.get("interactiveFeatures") or []
+        features_bonus = min(0.2 * len(features), 1.0) if features else 0.0
+        scores[i] = rating_score * 0.5 + category_bonus * 0.2 + desc_bonus * 0.2 + features_bonus * 0.1
+    return scores
+
+
+def rank_popular(ctx: RankContext) -> List[Dict[str, Any]]:
+    # Exhibit-only scores, ranked once per ExhibitSet: a request is a top-K slice
+    scores, order = ctx.exhibit_set.popularity
+    return [{"id": ctx.ids[i], "score": float(scores[i])} for i in order[: max(1, ctx.top_k)]]
+
+
+def _single_model_scores(ctx: RankContext, preds: np.ndarray) -> Tuple[List[Any], np.ndarray, np.ndarray]:
+    fv = ctx.memo.base()
+    confidences = (
+        fv["tag_hits"] * 0.3 +
+        fv["category_hits"] * 0.25 +
+        fv["desc_similarity"] * 0.2 +
+        fv["interest_jaccard"] * 0.15 +
+        fv["category_similarity"] * 0.1
+    )
+    ctx.used_ensemble = False
+    return list(ctx.scored_ids), np.asarray(preds, dtype=np.float64), confidences
+
+
+def score_exhibits(ctx: RankContext, ensemble: Any, model: Any) -> Tuple[List[Any], np.ndarray, np.ndarray]:
+    """Model scores and confidences in exhibit order (ensemble if available)."""
+    return score_batch([ctx], ensemble, model)[0]
+
+
+def score_batch(ctxs: List[RankContext], ensemble: Any, model: Any) -> List[Tuple[List[Any], np.ndarray, np.ndarray]]:
+    """``score_exhibits`` for many contexts with one stacked model call."""
+    metrics.exhibits.inc(sum(ctx.memo.n for ctx in ctxs))
+    if ensemble is not None:
+        try:
+            with metrics.stage("feature_build"):
+                for ctx in ctxs:
+                    try:
+                        ctx.memo.advanced()
+                    except Exception:
+                        ctx.memo.base()  # EnsembleRanker falls back to base columns too
+            with metrics.stage("predict"):
+                scored = ensemble.score_batch([ctx.memo for ctx in ctxs], use_advanced=True)
+            out = []
+            for ctx, (scores, confidences) in zip(ctxs, scored):
+                ctx.used_ensemble = True
+                out.append((list(ctx.scored_ids), scores, confidences))
+            return out
+        except Exception as e:
+            log.warning("Ensemble ranking failed, falling back to single model: %s", e)
+            traceback.print_exc()
+
+    # Use single model
+    with metrics.stage("feature_build"):
+        X = np.vstack([ctx.memo.matrix(FEATURE_KEYS, dtype=np.float64) for ctx in ctxs])
+    with metrics.stage("predict"):
+        preds = model.predict(X)
+    out = []
+    offset = 0
+    for ctx in ctxs:
+        out.append(_single_model_scores(ctx, preds[offset:offset + ctx.memo.n]))
+        offset += ctx.memo.n
+    return out
+
+
+def score_primary(ctxs: List[RankContext], ensemble: Any, model: Any) -> List[Tuple[List[Any], np.ndarray, np.ndarray]]:
+    """Degraded ``score_batch``: base features and a single model only."""
+    if ensemble is None:
+        return score_batch(ctxs, None, model)
+    metrics.exhibits.inc(sum(ctx.memo.n for ctx in ctxs))
+    with metrics.stage("predict"):
+        scored = ensemble.base_scores([ctx.memo for ctx in ctxs])
+    out = []
+    for ctx, (scores, confidences) in zip(ctxs, scored):
+        ctx.used_ensemble = False
+        out.append((list(ctx.scored_ids), scores, confidences))
+    return out
+
+
+def strict_filter(ctx: RankContext, ids: List[Any], scores: np.ndarray, confidences: np.ndarray) -> List[Dict[str, Any]]:
+    """Keep interest-matched exhibits only (Taramandal first for astronomy interests)."""
+    order = np.argsort(-scores, kind="stable")
+    ids = [ids[i] for i in order]
+    scores = scores[order]
+    confidences = confidences[order]
+    rows = ctx.rows(ids)
+    found = rows >= 0
+    safe_rows = np.where(found, rows, 0)
+    astronomy = ctx.has_astronomy_interest
+
+    tara_rows = ctx.exhibit_set.taramandal
+    is_tara = found & (tara_rows[safe_rows] | np.array([ex_id == TARAMANDAL_ID for ex_id in ids], dtype=bool).reshape(len(ids)))
+
+    # STRICT: Has direct match if tag hits, category hits, or good jaccard
+    fv = ctx.memo.base()
+    feature_rows = safe_rows if ctx.positions is None else ctx.positions[safe_rows]
+    tag_hits = fv["tag_hits"][feature_rows]
+    category_hits = fv["category_hits"][feature_rows]
+    interest_jaccard = fv["interest_jaccard"][feature_rows]
+    has_match, interest_match = interest_match_scores(tag_hits, category_hits, interest_jaccard)
+    has_match &= found
+    interest_match = np.where(found, interest_match, 0.0)
+
+    tara_priority = is_tara & astronomy
+    # ALWAYS mark taramandal as interest-matched if astronomy interest exists
+    interest_match = np.where(tara_priority, 100.0, interest_match)
+    matched = tara_priority | has_match
+    priority = scores + interest_match * 2.0
+
+    tara_positions = np.flatnonzero(is_tara)
+    taramandal = int(tara_positions[-1]) if len(tara_positions) else None
+
+    def entry(i: int) -> Dict[str, Any]:
+        r = {"id": ids[i], "score": float(scores[i]), "confidence": float(confidences[i])}
+        if found[i]:
+            r["interest_match_score"] = float(interest_match[i])
+            r["is_taramandal"] = bool(tara_priority[i])
+        if matched[i]:
+            r["priority_score"] = float(priority[i])
+        return r
+
+    matched_positions = np.flatnonzero(matched)
+    if astronomy and taramandal is not None:
+        log.debug("Astronomy interest detected - prioritizing Taramandal FIRST")
+        tara_id = ids[taramandal]
+        rest = np.array([i for i in matched_positions if not (is_tara[i] and ids[i] == tara_id)], dtype=np.int64)
+        rest = rest[np.argsort(-priority[rest], kind="stable")]
+        # Put taramandal FIRST - no exceptions
+        filtered_positions = [taramandal] + rest.tolist()
+    else:
+        filtered_positions = matched_positions[np.argsort(-priority[matched_positions], kind="stable")].tolist()
+
+    # STRICT RULE: top 10-15 MUST be interest-matched ONLY
+    strict_top_k = min(15, max(10, ctx.top_k))
+    if len(filtered_positions) >= strict_top_k:
+        return [entry(i) for i in filtered_positions[:strict_top_k]]
+    if filtered_positions:
+        # Not enough for the strict window: still use ONLY interest-matched
+        return [entry(i) for i in filtered_positions[: ctx.top_k]]
+
+    # No interest-matched found - fall back to non-matched but mark as low quality
+    filtered = [entry(i) for i in np.flatnonzero(~matched)[: ctx.top_k]]
+    for r in filtered:
+        r["priority_score"] = r["score"] * 0.2  # Very heavy penalty
+    return filtered
+
+
+def final_scores(ctx: RankContext, filtered: List[Dict[str, Any]]) -> None:
+    """Re-rank with STRICT interest matching priority."""
+    for r in filtered:
+        base_score = r.get("priority_score", r["score"])
+        confidence = r.get("confidence", 0)
+        interest_match = r.get("interest_match_score", 0)
+        if r.get("is_taramandal", False) and ctx.has_astronomy_interest:
+            # EXTREME maximum score to ensure it's ALWAYS first
+            r["final_score"] = 10000.0
+        elif interest_match > 0:
+            # 55% priority score + 15% confidence + 30% interest match
+            r["final_score"] = base_score * 0.55 + confidence * 0.15 + interest_match * 0.30
+        elif not ctx.used_ensemble:
+            r["final_score"] = base_score * 0.40 + confidence * 0.10
+        else:
+            r["final_score"] = base_score * 0.45 + confidence * 0.08
+
+
+def diversify(ctx: RankContext, filtered: List[Dict[str, Any]]) -> None:
+    """Small penalty for repeated categories, only when there are many more results than needed."""
+    if len(filtered) <= ctx.top_k * 1.5:
+        return
+    seen_categories = set()
+    for position, r in enumerate(filtered):
+        row = ctx.index.get(r["id"])
+        if row is None:
+            continue
+        category = ctx.categories[row]
+        if category and category in seen_categories and position < ctx.top_k * 0.8:
+            r["final_score"] *= 0.98  # Very small penalty
+        seen_categories.add(category)
+
+
+def pin_taramandal(ctx: RankContext, filtered: List[Dict[str, Any]]) -> None:
+    """ABSOLUTE PRIORITY: Taramandal first whenever there is an astronomy interest."""
+    if not ctx.has_astronomy_interest:
+        return
+    taramandal_idx = None
+    for i, r in enumerate(filtered):
+        row = ctx.index.get(r["id"])
+        if (
+            r.get("is_taramandal", False)
+            or "taramandal" in str(r.get("id", "")).lower()
+            or (row is not None and "taramandal" in ctx.names_lower[row])
+        ):
+            taramandal_idx = i
+            break
+    if taramandal_idx is None:
+        log.debug("Astronomy interest present but Taramandal not found in filtered results")
+    elif taramandal_idx > 0:
+        log.debug("Moving Taramandal from position %d to position 1", taramandal_idx + 1)
+        taramandal = filtered.pop(taramandal_idx)
+        filtered.insert(0, taramandal)
+        taramandal["final_score"] = 10000.0
+
+
+def rerank(ctx: RankContext, ids: List[Any], scores: np.ndarray, confidences: np.ndarray) -> List[Dict[str, Any]]:
+    """Per-user stages after scoring: strict filter, final scores, diversity, pinning."""
+    with metrics.stage("strict_filter"):
+        filtered = strict_filter(ctx, ids, scores, confidences)
+        final_scores(ctx, filtered)
+    with metrics.stage("diversity"):
+        diversify(ctx, filtered)
+        filtered.sort(key=lambda x: x.get("final_score", 0), reverse=True)
+        pin_taramandal(ctx, filtered)
+        results = [{"id": r["id"], "score": r.get("final_score", r["score"])} for r in filtered[: max(1, ctx.top_k)]]
+    log.debug("Returning %d results (requested topK=%d)", len(results), ctx.top_k)
+    return results
+
+
+def rank(ctx: RankContext, ensemble: Optional[Any], model: Any, cascade: Optional[Cascade] = None, planner: Optional[TierPlanner] = None) -> List[Dict[str, Any]]:
+    """Run every stage and return the top-K ``{"id", "score"}`` results."""
+    return rank_batch([ctx], ensemble, model, cascade, planner)[0]
+
+
+def rank_batch(
+    ctxs: List[RankContext],
+    ensemble: Optional[Any],
+    model: Any,
+    cascade: Optional[Cascade] = None,
+    planner: Optional[TierPlanner] = None,
+) -> List[List[Dict[str, Any]]]:
+    """``rank`` for many users; model scoring is one call per tier over every context.
+
+    With an enabled ``cascade`` (and an ensemble) large candidate sets are
+    first cut down to the stage-1 head. With a ``planner``, contexts with a
+    deadline step down to cheaper tiers as their remaining time shrinks;
+    each context's ``tier`` and ``degraded`` record what served it.
+    """
+    best = TIER_ENSEMBLE if ensemble is not None else TIER_PRIMARY
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(ctxs)
+    to_score = []
+    for i, ctx in enumerate(ctxs):
+        # Fallback for empty interests: use popularity/rating-based ranking
+        if not ctx.interests:
+            ctx.tier = TIER_POPULARITY
+            with metrics.stage("popularity"):
+                results[i] = rank_popular(ctx)
+        elif not ctx.exhibits:
+            ctx.tier = best
+            results[i] = []
+        else:
+            to_score.append(i)
+
+    if to_score and planner is not None:
+        # Out of time before narrowing even starts: nothing but popularity can still make it
+        now = time.perf_counter()
+        late = {i for i in to_score if not planner.fits(ctxs[i], STAGE_CANDIDATES, now)}
+        for i in late:
+            ctxs[i].tier = TIER_POPULARITY
+            ctxs[i].degraded = True
+            with metrics.stage("popularity"):
+                results[i] = rank_popular(ctxs[i])
+        to_score = [i for i in to_score if i not in late]
+
+    if to_score:
+        with metrics.stage("candidates"):
+            for i in to_score:
+                t = time.perf_counter()
+                n = ctxs[i].memo.n
+                rows = candidate_rows(ctxs[i])
+                if rows is not None and len(rows) < len(ctxs[i].exhibits):
+                    ctxs[i].narrow(rows)
+                if planner is not None:
+                    planner.observe(STAGE_CANDIDATES, n, time.perf_counter() - t)
+        cascaded = []
+        if cascade is not None and cascade.enabled and ensemble is not None:
+            with metrics.stage("cascade"):
+                for i in to_score:
+                    ctx = ctxs[i]
+                    # Stage 1 only serves the ensemble tier: skip it when it and the
+                    # ensemble on the head together no longer fit the deadline
+                    now = time.perf_counter()
+                    if planner is not None and not planner.fits(ctx, TIER_ENSEMBLE, now, planner.estimate(STAGE_CASCADE, ctx.memo.n), min(ctx.memo.n, cascade.head)):
+                        continue
+                    n = ctx.memo.n
+                    try:
+                        if cascade.narrow(ctx, ensemble):
+                            cascaded.append(i)
+                            if planner is not None:
+                                planner.observe(STAGE_CASCADE, n, time.perf_counter() - now)
+                    except Exception as e:
+                        # Fails before narrowing: this context is scored in full
+                        log.warning("Cascade first stage failed, scoring every candidate: %s", e)
+        tiers = [TIER_ENSEMBLE, TIER_PRIMARY] if ensemble is not None else [TIER_PRIMARY]
+        groups: Dict[str, List[int]] = {tier: [] for tier in tiers + [TIER_POPULARITY]}
+        # Chosen on the clock after narrowing and the cascade, so their time is already spent
+        now = time.perf_counter()
+        for i in to_score:
+            ctx = ctxs[i]
+            ctx.tier = planner.choose(ctx, tiers, now) if planner is not None else best
+            ctx.degraded = ctx.tier != best
+            groups[ctx.tier].append(i)
+        for tier, positions in groups.items():
+            if not positions:
+                continue
+            group = [ctxs[i] for i in positions]
+            if tier == TIER_POPULARITY:
+                with metrics.stage("popularity"):
+                    for i in positions:
+                        results[i] = rank_popular(ctxs[i])
+                continue
+            if tier == TIER_ENSEMBLE:
+                # One-time index builds stay out of the timing the planner learns from
+                with metrics.stage("feature_build"):
+                    for ctx in group:
+                        ctx.exhibit_set.arrays.build_text_index()
+            t = time.perf_counter()
+            scored = score_batch(group, ensemble, model) if tier == TIER_ENSEMBLE else score_primary(group, ensemble, model)
+            if planner is not None:
+                planner.observe(tier, sum(ctx.memo.n for ctx in group), time.perf_counter() - t)
+            for i, (ids, scores, confidences) in zip(positions, scored):
+                results[i] = rerank(ctxs[i], ids, scores, confidences)
+        for i in cascaded:
+            # Audits compare against full scoring, so degraded results are skipped
+            if not ctxs[i].degraded and cascade.sample():
+                with metrics.stage("cascade_audit"):
+                    full = rank(RankContext(ctxs[i].user, ctxs[i].exhibit_set, ctxs[i].top_k), ensemble, model)
+                cascade.record(results[i], full)
+    if planner is not None:
+        for ctx in ctxs:
+            planner.record(ctx)
+    return results
@@ -1,23 +1,27 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import time
+import traceback
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
-import lightgbm as lgb
-from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, ValidationError
 
-from features import build_feature_vector, FEATURE_KEYS
-
-# Try ensemble ranker
-try:
-    from ensemble_ranker import EnsembleRanker
-    HAS_ENSEMBLE = True
-except ImportError:
-    HAS_ENSEMBLE = False
+import rank_engine
+from catalog import DEFAULT_CATALOG_PATH, Catalog
+from exhibit_profiles import profile_cache
+from fast_io import RequestDecoder, dumps
+from instrumentation import log, metrics
+from rank_engine import ExhibitSet, RankContext
+from micro_batcher import InFlightLimiter, MicroBatcher
+from model_bundle import ModelBundle, ModelRegistry
+from result_cache import ResultCache
 
 
 class UserProfile(BaseModel):
@@ -41,356 +45,354 @@ class Exhibit(BaseModel):
     interactiveFeatures: List[str] | None = None
     rating: float | None = None
     tags: List[str] | None = None
+    floor: str | None = None
+
+
+class CatalogFilter(BaseModel):
+    category: List[str] | None = None
+    exhibitType: List[str] | None = None
+    ageRange: List[str] | None = None
+    floor: List[str] | None = None
 
 
 class RankRequest(BaseModel):
     userProfile: UserProfile
-    exhibits: List[Exhibit]
+    # Omit exhibits to rank the server-resident catalog
+    exhibits: List[Exhibit] | None = None
+    exhibitIds: List[str] | None = None
+    filter: CatalogFilter | None = None
+    topK: int = 20
+    # Latency budget from arrival; past it the ranker steps down to cheaper tiers
+    deadlineMs: float | None = None
+
+
+class RankBatchRequest(BaseModel):
+    userProfiles: List[UserProfile]
+    # Omit exhibits to rank the server-resident catalog
+    exhibits: List[Exhibit] | None = None
+    exhibitIds: List[str] | None = None
+    filter: CatalogFilter | None = None
     topK: int = 20
+    deadlineMs: float | None = None
+
+
+class CatalogUpsertRequest(BaseModel):
+    exhibits: List[Exhibit]
+    replace: bool = False
+
+
+class CatalogRemoveRequest(BaseModel):
+    ids: List[str]
 
 
 base = Path(__file__).resolve().parent
-model_path = base / "models" / "ranker.txt"
 
-if not model_path.exists():
-    raise RuntimeError(f"Ranker model not found at {model_path}. Please run train_ranker.py")
+# Versioned model bundle; RANKER_MODEL_POLL seconds between checks for new artifacts (0 = off)
+models = ModelRegistry(base / "models", poll_seconds=float(os.getenv("RANKER_MODEL_POLL", "10")))
+models.start_watcher()
 
-# Try to use ensemble, fallback to single model
-if HAS_ENSEMBLE:
+# Server-resident exhibit catalog (RANKER_CATALOG overrides the default path)
+catalog = Catalog()
+catalog_path = Path(os.getenv("RANKER_CATALOG", str(DEFAULT_CATALOG_PATH)))
+if catalog_path.exists():
     try:
-        ensemble = EnsembleRanker(base / "models")
-        use_ensemble = True
-        model = None  # Will use ensemble instead
+        catalog.load(catalog_path)
+        log.info("Loaded catalog %s (%d exhibits) from %s", catalog.version, len(catalog.snapshot), catalog_path)
     except Exception as e:
-        print(f"Warning: Could not load ensemble, using single model: {e}")
-        use_ensemble = False
-        model = lgb.Booster(model_file=str(model_path))
-else:
-    use_ensemble = False
-model = lgb.Booster(model_file=str(model_path))
+        log.warning("Could not load catalog from %s: %s", catalog_path, e)
+
+# Ranking result cache (RANKER_CACHE_SIZE=0 disables it)
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RANKER_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("RANKER_CACHE_TTL", "300")),
+)
+# Entries are keyed by bundle version; drop the old ones as soon as a new bundle is live
+models.on_swap(lambda old, new: result_cache.clear())
+
+# Cascade ranking: ensemble on the RANKER_CASCADE_HEAD best stage-1 rows only (0 = off);
+# RANKER_CASCADE_AUDIT of cascaded requests are re-ranked in full to measure top-K changes
+cascade = rank_engine.Cascade(
+    head=int(os.getenv("RANKER_CASCADE_HEAD", "0")),
+    audit_rate=float(os.getenv("RANKER_CASCADE_AUDIT", "0.01")),
+)
+
+# Deadline-aware tiers: RANKER_DEADLINE_MS is the default budget of requests without deadlineMs (0 = none)
+DEFAULT_DEADLINE_MS = float(os.getenv("RANKER_DEADLINE_MS", "0"))
+# A tier skipped RANKER_TIER_PROBE_EVERY times in a row is re-measured on the next request (0 = never)
+planner = rank_engine.TierPlanner(probe_every=int(os.getenv("RANKER_TIER_PROBE_EVERY", "200")))
+# Costs learned on the old bundle do not carry over
+models.on_swap(lambda old, new: planner.forget())
+
+# Load shedding: beyond RANKER_MAX_IN_FLIGHT concurrent ranking requests answer 503 at once (0 = unbounded)
+limiter = InFlightLimiter(int(os.getenv("RANKER_MAX_IN_FLIGHT", "0")))
+
+# RANKER_FAST_IO=1 decodes request bodies without per-object Pydantic models and
+# serializes responses with orjson; payloads it cannot vouch for still go through Pydantic
+FAST_IO = os.getenv("RANKER_FAST_IO", "0") == "1"
+decoders = {model: RequestDecoder(model) for model in (RankRequest, RankBatchRequest, CatalogUpsertRequest)}
+
 
 app = FastAPI(title="UC Ranker Service", version="1.0.0")
 
 
-@app.post("/rank")
-def rank(req: RankRequest):
+def decode_request(model: type, body: bytes) -> Dict[str, Any]:
+    """The request body as ``model.model_validate_json(body).model_dump()``; raises ValidationError."""
+    if FAST_IO:
+        return decoders[model].decode(body)
+    return model.model_validate_json(body).model_dump()
+
+
+def resolve_exhibits(req: Dict[str, Any], response: Dict[str, Any]) -> ExhibitSet:
+    """Exhibits shipped with the request, else the (optionally narrowed) catalog."""
+    if req["exhibits"] is not None:
+        return ExhibitSet(req["exhibits"])
+    snapshot = catalog.snapshot
+    if not len(snapshot):
+        raise ValueError("No exhibits in request and the catalog is empty")
+    response["catalogVersion"] = snapshot.version
+    return snapshot.select(req["exhibitIds"], req["filter"])
+
+
+def rank_items(items: List[Tuple[Dict[str, Any], ExhibitSet, int, ModelBundle, Optional[float]]]) -> List[Tuple[List[Dict[str, Any]], str, bool]]:
+    """Rank (profile, exhibits, topK, bundle, deadline) items from any number of requests in one batch.
+
+    Items are grouped by bundle so requests that started before a model swap
+    finish on the bundle they started with. Each result is (ranking, tier,
+    degraded).
+    """
+    results: List[Any] = [None] * len(items)
+    groups: Dict[int, List[int]] = {}
+    for i, item in enumerate(items):
+        groups.setdefault(id(item[3]), []).append(i)
+    for positions in groups.values():
+        bundle = items[positions[0]][3]
+        ctxs = [RankContext(items[i][0], items[i][1], items[i][2], deadline=items[i][4]) for i in positions]
+        ranked = rank_engine.rank_batch(ctxs, bundle.ensemble, bundle.model, cascade, planner)
+        for i, ctx, r in zip(positions, ctxs, ranked):
+            results[i] = (r, ctx.tier, ctx.degraded)
+    return results
+
+
+# Concurrent requests share model calls (RANKER_BATCH_MAX=1 disables batching)
+batcher = MicroBatcher(
+    rank_items,
+    max_batch=int(os.getenv("RANKER_BATCH_MAX", "32")),
+    max_wait_ms=float(os.getenv("RANKER_BATCH_WAIT_MS", "2")),
+)
+
+
+async def rank_profiles(profiles: List[Dict[str, Any]], exhibits: ExhibitSet, top_k: int, deadline: Optional[float] = None) -> Tuple[List[List[Dict[str, Any]]], List[str]]:
+    """Ranked results per profile and the tier that served each ("cache" for cache hits).
+
+    Profiles are ranked in canonical form with or without the result cache,
+    so enabling it never changes an answer; degraded results are never cached.
+    """
+    bundle = models.current
+    profiles = [result_cache.canonical_profile(p) for p in profiles]
+    if not result_cache.enabled:
+        ranked = await asyncio.gather(*(batcher.submit((profile, exhibits, top_k, bundle, deadline)) for profile in profiles))
+        return [r for r, _, _ in ranked], [tier for _, tier, _ in ranked]
+
+    version = bundle.version
+    results: List[Any] = [None] * len(profiles)
+    tiers: List[str] = ["cache"] * len(profiles)
+    misses = []
+    for i, profile in enumerate(profiles):
+        key = result_cache.key(profile, exhibits.version, version, top_k)
+        with metrics.stage("cache_lookup"):
+            cached = result_cache.get(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            misses.append((i, profile, key))
+
+    if misses:
+        ranked = await asyncio.gather(*(batcher.submit((profile, exhibits, top_k, bundle, deadline)) for _, profile, _ in misses))
+        for (i, _, key), (r, tier, degraded) in zip(misses, ranked):
+            if not degraded:
+                result_cache.put(key, r)
+            results[i] = r
+            tiers[i] = tier
+    return results, tiers
+
+
+def respond(payload: Dict[str, Any], status_code: int = 200) -> Response:
+    with metrics.stage("serialize"):
+        body = dumps(payload) if FAST_IO else json.dumps(payload)
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def decode_rank(body: bytes, endpoint: str, request_model: type) -> Tuple[Dict[str, Any], List[Dict[str, Any]], ExhibitSet, Dict[str, Any]]:
+    """Request, profiles, exhibits and the response started for them; all the per-exhibit work before ranking."""
+    with metrics.stage("decode"):
+        req = decode_request(request_model, body)
+        profiles = req["userProfiles"] if endpoint == "rank_batch" else [req["userProfile"]]
+        response: Dict[str, Any] = {"success": True}
+        exhibits = resolve_exhibits(req, response)
+        if result_cache.enabled:
+            # Cache keys hash the whole exhibit list; do it here rather than on the event loop
+            exhibits.version
+    return req, profiles, exhibits, response
+
+
+async def handle_rank(request: Request, endpoint: str, request_model: type) -> Response:
+    """Shared body of /rank and /rank_batch: decode, rank (cached, batched), serialize.
+
+    Decoding and serialization run in worker threads, as FastAPI runs sync
+    handlers; only the cache lookups and batcher hand-off stay on the event loop.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    if not limiter.try_acquire():
+        # Shed load with a fast 503 rather than queueing without bound
+        metrics.requests.inc(endpoint=endpoint, status="shed")
+        return Response(
+            content=json.dumps({"success": False, "error": "ranker overloaded, retry shortly", "results": []}),
+            status_code=503,
+            media_type="application/json",
+            headers={"Retry-After": "1"},
+        )
     try:
-    user = req.userProfile.model_dump()
-        interests = user.get("interests") or []
-        
-        # Determine if we should use ensemble (check if it's available)
-        current_use_ensemble = use_ensemble and ensemble is not None
-        
-        # Fallback for empty interests: use popularity/rating-based ranking
-        if not interests or len(interests) == 0:
-            # Multi-factor scoring for general recommendations
-            scored = []
-            for ex in req.exhibits:
-                ex_dict = ex.model_dump()
-                # Factor 1: Rating (if available)
-                rating = ex_dict.get("rating", 0) or 0
-                rating_score = float(rating) if isinstance(rating, (int, float)) else 0.0
-                
-                # Factor 2: Category diversity (prefer popular categories)
-                category = ex_dict.get("category", "") or ""
-                category_bonus = 0.5 if category else 0.0
-                
-                # Factor 3: Has description (more informative)
-                desc = ex_dict.get("description", "") or ""
-                desc_bonus = 0.3 if len(desc) > 50 else 0.0
-                
-                # Factor 4: Interactive features (more engaging)
-                features = ex_dict.get("features") or ex_dict.get("interactiveFeatures") or []
-                features_bonus = min(0.2 * len(features), 1.0) if features else 0.0
-                
-                # Combined score
-                score = rating_score * 0.5 + category_bonus * 0.2 + desc_bonus * 0.2 + features_bonus * 0.1
-                
-                scored.append({"id": ex.id, "score": score})
-            scored.sort(key=lambda x: x["score"], reverse=True)
-            return {"success": True, "results": scored[: max(1, req.topK)]}
-        
-        # Normal ranking with ML model (ensemble if available)
-        scored = []
-        if current_use_ensemble:
-            try:
-                # Use ensemble ranker
-                exhibits_list = [ex.model_dump() for ex in req.exhibits]
-                ranked_results = ensemble.rank(user, exhibits_list, use_advanced=True)
-                print(f"DEBUG: Ensemble returned {len(ranked_results)} results")
-                if ranked_results:
-                    print(f"DEBUG: Top score: {ranked_results[0].get('score', 0):.6f}")
-                # Convert to expected format
-                scored = [
-                    {
-                        "id": r["id"],
-                        "score": r["score"],
-                        "confidence": r.get("confidence", 0)
-                    }
-                    for r in ranked_results
-                ]
-                print(f"DEBUG: Scored {len(scored)} exhibits")
-                current_use_ensemble = True  # Successfully used ensemble
-            except Exception as e:
-                print(f"WARNING: Ensemble ranking failed, falling back to single model: {e}")
-                import traceback
-                traceback.print_exc()
-                current_use_ensemble = False
-                # Fall through to single model code
-        
-        if not current_use_ensemble or len(scored) == 0:
-            # Use single model
-    feats = []
-    for ex in req.exhibits:
-        fv = build_feature_vector(user, ex.model_dump())
-                feats.append([fv.get(k, 0.0) for k in FEATURE_KEYS])
-    preds = model.predict(feats)
-            
-            # Calculate confidence scores
-            if len(scored) == 0:
-                scored = []
-                for i, ex in enumerate(req.exhibits):
-                    score = float(preds[i])
-                    ex_dict = ex.model_dump()
-                    fv = build_feature_vector(user, ex_dict)
-                    
-                    confidence = (
-                        fv.get("tag_hits", 0) * 0.3 +
-                        fv.get("category_hits", 0) * 0.25 +
-                        fv.get("desc_similarity", 0) * 0.2 +
-                        fv.get("interest_jaccard", 0) * 0.15 +
-                        fv.get("category_similarity", 0) * 0.1
-                    )
-                    
-                    scored.append({
-                        "id": ex.id,
-                        "score": score,
-                        "confidence": confidence
-                    })
-        
-        # Sort by score
-    scored.sort(key=lambda x: x["score"], reverse=True)
-        
-        # Multi-stage reranking with STRICT interest matching - top 10-15 MUST match interests
-        if len(scored) > 0:
-            # Check if user has interests - if yes, STRICT matching required
-            has_interests = interests and len(interests) > 0
-            
-            # Stage 1: STRICT filtering - prioritize exhibits that match user interests
-            # Calculate interest match scores for each exhibit
-            interest_matched = []
-            non_matched = []
-            taramandal_exhibit = None  # Special handling for taramandal
-            
-            # Check if interests include astronomy/space-related terms
-            # STRICT: Check each interest individually (case-insensitive)
-            interests_lower = [i.lower().strip() for i in interests if i]
-            astronomy_keywords = ["stars", "star", "astronomy", "space", "planets", "planet", "taramandal"]
-            has_astronomy_interest = any(
-                any(kw in interest for kw in astronomy_keywords)
-                for interest in interests_lower
-            )
-            
-            print(f"DEBUG: Interests: {interests}")
-            print(f"DEBUG: Has astronomy interest: {has_astronomy_interest}")
-            
-            for r in scored:
-                ex_id = r["id"]
-                ex_data = next((ex for ex in req.exhibits if ex.id == ex_id), None)
-                if ex_data:
-                    ex_dict = ex_data.model_dump()
-                    ex_name = ex_dict.get("name", "").lower()
-                    ex_category = ex_dict.get("category", "").lower()
-                    
-                    # SPECIAL: Check if this is taramandal exhibit (case-insensitive)
-                    is_taramandal_exhibit = (
-                        "taramandal" in ex_name or 
-                        "taramandal" in ex_category or
-                        ex_id == "cmf97ohja0003snwdwzd9jhb7"  # Known taramandal ID
-                    )
-                    
-                    if is_taramandal_exhibit:
-                        print(f"DEBUG: Found Taramandal exhibit: {ex_name} (ID: {ex_id})")
-                        taramandal_exhibit = r
-                        # ALWAYS mark taramandal as interest-matched if astronomy interest exists
-                        if has_astronomy_interest:
-                            fv = build_feature_vector(user, ex_dict)
-                            r["interest_match_score"] = 100.0  # Maximum score for taramandal (increased from 10.0)
-                            r["is_taramandal"] = True
-                            r["taramandal_priority"] = True
-                            interest_matched.append(r)
-                            print(f"DEBUG: Taramandal added to interest_matched with score 100.0")
-                            continue
-                        else:
-                            # Even without astronomy interest, mark it for potential matching
-                            r["is_taramandal"] = True
-                            r["taramandal_priority"] = False
-                    
-                    # Check if exhibit matches user interests
-                    fv = build_feature_vector(user, ex_dict)
-                    tag_hits = fv.get("tag_hits", 0)
-                    category_hits = fv.get("category_hits", 0)
-                    interest_jaccard = fv.get("interest_jaccard", 0)
-                    
-                    # STRICT: Has direct match if tag hits, category hits, or good jaccard
-                    has_match = tag_hits > 0 or category_hits > 0 or interest_jaccard > 0.25
-                    
-                    if has_match:
-                        # Boost score for interest-matched exhibits
-                        r["interest_match_score"] = tag_hits * 2.0 + category_hits * 1.5 + interest_jaccard * 1.0
-                        r["is_taramandal"] = False
-                        interest_matched.append(r)
-                    else:
-                        r["interest_match_score"] = 0.0
-                        r["is_taramandal"] = False
-                        non_matched.append(r)
-                else:
-                    non_matched.append(r)
-            
-            # STRICT: Prioritize interest-matched exhibits
-            # Sort interest-matched by match score + model score
-            for r in interest_matched:
-                r["priority_score"] = r.get("score", 0) + r.get("interest_match_score", 0) * 2.0
-            
-            # SPECIAL: If astronomy interest and taramandal exists, ensure it's FIRST
-            if has_astronomy_interest and taramandal_exhibit and taramandal_exhibit.get("taramandal_priority", False):
-                print(f"DEBUG: Astronomy interest detected - prioritizing Taramandal FIRST")
-                # Remove taramandal from interest_matched if it's there
-                interest_matched = [r for r in interest_matched if not (r.get("is_taramandal", False) and r.get("id") == taramandal_exhibit.get("id"))]
-                # Sort remaining
-                interest_matched.sort(key=lambda x: x.get("priority_score", 0), reverse=True)
-                # Put taramandal FIRST - no exceptions
-                filtered = [taramandal_exhibit] + interest_matched
-                print(f"DEBUG: Taramandal placed FIRST, {len(interest_matched)} other interest-matched exhibits follow")
-            else:
-                interest_matched.sort(key=lambda x: x.get("priority_score", 0), reverse=True)
-                filtered = interest_matched.copy()
-                if taramandal_exhibit and not has_astronomy_interest:
-                    print(f"DEBUG: No astronomy interest - Taramandal not prioritized")
-            
-            # Sort non-matched by score only
-            non_matched.sort(key=lambda x: x.get("score", 0), reverse=True)
-            
-            # STRICT RULE: If user has interests, top 10-15 MUST be interest-matched ONLY
-            strict_top_k = min(15, max(10, req.topK))  # Top 10-15 must be strict
-            
-            if has_interests:
-                # User has interests - STRICT matching required
-                if len(filtered) >= strict_top_k:
-                    # We have enough interest-matched, use ONLY those for top 10-15
-                    filtered = filtered[:strict_top_k]
-                elif len(filtered) >= req.topK:
-                    # We have enough for requested topK, use only those
-                    filtered = filtered[:req.topK]
-                elif len(filtered) > 0:
-                    # We have some interest-matched but not enough
-                    # Still use ONLY interest-matched (don't add non-matched)
-                    filtered = filtered[:len(filtered)]  # Use all we have
-                else:
-                    # No interest-matched found - this shouldn't happen with good data
-                    # Fall back to non-matched but mark as low quality
-                    filtered = non_matched[:req.topK]
-                    for r in filtered:
-                        r["priority_score"] = r.get("score", 0) * 0.2  # Very heavy penalty
-            else:
-                # No interests specified - use all results
-                if len(filtered) >= req.topK:
-                    filtered = filtered[:req.topK]
-                else:
-                    remaining = req.topK - len(filtered)
-                    for r in non_matched[:remaining]:
-                        r["priority_score"] = r.get("score", 0) * 0.5
-                        filtered.append(r)
-            
-            # Stage 2: Re-rank with STRICT interest matching priority
-            for r in filtered:
-                base_score = r.get("priority_score", r.get("score", 0))
-                confidence = r.get("confidence", 0)
-                interest_match = r.get("interest_match_score", 0)
-                is_taramandal = r.get("is_taramandal", False)
-                
-                # SPECIAL: Taramandal gets maximum priority when astronomy interest exists
-                if is_taramandal and has_astronomy_interest:
-                    r["final_score"] = 10000.0  # EXTREME maximum score to ensure it's ALWAYS first
-                    print(f"DEBUG: Taramandal final_score set to 10000.0 (maximum priority)")
-                elif interest_match > 0:
-                    # Interest-matched: Higher weight on interest match
-                    # 55% priority score + 15% confidence + 30% interest match
-                    r["final_score"] = base_score * 0.55 + confidence * 0.15 + interest_match * 0.30
-                else:
-                    # Non-matched: Much lower score (shouldn't appear if has_interests)
-                    if not current_use_ensemble:
-                        r["final_score"] = base_score * 0.40 + confidence * 0.10
-                    else:
-                        r["final_score"] = base_score * 0.45 + confidence * 0.08
-            
-            # Stage 3: Diversity boost (avoid clustering similar exhibits) - only if we have enough results
-            if len(filtered) > req.topK * 1.5:  # Only apply if we have significantly more than needed
-                final_results = []
-                seen_categories = set()
-                for r in filtered:
-                    # Try to get category from exhibit data
-                    ex_id = r["id"]
-                    ex_data = next((ex for ex in req.exhibits if ex.id == ex_id), None)
-                    if ex_data:
-                        category = ex_data.category or ""
-                        if category and category in seen_categories and len(final_results) < req.topK * 0.8:
-                            # Small penalty for duplicate category (only in top 80%)
-                            r["final_score"] *= 0.98  # Very small penalty
-                        seen_categories.add(category)
-                    final_results.append(r)
-                filtered = final_results
-            
-            # Final sort - ensure taramandal is first if astronomy interest
-            filtered.sort(key=lambda x: x.get("final_score", 0), reverse=True)
-            
-            # CRITICAL: Double-check - if astronomy interest and taramandal exists, ensure it's FIRST
-            if has_astronomy_interest:
-                taramandal_idx = None
-                for i, r in enumerate(filtered):
-                    if r.get("is_taramandal", False) or "taramandal" in str(r.get("id", "")).lower():
-                        taramandal_idx = i
-                        break
-                    # Also check by name if we have exhibit data
-                    ex_id = r.get("id", "")
-                    ex_data = next((ex for ex in req.exhibits if ex.id == ex_id), None)
-                    if ex_data:
-                        ex_name = ex_data.model_dump().get("name", "").lower()
-                        if "taramandal" in ex_name:
-                            taramandal_idx = i
-                            break
-                
-                if taramandal_idx is not None and taramandal_idx > 0:
-                    # Move taramandal to first position - ABSOLUTE PRIORITY
-                    print(f"DEBUG: Moving Taramandal from position {taramandal_idx + 1} to position 1")
-                    taramandal = filtered.pop(taramandal_idx)
-                    filtered.insert(0, taramandal)
-                    # Set maximum score to ensure it stays first
-                    taramandal["final_score"] = 10000.0
-                elif taramandal_idx is None:
-                    print(f"DEBUG: WARNING - Astronomy interest present but Taramandal not found in filtered results")
-                else:
-                    print(f"DEBUG: Taramandal already at position 1 (correct)")
+        req, profiles, exhibits, response = await asyncio.to_thread(decode_rank, await request.body(), endpoint, request_model)
+        metrics.profiles.inc(len(profiles))
+        deadline_ms = req["deadlineMs"] if req["deadlineMs"] is not None else DEFAULT_DEADLINE_MS
+        deadline = start + deadline_ms / 1000.0 if deadline_ms > 0 else None
+        results, tiers = await rank_profiles(profiles, exhibits, req["topK"], deadline)
+        if endpoint == "rank_batch":
+            response["results"] = results
+            response["tiers"] = tiers
         else:
-            filtered = scored
-        
-        # Return top-K, using final_score if available, otherwise score
-        results = []
-        for r in filtered[:max(1, req.topK)]:
-            score_to_use = r.get("final_score", r.get("score", 0))
-            results.append({"id": r["id"], "score": score_to_use})
-        
-        print(f"DEBUG: Returning {len(results)} results (requested topK={req.topK})")
-        if results:
-            print(f"DEBUG: Top result: id={results[0]['id']}, score={results[0]['score']:.6f}")
-        
-        return {"success": True, "results": results}
+            response["results"] = results[0]
+            response["tier"] = tiers[0]
+        return await asyncio.to_thread(respond, response)
+    except ValidationError as e:
+        status = "invalid"
+        return respond({"detail": json.loads(e.json())}, status_code=422)
     except Exception as e:
-        import traceback
+        status = "error"
         error_msg = str(e)
         traceback.print_exc()
-        print(f"ERROR in rank endpoint: {error_msg}")
-        return {"success": False, "error": error_msg, "results": []}
+        log.error("in %s endpoint: %s", endpoint, error_msg)
+        return respond({"success": False, "error": error_msg, "results": []})
+    finally:
+        limiter.release()
+        metrics.requests.inc(endpoint=endpoint, status=status)
+        metrics.request_seconds.observe(time.perf_counter() - start, endpoint=endpoint)
+
+
+@app.post("/rank")
+async def rank(request: Request):
+    """Body: RankRequest."""
+    return await handle_rank(request, "rank", RankRequest)
+
+
+@app.post("/rank_batch")
+async def rank_batch(request: Request):
+    """Body: RankBatchRequest. Ranks many user profiles against one exhibit set with a single model call."""
+    return await handle_rank(request, "rank_batch", RankBatchRequest)
+
+
+@app.get("/catalog")
+def catalog_info():
+    snapshot = catalog.snapshot
+    return {"success": True, "version": snapshot.version, "size": len(snapshot)}
+
+
+@app.post("/catalog/upsert")
+async def catalog_upsert(request: Request):
+    """Body: CatalogUpsertRequest."""
+    # Off the event loop, as FastAPI runs sync handlers
+    try:
+        req = await asyncio.to_thread(decode_request, CatalogUpsertRequest, await request.body())
+    except ValidationError as e:
+        return respond({"detail": json.loads(e.json())}, status_code=422)
+    exhibits = req["exhibits"]
+    snapshot = await asyncio.to_thread(catalog.replace if req["replace"] else catalog.upsert, exhibits)
+    result_cache.clear()
+    return {"success": True, "version": snapshot.version, "size": len(snapshot)}
+
+
+@app.post("/catalog/remove")
+def catalog_remove(req: CatalogRemoveRequest):
+    snapshot = catalog.remove(req.ids)
+    result_cache.clear()
+    return {"success": True, "version": snapshot.version, "size": len(snapshot)}
+
+
+@app.post("/catalog/reload")
+def catalog_reload():
+    try:
+        snapshot = catalog.load(catalog_path)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    result_cache.clear()
+    return {"success": True, "version": snapshot.version, "size": len(snapshot)}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"success": True, **result_cache.stats()}
+
+
+@app.get("/batch/stats")
+def batch_stats():
+    return {"success": True, **batcher.stats()}
+
+
+@app.get("/tiers/stats")
+def tier_stats():
+    return {"success": True, **planner.stats(), "limiter": limiter.stats()}
+
+
+@app.get("/io/stats")
+def io_stats():
+    return {"success": True, "fast_io": FAST_IO, **{m.__name__: {"fast": d.fast, "fallback": d.fallback} for m, d in decoders.items()}}
+
+
+@app.get("/cascade/stats")
+def cascade_stats():
+    return {"success": True, **cascade.stats()}
+
+
+@app.post("/cache/clear")
+def cache_clear():
+    result_cache.clear()
+    return {"success": True}
+
+
+@app.get("/model")
+def model_info():
+    return {"success": True, **models.current.info()}
+
+
+@app.post("/admin/reload_model")
+def reload_model(force: bool = False):
+    """Load the artifacts in ml/models and swap them in; in-flight requests finish on the old bundle."""
+    try:
+        changed, bundle = models.reload(force=force)
+    except Exception as e:
+        return {"success": False, "error": str(e), "version": models.current.version}
+    return {"success": True, "changed": changed, "version": bundle.version}
+
+
+def _stats_gauge(stats, fields):
+    return lambda: {(("stat", f),): float(stats()[f]) for f in fields}
+
+
+metrics.gauge("ranker_result_cache", "Result cache counters and size.", _stats_gauge(result_cache.stats, ("size", "hits", "misses", "expired", "evictions", "hit_rate")))
+metrics.gauge("ranker_profile_cache", "Exhibit profile cache counters.", lambda: {(("stat", "hits"),): profile_cache.hits, (("stat", "misses"),): profile_cache.misses})
+metrics.gauge("ranker_micro_batcher", "Micro-batcher batches and items.", _stats_gauge(batcher.stats, ("batches", "items", "mean_batch_size")))
+metrics.gauge("ranker_cascade", "Cascade-ranked and audited requests and the audited top-K change rate.", _stats_gauge(cascade.stats, ("cascaded", "audited", "topk_changed", "topk_change_rate")))
+metrics.gauge("ranker_tier_served", "Rankings served per tier.", lambda: {(("tier", t),): float(n) for t, n in planner.stats()["served"].items()})
+metrics.gauge("ranker_in_flight", "Ranking requests in flight, admitted and shed.", _stats_gauge(limiter.stats, ("in_flight", "admitted", "rejected")))
+metrics.gauge("ranker_model_reloads", "Model bundle swaps and failed reloads.", lambda: {(("result", "ok"),): models.reloads, (("result", "failed"),): models.failed_reloads})
+metrics.gauge("ranker_catalog_exhibits", "Exhibits in the resident catalog.", lambda: len(catalog.snapshot))
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of counters, stage latencies and cache stats."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
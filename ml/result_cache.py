@@ -0,0 +1,96 @@
+"""
+In-process LRU + TTL cache of ranking results.
+
+Kiosk visitors mostly pick the same few interest chips, so identical /rank
+answers are recomputed all day. Results are keyed by a canonical user profile
+(stripped, lower-cased, sorted and de-duplicated interests), the exhibit-set
+or catalog version, the model version and topK. A new catalog or model
+version therefore never sees stale entries; the service also clears the cache
+when either changes so old entries don't hold memory until they expire.
+
+The service ranks the canonical profile whether or not the cache is enabled
+or the request hits, so a cached answer is always the answer a fresh ranking
+would give. Every other field, timeBudget included, is keyed exactly.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class ResultCache:
+    """Thread-safe LRU of ranking results with a time-to-live and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, Tuple[float, List[Dict[str, Any]]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def canonical_profile(user: Dict[str, Any]) -> Dict[str, Any]:
+        """Profile with sorted, lower-cased, de-duplicated interests; other fields unchanged."""
+        profile = dict(user)
+        profile["interests"] = sorted({str(i).strip().lower() for i in (user.get("interests") or []) if i and str(i).strip()})
+        return profile
+
+    @staticmethod
+    def key(profile: Dict[str, Any], exhibit_version: str, model_version: str, top_k: int) -> Hashable:
+        """Cache key of a canonical profile; list values become tuples."""
+        items = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in profile.items()))
+        return (items, exhibit_version, model_version, top_k)
+
+    def get(self, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, results = entry
+            if now - stored_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return results
+
+    def put(self, key: Hashable, results: List[Dict[str, Any]]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,114 @@
+"""
+Seeded synthetic visitor profiles at training scale.
+
+train_ranker.synthetic_user_profiles() is a short hand-written list. This
+module samples any number of profiles from the interest vocabulary
+(advanced_features.INTEREST_SYNONYMS topics, plus the catalog's own tags and
+categories when exhibits are given) and from age / group / mobility / crowd
+distributions modelled on that list. Profiles are generated in chunks; chunk
+``i`` depends only on the seed, ``i`` and the chunk size, so chunks can be
+generated independently (e.g. in worker processes) and reproduce exactly.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from advanced_features import INTEREST_SYNONYMS
+from features import exhibit_category, exhibit_tags
+
+# (value, probability) tables
+AGE_BANDS = (("students", 0.4), ("researchers", 0.2), ("adults", 0.2), ("kids", 0.2))
+GROUP_BY_AGE = {
+    "kids": (("family", 0.9), ("student", 0.1)),
+    "students": (("student", 0.85), ("family", 0.15)),
+    "adults": (("adult", 0.7), ("family", 0.3)),
+    "researchers": (("adult", 0.6), ("student", 0.4)),
+}
+GROUP_SIZES = {"family": (2, 6), "student": (1, 5), "adult": (1, 3)}
+TIME_BUDGETS = ((30, 0.15), (45, 0.2), (60, 0.3), (90, 0.2), (120, 0.15))
+MOBILITY = (("none", 0.88), ("limited", 0.08), ("wheelchair", 0.04))
+CROWD_TOLERANCE = (("low", 0.25), ("medium", 0.5), ("high", 0.25))
+# Number of interest topics per profile (1, 2 or 3)
+TOPIC_COUNTS = ((1, 0.6), (2, 0.3), (3, 0.1))
+
+# Share of profiles with no interests (popularity fallback) and with one extra catalog term
+EMPTY_INTERESTS = 0.03
+CATALOG_TERM = 0.25
+
+
+def _table(pairs: Sequence[Tuple[Any, float]]) -> Tuple[List[Any], np.ndarray]:
+    values = [v for v, _ in pairs]
+    p = np.array([w for _, w in pairs], dtype=np.float64)
+    return values, p / p.sum()
+
+
+class ProfileGenerator:
+    """Samples visitor profiles shaped like the hand-written training profiles."""
+
+    def __init__(self, seed: int = 0, exhibits: Optional[Sequence[Dict[str, Any]]] = None):
+        self.seed = seed
+        # Each topic is a synonym-table key with its expansions
+        self.topics: List[List[str]] = [[key, *synonyms] for key, synonyms in INTEREST_SYNONYMS.items()]
+        terms = set()
+        for ex in exhibits or ():
+            terms.update(t.strip().lower() for t in exhibit_tags(ex) if t and t.strip())
+            category = str(exhibit_category(ex) or "").strip().lower()
+            if category:
+                terms.add(category)
+        self.catalog_terms = sorted(terms)
+        self._ages = _table(AGE_BANDS)
+        self._groups = {age: _table(pairs) for age, pairs in GROUP_BY_AGE.items()}
+        self._budgets = _table(TIME_BUDGETS)
+        self._mobility = _table(MOBILITY)
+        self._crowd = _table(CROWD_TOLERANCE)
+        self._topic_counts = _table(TOPIC_COUNTS)
+
+    def _interests(self, rng: np.random.Generator) -> List[str]:
+        if rng.random() < EMPTY_INTERESTS:
+            return []
+        k = int(rng.choice(self._topic_counts[0], p=self._topic_counts[1]))
+        interests: List[str] = []
+        for t in rng.choice(len(self.topics), size=k, replace=False):
+            topic = self.topics[t]
+            picks = rng.choice(len(topic), size=min(len(topic), int(rng.integers(1, 4))), replace=False)
+            interests.extend(topic[i] for i in picks)
+        if self.catalog_terms and rng.random() < CATALOG_TERM:
+            interests.append(self.catalog_terms[int(rng.integers(len(self.catalog_terms)))])
+        # Topics share terms (space / astronomy); keep the first occurrence
+        return list(dict.fromkeys(interests))
+
+    def profile(self, rng: np.random.Generator) -> Dict[str, Any]:
+        age = self._ages[0][rng.choice(len(self._ages[0]), p=self._ages[1])]
+        groups = self._groups[age]
+        group = groups[0][rng.choice(len(groups[0]), p=groups[1])]
+        low, high = GROUP_SIZES[group]
+        return {
+            "interests": self._interests(rng),
+            "ageBand": age,
+            "groupType": group,
+            "groupSize": int(rng.integers(low, high + 1)),
+            "timeBudget": int(self._budgets[0][rng.choice(len(self._budgets[0]), p=self._budgets[1])]),
+            "mobility": self._mobility[0][rng.choice(len(self._mobility[0]), p=self._mobility[1])],
+            "crowdTolerance": self._crowd[0][rng.choice(len(self._crowd[0]), p=self._crowd[1])],
+        }
+
+    def chunk(self, index: int, size: int) -> List[Dict[str, Any]]:
+        """Profiles of chunk ``index``; a function of (seed, index, size) only."""
+        rng = np.random.default_rng([self.seed, index])
+        return [self.profile(rng) for _ in range(size)]
+
+    def chunk_sizes(self, n: int, chunk_size: int) -> List[int]:
+        return [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+
+    def chunks(self, n: int, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        for index, size in enumerate(self.chunk_sizes(n, chunk_size)):
+            yield self.chunk(index, size)
+
+
+def synthetic_profiles(n: int, seed: int = 0, exhibits: Optional[Sequence[Dict[str, Any]]] = None, chunk_size: int = 1000) -> List[Dict[str, Any]]:
+    """``n`` profiles as one list (small runs; stream ProfileGenerator.chunks for large ones)."""
+    generator = ProfileGenerator(seed, exhibits)
+    return [p for chunk in generator.chunks(n, chunk_size) for p in chunk]
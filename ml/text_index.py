@@ -0,0 +1,211 @@
+"""
+Sparse term index over exhibit texts for the expanded-query features.
+
+For each text field (name, description, full text) of an exhibit list this
+keeps two postings structures over interned ids (the profiles' Vocabulary):
+
+- word postings with term frequencies (the ``\\b[a-z]{3,}\\b`` tokens the
+  feature code has always used), i.e. the exhibit x term count matrix stored
+  by column; with document frequencies and lengths this gives real IDF
+  weights, BM25 and TF-IDF scores as one pass over the query terms' postings;
+- letter-run postings (maximal ``[a-z]+`` runs), which answer "does this
+  term occur anywhere in the text" without scanning every text: a
+  letters-only term occurs exactly where a run containing it occurs, other
+  terms are verified only on the rows holding all of their letter pieces.
+
+``expanded_tf_idf_*``, ``expanded_coverage_*`` and ``expanded_hits*`` are
+counted from the same word and substring postings and equal the per-exhibit
+``QueryMatcher`` values in advanced_features.py exactly. The index
+is built once per ExhibitArrays, so once per catalog version for the
+resident catalog; per-term lookups are memoized.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from features import Vocabulary
+
+WORD_RE = re.compile(r'\b[a-z]{3,}\b')
+NON_LETTERS_RE = re.compile(r'[^a-z]+')
+
+GRAM = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Corpus-level columns added to ADVANCED_FEATURE_KEYS
+SCORE_FEATURE_KEYS = [
+    "bm25_name",
+    "bm25_desc",
+    "bm25_full",
+    "tfidf_full",
+]
+
+_EMPTY_ROWS = np.zeros(0, dtype=np.int64)
+
+
+def _postings(rows: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Group (row, id) pairs by id: sorted distinct ids, indptr, rows per id, and pair counts."""
+    if not len(ids):
+        return np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64), _EMPTY_ROWS, np.zeros(0)
+    order = np.lexsort((rows, ids))
+    ids, rows = ids[order], rows[order]
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = (ids[1:] != ids[:-1]) | (rows[1:] != rows[:-1])
+    starts = np.flatnonzero(first)
+    counts = np.diff(np.append(starts, len(ids))).astype(np.float64)
+    ids, rows = ids[starts], rows[starts]
+    distinct, per_id = np.unique(ids, return_counts=True)
+    indptr = np.zeros(len(distinct) + 1, dtype=np.int64)
+    np.cumsum(per_id, out=indptr[1:])
+    return distinct, indptr, rows.astype(np.int64), counts
+
+
+class TextField:
+    """Word and letter-run postings of one text field across an exhibit list."""
+
+    def __init__(self, texts: Sequence[str], tokens: Sequence[np.ndarray], runs: Sequence[np.ndarray], vocab: Vocabulary, max_terms: int = 4096):
+        """``tokens``: word ids in text order; ``runs``: sorted letter-run ids (both from exhibit profiles, interned in ``vocab``)."""
+        self.vocab = vocab
+        self.texts = list(texts)
+        self.n = len(self.texts)
+        self.nonempty = np.array([bool(t) for t in self.texts], dtype=bool).reshape(self.n)
+
+        lengths = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=self.n)
+        rows = np.repeat(np.arange(self.n, dtype=np.int64), lengths)
+        ids = np.concatenate(tokens) if self.n else np.zeros(0, dtype=np.int32)
+        self.word_ids, self.word_indptr, self.word_rows, self.word_tf = _postings(rows, ids)
+        self.doc_len = lengths.astype(np.float64)
+        self.avgdl = float(self.doc_len.mean()) if self.n else 0.0
+        df = np.diff(self.word_indptr).astype(np.float64)
+        self.idf_bm25 = np.log(1.0 + (self.n - df + 0.5) / (df + 0.5))
+        self.idf_tfidf = np.log((1.0 + self.n) / (1.0 + df)) + 1.0
+
+        lengths = np.fromiter((len(r) for r in runs), dtype=np.int64, count=self.n)
+        rows = np.repeat(np.arange(self.n, dtype=np.int64), lengths)
+        ids = np.concatenate(runs) if self.n else np.zeros(0, dtype=np.int32)
+        self.run_ids, self.run_indptr, self.run_rows, _ = _postings(rows, ids)
+        self.run_terms = [vocab.terms[i] for i in self.run_ids]
+        self._run_grams: Dict[str, Set[int]] | None = None
+
+        self.max_terms = max_terms
+        self._memo: OrderedDict[str, Tuple[np.ndarray, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _word_col(self, term: str) -> int:
+        """Column of an interned word, -1 if no exhibit has it."""
+        wid = self.vocab.ids.get(term)
+        if wid is None or not len(self.word_ids):
+            return -1
+        col = int(np.searchsorted(self.word_ids, wid))
+        return col if col < len(self.word_ids) and self.word_ids[col] == wid else -1
+
+    @property
+    def run_grams(self) -> Dict[str, Set[int]]:
+        """Letter-run columns by character n-gram, built on first use."""
+        if self._run_grams is None:
+            grams: Dict[str, Set[int]] = {}
+            for c, run in enumerate(self.run_terms):
+                for i in range(len(run) - GRAM + 1):
+                    grams.setdefault(run[i:i + GRAM], set()).add(c)
+            self._run_grams = grams
+        return self._run_grams
+
+    def _runs_containing(self, piece: str) -> List[int]:
+        """Run columns whose text contains ``piece``."""
+        if len(piece) < GRAM:
+            return [c for c, run in enumerate(self.run_terms) if piece in run]
+        postings = sorted((self.run_grams.get(piece[i:i + GRAM], set()) for i in range(len(piece) - GRAM + 1)), key=len)
+        return [c for c in set.intersection(*postings) if piece in self.run_terms[c]]
+
+    def _rows_with_piece(self, piece: str) -> np.ndarray:
+        parts = [self.run_rows[self.run_indptr[c]:self.run_indptr[c + 1]] for c in self._runs_containing(piece)]
+        return np.unique(np.concatenate(parts)) if parts else _EMPTY_ROWS
+
+    def term_rows(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows where ``term`` is a word of the text, and rows where it occurs as a substring."""
+        cached = self._memo.get(term)
+        if cached is not None:
+            return cached
+        col = self._word_col(term)
+        word_rows = self.word_rows[self.word_indptr[col]:self.word_indptr[col + 1]] if col >= 0 else _EMPTY_ROWS
+        pieces = [p for p in NON_LETTERS_RE.split(term) if p]
+        if pieces == [term]:
+            substring_rows = self._rows_with_piece(term)
+        else:
+            candidates = np.arange(self.n, dtype=np.int64)
+            for piece in pieces:
+                candidates = np.intersect1d(candidates, self._rows_with_piece(piece), assume_unique=True)
+            substring_rows = np.array([r for r in candidates if term in self.texts[r]], dtype=np.int64)
+        result = (word_rows, substring_rows)
+        with self._lock:
+            self._memo[term] = result
+            while len(self._memo) > self.max_terms:
+                self._memo.popitem(last=False)
+        return result
+
+    def scores(self, query_words: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """BM25 and TF-IDF (tf / length * smoothed idf) of the query words for every exhibit."""
+        bm25 = np.zeros(self.n)
+        tfidf = np.zeros(self.n)
+        for word in query_words:
+            col = self._word_col(word)
+            if col < 0:
+                continue
+            lo, hi = self.word_indptr[col], self.word_indptr[col + 1]
+            rows, tf = self.word_rows[lo:hi], self.word_tf[lo:hi]
+            dl = self.doc_len[rows]
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * dl / self.avgdl)
+            bm25[rows] += self.idf_bm25[col] * tf * (BM25_K1 + 1.0) / (tf + norm)
+            tfidf[rows] += self.idf_tfidf[col] * tf / dl
+        return bm25, tfidf
+
+
+class TextIndex:
+    """Name, description and full-text fields of an exhibit list (from cached exhibit profiles)."""
+
+    def __init__(self, profiles: Sequence[Any], vocab: Vocabulary):
+        self.n = len(profiles)
+        self.name = TextField([p.name_lower for p in profiles], [p.name_tokens for p in profiles], [p.name_runs for p in profiles], vocab)
+        self.desc = TextField([p.desc_lower for p in profiles], [p.desc_tokens for p in profiles], [p.desc_runs for p in profiles], vocab)
+        self.full = TextField([p.full_text for p in profiles], [p.full_tokens for p in profiles], [p.full_runs for p in profiles], vocab)
+
+    def build(self) -> None:
+        """Build the lazily-built parts now (e.g. ahead of a timed request)."""
+        for field in (self.name, self.desc, self.full):
+            field.run_grams
+
+    def columns(self, expanded_interests: List[str]) -> Dict[str, np.ndarray]:
+        """Expanded-query text features (see advanced_features.TEXT_FEATURE_KEYS) plus SCORE_FEATURE_KEYS."""
+        n = self.n
+        terms = [t.lower() for t in expanded_interests]
+        out: Dict[str, np.ndarray] = {}
+        for label, field in (("name", self.name), ("desc", self.desc), ("full", self.full)):
+            matches = np.zeros(n)
+            covered = np.zeros(n)
+            for term in terms:
+                word_rows, substring_rows = field.term_rows(term)
+                # A word match scores 1, a substring-only match 0.5 (word rows are substring rows too)
+                matches[substring_rows] += 0.5
+                matches[word_rows] += 0.5
+                covered[substring_rows] += 1
+            if terms:
+                out[f"expanded_tf_idf_{label}"] = np.where(field.nonempty, matches / len(terms), 0.0)
+                out[f"expanded_coverage_{label}"] = np.where(field.nonempty, covered / len(terms), 0.0)
+            else:
+                out[f"expanded_tf_idf_{label}"] = np.zeros(n)
+                out[f"expanded_coverage_{label}"] = np.zeros(n)
+            if label == "full":
+                out["expanded_hits"] = covered
+                out["expanded_hits_normalized"] = covered / len(terms) if terms else np.zeros(n)
+
+        query_words = sorted({w for t in terms for w in WORD_RE.findall(t)})
+        out["bm25_name"], _ = self.name.scores(query_words)
+        out["bm25_desc"], _ = self.desc.scores(query_words)
+        out["bm25_full"], out["tfidf_full"] = self.full.scores(query_words)
+        return out
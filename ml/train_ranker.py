@@ -10,18 +10,31 @@ Outputs:
  - ml/models/ranker.txt (LightGBM model)
  - ml/models/feature_keys.json
  - ml/artifacts/metrics.json
+ - ml/artifacts/datasets/train_<key>.npz (cached X/y/group; reused while the
+   catalog, profiles, feature schema and builder code are unchanged)
+ - ml/artifacts/datasets/stream_<key>/ (RANKER_SYNTHETIC_PROFILES=N: chunked
+   X/y of N generated profiles, streamed into LightGBM via lgb.Sequence)
 """
 
+import hashlib
+import inspect
 import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
 import numpy as np
 import lightgbm as lgb
 import requests
 
-from features import build_feature_vector, FEATURE_KEYS
+from features import build_feature_vector, build_feature_columns, FEATURE_KEYS
+from exhibit_profiles import exhibit_arrays
+from catalog import load_training_data
+from model_bundle import file_sha1, write_manifest
+from user_query import UserQuery
 
 # Try to import advanced features, fallback if not available
 try:
@@ -30,7 +43,7 @@ try:
     ml_dir = Path(__file__).parent
     if str(ml_dir) not in sys.path:
         sys.path.insert(0, str(ml_dir))
-    from advanced_features import build_advanced_features, ADVANCED_FEATURE_KEYS
+    from advanced_features import build_advanced_features, build_advanced_feature_columns, ADVANCED_FEATURE_KEYS
     HAS_ADVANCED = True
 except (ImportError, AttributeError) as e:
     print(f"Note: Advanced features not available: {e}")
@@ -51,29 +64,7 @@ def fetch_exhibits(backend_url: str) -> List[Dict[str, Any]]:
             print(f"Loading exhibits from: {file_path}")
             if file_path.suffix == ".jsonl":
                 # Read JSONL format (training_data.jsonl)
-                exhibits = []
-                with open(file_path, "r", encoding="utf-8") as f:
-                    for line in f:
-                        if line.strip():
-                            obj = json.loads(line)
-                            # Convert from training_data format to exhibit format
-                            ctx = obj.get("context", {})
-                            ex = {
-                                "id": obj.get("id", ""),
-                                "name": ctx.get("name", ""),
-                                "description": ctx.get("description", ""),
-                                "category": ctx.get("category", ""),
-                                "exhibitType": ctx.get("exhibitType", ""),
-                                "ageRange": ctx.get("ageRange", ""),
-                                "interactiveFeatures": ctx.get("features", []),
-                                "averageTime": ctx.get("duration", 0),
-                                "rating": ctx.get("rating", 0),
-                            }
-                            # Extract tags from category or features
-                            tags = ctx.get("features", [])
-                            if tags:
-                                ex["tags"] = tags
-                            exhibits.append(ex)
+                exhibits = load_training_data(file_path)
                 if exhibits:
                     return exhibits
             elif file_path.suffix == ".json":
@@ -134,118 +125,321 @@ def synthetic_user_profiles() -> List[Dict[str, Any]]:
     ]
 
 
-def label_exhibit(user: Dict[str, Any], exhibit: Dict[str, Any]) -> int:
-    # Use advanced features if available for better labeling
-    if HAS_ADVANCED:
-        try:
-            f = build_advanced_features(user, exhibit)
-            # Add expanded features to scoring
-            expanded_bonus = (
-                f.get("expanded_coverage_full", 0) * 2.0 +
-                f.get("bigram_overlap", 0) * 1.5 +
-                f.get("expanded_tf_idf_full", 0) * 1.0
-            )
-        except Exception:
-            f = build_feature_vector(user, exhibit)
-            expanded_bonus = 0.0
-    else:
-        f = build_feature_vector(user, exhibit)
-        expanded_bonus = 0.0
-    
-    interests = [x.strip() for x in (user.get("interests") or []) if x]
-    
+def relevance_labels(f: Dict[str, Any], has_interests: bool) -> np.ndarray:
+    """Integer relevance 0..5 from feature columns (arrays) or one feature row (scalars)."""
+    def col(key: str) -> np.ndarray:
+        return np.asarray(f.get(key, 0), dtype=np.float64)
+
     # If no interests, return low relevance
-    if not interests:
-        return 0
-    
+    if not has_interests:
+        return np.zeros(np.shape(col("tag_hits")), dtype=np.int32)
+
+    # Add expanded features to scoring (all zero without advanced features)
+    expanded_bonus = (
+        col("expanded_coverage_full") * 2.0 +
+        col("bigram_overlap") * 1.5 +
+        col("expanded_tf_idf_full") * 1.0
+    )
+
     # Enhanced label: STRICT matching - prioritize exact interest matches
     # Maximum weights for best ranking with strict interest matching
-    tag_hits = f.get("tag_hits", 0)
-    category_hits = f.get("category_hits", 0)
-    interest_jaccard = f.get("interest_jaccard", 0)
-    
+    tag_hits = col("tag_hits")
+    category_hits = col("category_hits")
+    interest_jaccard = col("interest_jaccard")
+
     # CRITICAL: If no direct tag/category match, heavily penalize
-    has_direct_match = tag_hits > 0 or category_hits > 0 or interest_jaccard > 0.3
-    
+    has_direct_match = (tag_hits > 0) | (category_hits > 0) | (interest_jaccard > 0.3)
+
     score = (
         10.0 * tag_hits  # CRITICAL: Direct tag matches (increased from 6.0)
         + 8.0 * category_hits  # CRITICAL: Category matches (increased from 5.5)
         + 7.0 * interest_jaccard  # CRITICAL: Tag/feature overlap (increased from 4.5)
-        + 5.0 * f.get("desc_similarity", 0)  # Text similarity
-        + 4.0 * f.get("category_similarity", 0)  # Category similarity
-        + 3.0 * f.get("interest_hits", 0)  # Text matches in name/desc
-        + 3.0 * f.get("name_similarity", 0)  # Name similarity
-        + 2.0 * f.get("name_hits", 0)  # Name matches
-        + 2.0 * f.get("category_match", 0)  # Enhanced category match
-        + 1.5 * f.get("age_match", 0)
-        + 1.2 * f.get("group_match", 0)
-        + 0.8 * f.get("desc_hits", 0)  # Description hits
-        + 0.3 * f.get("category_known", 0)
+        + 5.0 * col("desc_similarity")  # Text similarity
+        + 4.0 * col("category_similarity")  # Category similarity
+        + 3.0 * col("interest_hits")  # Text matches in name/desc
+        + 3.0 * col("name_similarity")  # Name similarity
+        + 2.0 * col("name_hits")  # Name matches
+        + 2.0 * col("category_match")  # Enhanced category match
+        + 1.5 * col("age_match")
+        + 1.2 * col("group_match")
+        + 0.8 * col("desc_hits")  # Description hits
+        + 0.3 * col("category_known")
         + expanded_bonus  # Bonus from advanced features
     )
-    
+
     # STRICT PENALTY: If no direct match, heavily reduce score
-    if not has_direct_match:
-        score *= 0.1  # Reduce to 10% if no direct match
-    
+    score = np.where(has_direct_match, score, score * 0.1)  # Reduce to 10% if no direct match
+
     # STRICT BONUS: Heavily reward direct interest matches
-    strong_signals = sum([
-        1 if f.get("tag_hits", 0) > 0 else 0,
-        1 if f.get("category_hits", 0) > 0 else 0,
-        1 if f.get("interest_jaccard", 0) > 0.3 else 0,  # Direct overlap
-        1 if f.get("desc_similarity", 0) > 0.3 else 0,
-        1 if f.get("expanded_coverage_full", 0) > 0.3 else 0,
-    ])
+    strong_signals = (
+        (tag_hits > 0).astype(np.int32)
+        + (category_hits > 0)
+        + (interest_jaccard > 0.3)  # Direct overlap
+        + (col("desc_similarity") > 0.3)
+        + (col("expanded_coverage_full") > 0.3)
+    )
     # CRITICAL: Direct tag/category matches get huge bonus
-    if tag_hits > 0 or category_hits > 0:
-        score += 5.0  # Massive bonus for direct matches
-    if strong_signals >= 3:
-        score += 3.0  # Big bonus for multiple strong matches
-    elif strong_signals >= 2:
-        score += 2.0  # Medium bonus
-    
+    score = np.where((tag_hits > 0) | (category_hits > 0), score + 5.0, score)  # Massive bonus for direct matches
+    score = np.where(strong_signals >= 3, score + 3.0, np.where(strong_signals >= 2, score + 2.0, score))
+
     # Quantize to integer relevance levels 0..5 with STRICT matching
     # Direct matches get highest scores
-    if has_direct_match:
-        if score >= 20.0:
-            return 5  # Perfect direct match - should be top-1
-        if score >= 12.0:
-            return 4  # Excellent direct match - should be top-3
-        if score >= 8.0:
-            return 3  # Good direct match - should be top-10
-        if score >= 4.0:
-            return 2  # Moderate direct match - should be top-20
-        if score >= 1.5:
-            return 1  # Weak direct match - should be top-50
-    # No direct match - very low score
-    if score >= 2.0:
-        return 1  # Only if score is still high despite no direct match
-    return 0  # No match
-
-
-def build_training_arrays(users: List[Dict[str, Any]], exhibits: List[Dict[str, Any]], use_advanced: bool = True):
-    X_rows: List[List[float]] = []
-    y_vals: List[int] = []
-    qid_counts: List[int] = []
+    direct = np.select(
+        [score >= 20.0, score >= 12.0, score >= 8.0, score >= 4.0, score >= 1.5],
+        [5, 4, 3, 2, 1],  # top-1, top-3, top-10, top-20, top-50
+        default=0,
+    )
+    # No direct match - very low score (1 only if the score is still high)
+    indirect = np.where(score >= 2.0, 1, 0)
+    return np.where(has_direct_match, direct, indirect).astype(np.int32)
+
+
+def label_exhibit(user: Dict[str, Any] | UserQuery, exhibit: Dict[str, Any]) -> int:
+    # Pass a UserQuery to reuse the user-side work across a user's exhibits
+    user = UserQuery.of(user)
+    # Use advanced features if available for better labeling
+    if HAS_ADVANCED:
+        try:
+            f = build_advanced_features(user, exhibit)
+        except Exception:
+            f = build_feature_vector(user, exhibit)
+    else:
+        f = build_feature_vector(user, exhibit)
+    return int(relevance_labels(f, bool(user.interests)))
+
+
+# LightGBM threads per training run (RANKER_TRAIN_THREADS; 0 = all cores). force_col_wise
+# builds each feature's histogram on one thread, so models do not depend on the count
+TRAIN_THREADS = int(os.getenv("RANKER_TRAIN_THREADS", "0"))
+
+# Users featurized per process-pool task
+USERS_PER_TASK = 8
+
+# Worker-process state set by _init_worker: the exhibits, their shared arrays and the profile generator
+_worker_exhibits: List[Dict[str, Any]] = []
+_worker_arrays: Any = None
+_worker_generator: Any = None
+
+
+def _featurize_users(users: List[Dict[str, Any]], exhibits: List[Dict[str, Any]], arrays: Any, feature_keys: List[str], use_advanced: bool):
+    """Feature rows and labels of ``users`` x ``exhibits``; each pair is featurized once."""
+    X = np.empty((len(users) * len(exhibits), len(feature_keys)), dtype=np.float32)
+    y = np.empty(len(users) * len(exhibits), dtype=np.int32)
+    for q, user in enumerate(users):
+        # User-side data is compiled once per query, not once per exhibit
+        query = UserQuery(user)
+        if use_advanced:
+            columns = build_advanced_feature_columns(query, exhibits, arrays)
+        else:
+            columns = build_feature_columns(query, arrays)
+        rows = slice(q * len(exhibits), (q + 1) * len(exhibits))
+        for j, key in enumerate(feature_keys):
+            X[rows, j] = columns[key]
+        # Labels read the same columns instead of featurizing every pair again
+        y[rows] = relevance_labels(columns, bool(query.interests))
+    return X, y
+
+
+def _init_worker(exhibits: List[Dict[str, Any]], generator: Any = None) -> None:
+    global _worker_exhibits, _worker_arrays, _worker_generator
+    _worker_exhibits = exhibits
+    _worker_arrays = exhibit_arrays(exhibits)
+    _worker_generator = generator
+
+
+def _featurize_task(users: List[Dict[str, Any]], feature_keys: List[str], use_advanced: bool):
+    return _featurize_users(users, _worker_exhibits, _worker_arrays, feature_keys, use_advanced)
+
+
+def build_training_arrays(users: List[Dict[str, Any]], exhibits: List[Dict[str, Any]], use_advanced: bool = True, workers: int = 1):
+    """X, y, per-query group sizes and feature keys; ``workers`` > 1 fans users out to a process pool."""
+    use_advanced = use_advanced and HAS_ADVANCED
+    feature_keys = ADVANCED_FEATURE_KEYS if use_advanced else FEATURE_KEYS
+    qid_counts = [len(exhibits)] * len(users)
+    tasks = [users[i:i + USERS_PER_TASK] for i in range(0, len(users), USERS_PER_TASK)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker, initargs=(exhibits,)) as pool:
+            parts = list(pool.map(_featurize_task, tasks, repeat(feature_keys), repeat(use_advanced)))
+    else:
+        # Exhibit-side arrays are shared by every query
+        arrays = exhibit_arrays(exhibits)
+        parts = [_featurize_users(chunk, exhibits, arrays, feature_keys, use_advanced) for chunk in tasks]
+    if not parts:
+        return np.zeros((0, len(feature_keys)), dtype=np.float32), np.zeros(0, dtype=np.int32), qid_counts, feature_keys
+    X = np.concatenate([X for X, _ in parts])
+    y = np.concatenate([y for _, y in parts])
+    return X, y, qid_counts, feature_keys
+
+
+# Builder modules whose source enters the training-data cache key
+BUILDER_SOURCES = ("features.py", "advanced_features.py", "text_index.py", "exhibit_profiles.py", "user_query.py")
+# Cached training sets kept in the cache directory (most recent first)
+MAX_CACHED_DATASETS = 4
+
+
+def dataset_cache_key(users: Any, exhibits: List[Dict[str, Any]], feature_keys: List[str]) -> str:
+    """Content key of a training set: exhibit catalog, profile set (or a JSON description of
+    a generated one), feature schema and builder code."""
+    import feature_schema
+    h = hashlib.sha1()
+    h.update(json.dumps(exhibits, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8"))
+    h.update(b"\0")
+    h.update(json.dumps(users, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8"))
+    h.update(b"\0" + feature_schema.schema_hash(feature_keys).encode("ascii"))
+    # A changed feature or label definition must not reuse rows built by the old one
+    ml_dir = Path(__file__).resolve().parent
+    for name in BUILDER_SOURCES:
+        h.update(file_sha1(ml_dir / name).encode("ascii"))
+    h.update(inspect.getsource(relevance_labels).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def load_or_build_training_arrays(users: List[Dict[str, Any]], exhibits: List[Dict[str, Any]], use_advanced: bool = True, workers: int = 1, cache_dir: Path | None = None):
+    """build_training_arrays behind an on-disk .npz cache (``cache_dir`` None disables it)."""
     feature_keys = ADVANCED_FEATURE_KEYS if (use_advanced and HAS_ADVANCED) else FEATURE_KEYS
-    
-    for _qid, user in enumerate(users):
-        count = 0
-        for ex in exhibits:
-            if use_advanced and HAS_ADVANCED:
-                fv = build_advanced_features(user, ex)
-            else:
-                fv = build_feature_vector(user, ex)
-            X_rows.append([fv.get(k, 0.0) for k in feature_keys])
-            y_vals.append(label_exhibit(user, ex))
-            count += 1
-        qid_counts.append(count)
-    X = np.array(X_rows, dtype=np.float32)
-    y = np.array(y_vals, dtype=np.int32)
+    if cache_dir is None:
+        return build_training_arrays(users, exhibits, use_advanced=use_advanced, workers=workers)
+
+    path = cache_dir / f"train_{dataset_cache_key(users, exhibits, feature_keys)}.npz"
+    if path.exists():
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if [str(k) for k in data["feature_keys"]] == list(feature_keys):
+                    print(f"Loaded cached training data: {path}")
+                    return data["X"], data["y"], data["group"].tolist(), feature_keys
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable training-data cache {path}: {e}")
+
+    X, y, qid_counts, feature_keys = build_training_arrays(users, exhibits, use_advanced=use_advanced, workers=workers)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, X=X, y=y, group=np.asarray(qid_counts, dtype=np.int64), feature_keys=np.asarray(feature_keys))
+    os.replace(tmp, path)
+    stale = sorted(cache_dir.glob("train_*.npz"), key=lambda p: p.stat().st_mtime, reverse=True)[MAX_CACHED_DATASETS:]
+    for old in stale:
+        old.unlink(missing_ok=True)
+    print(f"Cached training data: {path}")
     return X, y, qid_counts, feature_keys
 
 
-def train_lambdamart(X: np.ndarray, y: np.ndarray, qid_counts: List[int], feature_names: List[str] = None) -> Dict[str, Any]:
+class ChunkSequence(lgb.Sequence):
+    """One stored chunk's rows, memory-mapped, as a LightGBM Sequence (optionally a column subset)."""
+
+    batch_size = 4096
+
+    def __init__(self, path: Path, columns: List[int] | None = None):
+        self.X = np.load(path, mmap_mode="r")
+        self.columns = columns
+
+    def __getitem__(self, idx):
+        rows = self.X[idx]
+        # lgb.Sequence batches must be float64
+        return np.asarray(rows if self.columns is None else rows[..., self.columns], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.X)
+
+
+def _write_chunk(store_dir: Path, index: int, size: int, generator: Any, exhibits: List[Dict[str, Any]], arrays: Any, feature_keys: List[str], use_advanced: bool) -> int:
+    X, y = _featurize_users(generator.chunk(index, size), exhibits, arrays, feature_keys, use_advanced)
+    np.save(store_dir / f"X_{index:05d}.npy", X)
+    np.save(store_dir / f"y_{index:05d}.npy", y)
+    return len(y)
+
+
+def _write_chunk_task(store_dir: Path, index: int, size: int, feature_keys: List[str], use_advanced: bool) -> int:
+    return _write_chunk(store_dir, index, size, _worker_generator, _worker_exhibits, _worker_arrays, feature_keys, use_advanced)
+
+
+class ChunkStore:
+    """Featurized query groups on disk: X_<i>.npy and y_<i>.npy per profile chunk, then manifest.json.
+
+    Chunks are written one at a time (by a process pool when workers > 1)
+    and read back memory-mapped, so the full X matrix is never held in
+    memory. The manifest is written last and marks the store complete.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        manifest = path / "manifest.json"
+        self.manifest: Dict[str, Any] | None = json.loads(manifest.read_text()) if manifest.exists() else None
+
+    @property
+    def complete(self) -> bool:
+        return self.manifest is not None
+
+    @property
+    def n_queries(self) -> int:
+        return sum(c["queries"] for c in self.manifest["chunks"])
+
+    def write(self, generator: Any, n_profiles: int, exhibits: List[Dict[str, Any]], chunk_size: int = 1000, use_advanced: bool = True, workers: int = 1) -> None:
+        """Featurize ``n_profiles`` generated profiles against ``exhibits``."""
+        use_advanced = use_advanced and HAS_ADVANCED
+        feature_keys = ADVANCED_FEATURE_KEYS if use_advanced else FEATURE_KEYS
+        sizes = generator.chunk_sizes(n_profiles, chunk_size)
+        self.path.mkdir(parents=True, exist_ok=True)
+        if workers > 1 and len(sizes) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(sizes)), initializer=_init_worker, initargs=(exhibits, generator)) as pool:
+                rows = list(pool.map(_write_chunk_task, repeat(self.path), range(len(sizes)), sizes, repeat(feature_keys), repeat(use_advanced)))
+        else:
+            arrays = exhibit_arrays(exhibits)
+            rows = [_write_chunk(self.path, i, size, generator, exhibits, arrays, feature_keys, use_advanced) for i, size in enumerate(sizes)]
+        self.manifest = {
+            "feature_keys": list(feature_keys),
+            "exhibits": len(exhibits),
+            "chunks": [{"index": i, "queries": size, "rows": n} for i, (size, n) in enumerate(zip(sizes, rows))],
+        }
+        (self.path / "manifest.json").write_text(json.dumps(self.manifest, indent=2))
+
+    def iter_chunks(self) -> Iterator[Tuple[np.ndarray, np.ndarray, List[int]]]:
+        """(X memmap, y, per-query group sizes) per chunk."""
+        for c in self.manifest["chunks"]:
+            X = np.load(self.path / f"X_{c['index']:05d}.npy", mmap_mode="r")
+            y = np.load(self.path / f"y_{c['index']:05d}.npy")
+            yield X, y, [self.manifest["exhibits"]] * c["queries"]
+
+    def datasets(self, feature_names: List[str], columns: List[int] | None = None, valid_fraction: float = 0.1) -> Tuple[lgb.Dataset, lgb.Dataset | None]:
+        """Train and validation Datasets built from the chunks; whole trailing chunks (queries) are held out."""
+        chunks = self.manifest["chunks"]
+        n_valid = int(round(len(chunks) * valid_fraction)) if len(chunks) > 1 else 0
+        n_valid = max(n_valid, 1) if len(chunks) > 1 else 0
+
+        def build(part: List[Dict[str, Any]], reference: lgb.Dataset | None = None) -> lgb.Dataset:
+            seqs = [ChunkSequence(self.path / f"X_{c['index']:05d}.npy", columns) for c in part]
+            label = np.concatenate([np.load(self.path / f"y_{c['index']:05d}.npy") for c in part])
+            group = np.full(sum(c["queries"] for c in part), self.manifest["exhibits"], dtype=np.int32)
+            return lgb.Dataset(seqs, label=label, group=group, feature_name=feature_names, reference=reference)
+
+        train_data = build(chunks[: len(chunks) - n_valid])
+        valid_data = build(chunks[len(chunks) - n_valid:], reference=train_data) if n_valid else None
+        return train_data, valid_data
+
+
+def synthetic_chunk_store(n_profiles: int, seed: int, exhibits: List[Dict[str, Any]], cache_dir: Path, chunk_size: int = 1000, use_advanced: bool = True, workers: int = 1, refresh: bool = False) -> ChunkStore:
+    """A complete ChunkStore of ``n_profiles`` generated profiles, reused when the inputs are unchanged (unless ``refresh``)."""
+    from synthetic_profiles import ProfileGenerator
+    feature_keys = ADVANCED_FEATURE_KEYS if (use_advanced and HAS_ADVANCED) else FEATURE_KEYS
+    generator_source = file_sha1(Path(__file__).resolve().parent / "synthetic_profiles.py")
+    description = {"synthetic": n_profiles, "seed": seed, "chunk_size": chunk_size, "generator": generator_source}
+    store = ChunkStore(cache_dir / f"stream_{dataset_cache_key(description, exhibits, feature_keys)}")
+    if store.complete and not refresh:
+        print(f"Loaded cached training chunks: {store.path}")
+        return store
+    store.write(ProfileGenerator(seed, exhibits), n_profiles, exhibits, chunk_size=chunk_size, use_advanced=use_advanced, workers=workers)
+    print(f"Wrote {len(store.manifest['chunks'])} training chunks: {store.path}")
+    stale = sorted(cache_dir.glob("stream_*"), key=lambda p: p.stat().st_mtime, reverse=True)[MAX_CACHED_DATASETS:]
+    for old in stale:
+        shutil.rmtree(old, ignore_errors=True)
+    return store
+
+
+def train_lambdamart(X: np.ndarray, y: np.ndarray, qid_counts: List[int], feature_names: List[str] = None, params_override: Dict[str, Any] | None = None, max_rounds: int = 500) -> Dict[str, Any]:
+    train_data, valid_data = split_datasets(X, y, qid_counts, feature_names)
+    return train_lambdamart_datasets(train_data, valid_data, len(qid_counts), params_override=params_override, max_rounds=max_rounds)
+
+
+def split_datasets(X: np.ndarray, y: np.ndarray, qid_counts: List[int], feature_names: List[str] = None) -> Tuple[lgb.Dataset, lgb.Dataset | None]:
+    """Train/validation Datasets: the first 80% of every query's rows train, the rest validate."""
     # Split into train/validation for better evaluation
     train_indices = []
     val_indices = []
@@ -279,7 +473,10 @@ def train_lambdamart(X: np.ndarray, y: np.ndarray, qid_counts: List[int], featur
         val_qid_counts = [c - int(c * 0.8) for c in qid_counts if c > int(c * 0.8)]
         if val_qid_counts:
             valid_data = lgb.Dataset(X_val, label=y_val, group=val_qid_counts, reference=train_data)
-    
+    return train_data, valid_data
+
+
+def lambdamart_params(params_override: Dict[str, Any] | None = None) -> Dict[str, Any]:
     params = {
         "objective": "lambdarank",
         "metric": ["ndcg"],
@@ -292,19 +489,33 @@ def train_lambdamart(X: np.ndarray, y: np.ndarray, qid_counts: List[int], featur
         "verbosity": -1,
         "force_col_wise": True,
         "boosting_type": "gbdt",
-        "num_threads": 1,
+        "num_threads": TRAIN_THREADS,
         "lambda_l1": 0.05,  # Reduced regularization for better recall
         "lambda_l2": 0.05,
         "min_gain_to_split": 0.0,  # Allow more splits
         "max_bin": 255,  # More bins for precision
     }
-    
+    params.update(params_override or {})
+    return params
+
+
+def boosting_rounds(n_queries: int, max_rounds: int = 500) -> int:
     # More rounds with validation monitoring for better convergence
-    num_rounds = min(500, max(200, len(qid_counts) * 6))
-    
+    return min(max_rounds, max(200, n_queries * 6))
+
+
+def lambdamart_callbacks(valid_data: lgb.Dataset | None) -> List[Any]:
     callbacks = [lgb.log_evaluation(50)]  # Log every 50 rounds
     if valid_data:
         callbacks.append(lgb.early_stopping(30))  # Early stopping with validation
+    return callbacks
+
+
+def train_lambdamart_datasets(train_data: lgb.Dataset, valid_data: lgb.Dataset | None, n_queries: int, params_override: Dict[str, Any] | None = None, max_rounds: int = 500) -> Dict[str, Any]:
+    """Boost on prepared Datasets (in-memory or ChunkStore-backed)."""
+    params = lambdamart_params(params_override)
+    num_rounds = boosting_rounds(n_queries, max_rounds)
+    callbacks = lambdamart_callbacks(valid_data)
     
     model = lgb.train(
         params, 
@@ -324,6 +535,55 @@ def train_lambdamart(X: np.ndarray, y: np.ndarray, qid_counts: List[int], featur
     }
 
 
+def train_secondary(params: Dict[str, Any], train_data: lgb.Dataset, valid_data: lgb.Dataset | None, num_rounds: int, callbacks: List[Any] | None = None) -> lgb.Booster:
+    """Second ensemble member: the primary's ``params`` with a different structure and fewer rounds."""
+    params_secondary = params.copy()
+    params_secondary["learning_rate"] = 0.03  # Different learning rate
+    params_secondary["num_leaves"] = 191  # Different structure
+    params_secondary["max_depth"] = 13  # Slightly different depth
+    params_secondary["min_data_in_leaf"] = 3
+    return lgb.train(
+        params_secondary,
+        train_data,
+        valid_sets=[valid_data] if valid_data else None,
+        valid_names=["validation"] if valid_data else None,
+        num_boost_round=int(num_rounds * 0.8),  # Fewer rounds for diversity
+        callbacks=callbacks
+    )
+
+
+def train_stage1(feature_keys: List[str], store: ChunkStore | None = None, X: np.ndarray | None = None, y: np.ndarray | None = None, qid_counts: List[int] | None = None) -> lgb.Booster:
+    """Small base-feature model for the ranker service's cascade first stage, from a ChunkStore or in-memory arrays."""
+    base_columns = [feature_keys.index(k) for k in FEATURE_KEYS]
+    stage1_params = {"num_leaves": 15, "max_depth": 4, "learning_rate": 0.05}
+    if store is not None:
+        stage1 = train_lambdamart_datasets(
+            *store.datasets(FEATURE_KEYS, columns=base_columns), store.n_queries,
+            params_override=stage1_params, max_rounds=200,
+        )
+    else:
+        stage1 = train_lambdamart(
+            X[:, base_columns], y, qid_counts, feature_names=FEATURE_KEYS,
+            params_override=stage1_params, max_rounds=200,
+        )
+    return stage1["model"]
+
+
+def avg_label_top10(model: lgb.Booster, chunks: Iterable[Tuple[np.ndarray, np.ndarray, List[int]]]) -> float:
+    """Mean label of each query's model top-10, over (X, y, group sizes) chunks."""
+    top_labels: List[float] = []
+    for X_chunk, y_chunk, counts in chunks:
+        preds = model.predict(np.asarray(X_chunk))
+        idx = 0
+        for count in counts:
+            q_slice = slice(idx, idx + count)
+            order = np.argsort(-preds[q_slice])  # descending
+            top = y_chunk[q_slice][order][:10]
+            top_labels.append(float(np.mean(top)))
+            idx += count
+    return float(np.mean(top_labels)) if top_labels else 0.0
+
+
 def main() -> int:
     backend_url = os.getenv("BACKEND_URL", "http://localhost:5000/api")
     base = Path(__file__).resolve().parent
@@ -338,15 +598,33 @@ def main() -> int:
         return 1
     
     print(f"Loaded {len(exhibits)} exhibits")
-    users = synthetic_user_profiles()
-    print(f"Generated {len(users)} user profiles")
     
     # Train with advanced features
     use_advanced = HAS_ADVANCED
     print(f"Using advanced features: {use_advanced}")
-    X, y, qid_counts, feature_keys = build_training_arrays(users, exhibits, use_advanced=use_advanced)
-    print(f"Built training data: {len(X)} samples, {len(users)} queries, {len(feature_keys)} features")
-    out = train_lambdamart(X, y, qid_counts, feature_names=feature_keys)
+    # RANKER_TRAIN_WORKERS processes featurize the profiles; RANKER_DATASET_CACHE=0 always rebuilds
+    workers = int(os.getenv("RANKER_TRAIN_WORKERS", str(os.cpu_count() or 1)))
+    use_cache = os.getenv("RANKER_DATASET_CACHE", "1") != "0"
+    # RANKER_SYNTHETIC_PROFILES=N trains on N generated profiles (seed RANKER_SYNTHETIC_SEED)
+    # streamed through on-disk chunks instead of the hand-written profiles held in memory
+    n_synthetic = int(os.getenv("RANKER_SYNTHETIC_PROFILES", "0"))
+    store: ChunkStore | None = None
+    if n_synthetic > 0:
+        store = synthetic_chunk_store(
+            n_synthetic, int(os.getenv("RANKER_SYNTHETIC_SEED", "0")), exhibits, artifacts_dir / "datasets",
+            chunk_size=int(os.getenv("RANKER_SYNTHETIC_CHUNK", "1000")), use_advanced=use_advanced, workers=workers, refresh=not use_cache,
+        )
+        feature_keys = store.manifest["feature_keys"]
+        n_queries = store.n_queries
+        print(f"Built training data: {n_queries * len(exhibits)} samples, {n_queries} queries, {len(feature_keys)} features")
+        out = train_lambdamart_datasets(*store.datasets(feature_keys), n_queries)
+    else:
+        users = synthetic_user_profiles()
+        print(f"Generated {len(users)} user profiles")
+        cache_dir = artifacts_dir / "datasets" if use_cache else None
+        X, y, qid_counts, feature_keys = load_or_build_training_arrays(users, exhibits, use_advanced=use_advanced, workers=workers, cache_dir=cache_dir)
+        print(f"Built training data: {len(X)} samples, {len(users)} queries, {len(feature_keys)} features")
+        out = train_lambdamart(X, y, qid_counts, feature_names=feature_keys)
     model: lgb.Booster = out["model"]
     params = out.get("params")
     train_data = out.get("train_data")
@@ -363,37 +641,29 @@ def main() -> int:
     # Also save secondary model with different parameters for ensemble
     if use_advanced and params and train_data:
         print("Training secondary model for ensemble...")
-        params_secondary = params.copy()
-        params_secondary["learning_rate"] = 0.03  # Different learning rate
-        params_secondary["num_leaves"] = 191  # Different structure
-        params_secondary["max_depth"] = 13  # Slightly different depth
-        params_secondary["min_data_in_leaf"] = 3
-        model_secondary = lgb.train(
-            params_secondary,
-            train_data,
-            valid_sets=[valid_data] if valid_data else None,
-            valid_names=["validation"] if valid_data else None,
-            num_boost_round=int(num_rounds * 0.8),  # Fewer rounds for diversity
-            callbacks=callbacks
-        )
+        model_secondary = train_secondary(params, train_data, valid_data, num_rounds, callbacks)
         secondary_path = models_dir / "ranker_secondary.txt"
         model_secondary.save_model(str(secondary_path))
         print(f"Secondary model saved to: {secondary_path}")
 
+        # Small base-feature model for the ranker service's cascade first stage
+        print("Training stage-1 cascade model (base features)...")
+        stage1 = train_stage1(feature_keys, store) if store is not None else train_stage1(feature_keys, X=X, y=y, qid_counts=qid_counts)
+        stage1_path = models_dir / "ranker_stage1.txt"
+        stage1.save_model(str(stage1_path))
+        print(f"Stage-1 model saved to: {stage1_path}")
+
     # Simple metric: average label@top10 using model preds on training
-    preds = model.predict(X)
-    # Compute mean label among top-10 per query
-    top_labels: List[float] = []
-    idx = 0
-    for count in qid_counts:
-        q_slice = slice(idx, idx + count)
-        order = np.argsort(-preds[q_slice])  # descending
-        top = y[q_slice][order][:10]
-        top_labels.append(float(np.mean(top)))
-        idx += count
-    avg_top10 = float(np.mean(top_labels)) if top_labels else 0.0
+    chunks = store.iter_chunks() if store is not None else [(X, y, qid_counts)]
+    avg_top10 = avg_label_top10(model, chunks)
     (artifacts_dir / "metrics.json").write_text(json.dumps({"avg_label_top10": avg_top10}, indent=2))
 
+    # Written last: a running ranker service swaps in the new bundle once this appears
+    import feature_schema
+    schema = feature_schema.lookup(feature_keys) or feature_schema.FeatureSchema("unregistered", feature_keys)
+    manifest = write_manifest(models_dir, extra={"feature_schema": schema.info()})
+    print(f"Model bundle {manifest['version']} written to: {models_dir / 'bundle.json'}")
+
     print(f"Trained ranker saved to: {model_path}")
     print(f"Metrics saved to: {artifacts_dir / 'metrics.json'}")
     return 0
@@ -0,0 +1,291 @@
+"""
+Pure-NumPy evaluator for LightGBM text models.
+
+For the 50-500 rows of a ranking request, most of ``lgb.Booster.predict``'s
+time is per-call overhead rather than tree traversal. ``TreeEnsemble`` parses
+the text model dump (ranker.txt, ranker_secondary.txt) into flat arrays, one
+entry per node across all trees, and walks every (row, tree) pair down the
+trees one level at a time with vectorized gathers. Several models can be fused
+into one ensemble so the ranker's primary and secondary boosters are evaluated
+in a single pass.
+
+Scores match ``Booster.predict`` exactly (raw scores; LightGBM's decision
+rules for missing values and zeros are reproduced, and tree outputs are summed
+sequentially in float64 like LightGBM does). Models with categorical splits
+or linear trees are rejected with ValueError so callers can fall back to
+LightGBM.
+
+The level walk does ``max_depth`` steps for every (row, tree) pair, so it wins
+for small and shallow ensembles like the shipped rankers; for hundreds of deep
+trees LightGBM's native traversal is faster. EnsembleRanker times both at load
+and keeps the faster one; bench_tree_eval.py reports the crossover.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# LightGBM's zero threshold (kZeroThreshold in meta.h)
+K_ZERO_THRESHOLD = 1e-35
+
+# decision_type bit layout (tree.h)
+_CATEGORICAL_MASK = 1
+_DEFAULT_LEFT_MASK = 2
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+
+def _parse_model_text(text: str) -> Dict[str, object]:
+    """Header fields and per-tree key/value blocks of a LightGBM text model."""
+    header: Dict[str, str] = {}
+    trees: List[Dict[str, str]] = []
+    current: Optional[Dict[str, str]] = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("Tree="):
+            current = {}
+            trees.append(current)
+            continue
+        if line == "end of trees":
+            break
+        key, sep, value = line.partition("=")
+        if current is None:
+            header[key] = value if sep else ""
+        elif sep:
+            current[key] = value
+    return {"header": header, "trees": trees}
+
+
+class TreeEnsemble:
+    """Flattened trees of one or more LightGBM models, evaluated level by level."""
+
+    def __init__(self, trees: List[Dict[str, str]], num_feature: int, average_output: bool = False):
+        feature: List[int] = []
+        threshold: List[float] = []
+        missing_type: List[int] = []
+        default_left: List[bool] = []
+        left: List[int] = []
+        right: List[int] = []
+        leaf_value: List[float] = []
+        roots: List[int] = []
+        max_depth = 0
+
+        for tree in trees:
+            if int(tree.get("num_cat", "0")) > 0:
+                raise ValueError("categorical splits are not supported")
+            if int(tree.get("is_linear", "0")):
+                raise ValueError("linear trees are not supported")
+            num_leaves = int(tree["num_leaves"])
+            node_base = len(feature)
+            leaf_base = len(leaf_value)
+            leaf_value.extend(float(v) for v in tree["leaf_value"].split())
+            if num_leaves == 1:
+                # Single-leaf tree: the root is the leaf
+                roots.append(~leaf_base)
+                continue
+
+            def child(c: int) -> int:
+                # Internal children become global node ids, leaves ~global leaf id
+                return node_base + c if c >= 0 else ~(leaf_base + ~c)
+
+            decision = [int(v) for v in tree["decision_type"].split()]
+            if any(d & _CATEGORICAL_MASK for d in decision):
+                raise ValueError("categorical splits are not supported")
+            feature.extend(int(v) for v in tree["split_feature"].split())
+            threshold.extend(float(v) for v in tree["threshold"].split())
+            missing_type.extend((d >> 2) & 3 for d in decision)
+            default_left.extend(bool(d & _DEFAULT_LEFT_MASK) for d in decision)
+            tree_left = [int(v) for v in tree["left_child"].split()]
+            tree_right = [int(v) for v in tree["right_child"].split()]
+            left.extend(child(c) for c in tree_left)
+            right.extend(child(c) for c in tree_right)
+            roots.append(node_base)
+            max_depth = max(max_depth, self._depth(tree_left, tree_right))
+
+        self.num_feature = num_feature
+        self.num_trees = len(roots)
+        self.average_output = average_output
+        self.max_depth = max_depth
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.missing_type = np.asarray(missing_type, dtype=np.int8)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.leaf_value = np.asarray(leaf_value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        # Without zero/NaN-aware splits a split is just ``x <= threshold``
+        self.plain_splits = not bool((self.missing_type != MISSING_NONE).any())
+        # Tree ranges of each fused model (one model unless built with fuse())
+        self.model_ranges = [(0, self.num_trees)]
+        self.model_average = [average_output]
+        self._compile()
+
+    def _compile(self) -> None:
+        """Traversal tables: leaves become self-looping nodes after the internal ones.
+
+        Every row can then take exactly ``max_depth`` steps with no masking:
+        a row that already reached its leaf stays there. ``_children[2 * i + 1]``
+        is node i's left child and ``_children[2 * i]`` its right child.
+        """
+        n_internal = len(self.feature)
+        n_leaves = len(self.leaf_value)
+        leaf_nodes = np.arange(n_internal, n_internal + n_leaves, dtype=np.int64)
+
+        def as_node(ids: np.ndarray) -> np.ndarray:
+            return np.where(ids >= 0, ids, n_internal + ~ids)
+
+        self._leaf_base = n_internal
+        self._root_nodes = as_node(self.roots)
+        self._feature = np.concatenate([self.feature, np.zeros(n_leaves, dtype=np.int64)])
+        # NaN threshold: ``x <= nan`` is False, so a leaf always takes its "right" self-loop
+        self._threshold64 = np.concatenate([self.threshold, np.full(n_leaves, np.nan)])
+        # Largest float32 <= each threshold: for float32 x, x <= t32 exactly when x <= t
+        t32 = self._threshold64.astype(np.float32)
+        over = t32.astype(np.float64) > self._threshold64
+        t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+        self._threshold32 = t32
+        self._missing_type = np.concatenate([self.missing_type, np.zeros(n_leaves, dtype=np.int8)])
+        self._default_left = np.concatenate([self.default_left, np.zeros(n_leaves, dtype=bool)])
+        children = np.empty(2 * (n_internal + n_leaves), dtype=np.int64)
+        children[0:2 * n_internal:2] = as_node(self.right)
+        children[1:2 * n_internal:2] = as_node(self.left)
+        children[2 * n_internal::2] = leaf_nodes
+        children[2 * n_internal + 1::2] = leaf_nodes
+        self._children = children
+
+    @staticmethod
+    def _depth(left: List[int], right: List[int]) -> int:
+        depth = 0
+        stack = [(0, 1)]
+        while stack:
+            node, d = stack.pop()
+            depth = max(depth, d)
+            for c in (left[node], right[node]):
+                if c >= 0:
+                    stack.append((c, d + 1))
+        return depth
+
+    @classmethod
+    def from_model_string(cls, text: str) -> "TreeEnsemble":
+        parsed = _parse_model_text(text)
+        header = parsed["header"]
+        if int(header.get("num_tree_per_iteration", "1")) != 1:
+            raise ValueError("multiclass models are not supported")
+        num_feature = int(header["max_feature_idx"]) + 1
+        return cls(parsed["trees"], num_feature, average_output="average_output" in header)
+
+    @classmethod
+    def from_model_file(cls, path: Path | str) -> "TreeEnsemble":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_model_string(f.read())
+
+    @classmethod
+    def fuse(cls, ensembles: Sequence["TreeEnsemble"]) -> "TreeEnsemble":
+        """One ensemble over the trees of several models; predict_models() splits them back."""
+        if not ensembles:
+            raise ValueError("nothing to fuse")
+        if len({e.num_feature for e in ensembles}) != 1:
+            raise ValueError("fused models must take the same features")
+        fused = cls.__new__(cls)
+        fused.num_feature = ensembles[0].num_feature
+        fused.average_output = False
+        fused.max_depth = max(e.max_depth for e in ensembles)
+        node_offsets = np.cumsum([0] + [len(e.feature) for e in ensembles])
+        leaf_offsets = np.cumsum([0] + [len(e.leaf_value) for e in ensembles])
+
+        def shift(ids: np.ndarray, node_off: int, leaf_off: int) -> np.ndarray:
+            return np.where(ids >= 0, ids + node_off, ~(~ids + leaf_off))
+
+        fused.feature = np.concatenate([e.feature for e in ensembles])
+        fused.threshold = np.concatenate([e.threshold for e in ensembles])
+        fused.missing_type = np.concatenate([e.missing_type for e in ensembles])
+        fused.default_left = np.concatenate([e.default_left for e in ensembles])
+        fused.left = np.concatenate([shift(e.left, n, l) for e, n, l in zip(ensembles, node_offsets, leaf_offsets)])
+        fused.right = np.concatenate([shift(e.right, n, l) for e, n, l in zip(ensembles, node_offsets, leaf_offsets)])
+        fused.roots = np.concatenate([shift(e.roots, n, l) for e, n, l in zip(ensembles, node_offsets, leaf_offsets)])
+        fused.leaf_value = np.concatenate([e.leaf_value for e in ensembles])
+        fused.num_trees = len(fused.roots)
+        fused.plain_splits = all(e.plain_splits for e in ensembles)
+        fused.model_ranges = []
+        fused.model_average = []
+        start = 0
+        for e in ensembles:
+            for lo, hi in e.model_ranges:
+                fused.model_ranges.append((start + lo, start + hi))
+            fused.model_average.extend(e.model_average)
+            start += e.num_trees
+        fused._compile()
+        return fused
+
+    def _inputs(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.num_feature:
+            raise ValueError(
+                f"The number of features in data ({X.shape[-1] if X.ndim else 0}) is not the same as it was in training data ({self.num_feature})."
+            )
+        if X.dtype != np.float32:
+            X = X.astype(np.float64)
+        # LightGBM drops near-zero dense values, so they read back as exactly 0
+        tiny = (np.abs(X) <= K_ZERO_THRESHOLD) & (X != 0)
+        if tiny.any():
+            X = np.where(tiny, 0, X)
+        if self.plain_splits and np.isnan(X).any():
+            # NaN is treated as 0 when the split has no missing-value handling
+            X = np.where(np.isnan(X), 0, X)
+        return np.ascontiguousarray(X)
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf index (into ``leaf_value``) reached by each row in each tree, shape (rows, trees)."""
+        X = self._inputs(X)
+        n = X.shape[0]
+        threshold = self._threshold32 if X.dtype == np.float32 else self._threshold64
+        feature = self._feature
+        children = self._children
+        flat = X.ravel()
+        node = np.tile(self._root_nodes, n)
+        row_offset = np.repeat(np.arange(n, dtype=np.int64) * self.num_feature, self.num_trees)
+        for _ in range(self.max_depth):
+            fval = flat[row_offset + feature[node]]
+            if self.plain_splits:
+                go_left = fval <= threshold[node]
+            else:
+                mtype = self._missing_type[node]
+                nan = np.isnan(fval)
+                fval = np.where(nan & (mtype != MISSING_NAN), 0, fval)
+                missing = ((mtype == MISSING_ZERO) & (fval == 0)) | ((mtype == MISSING_NAN) & nan)
+                go_left = np.where(missing, self._default_left[node], fval <= threshold[node])
+                # Leaves must keep looping even when the row's value counts as missing
+                go_left &= node < self._leaf_base
+            node = children[2 * node + go_left]
+        return (node - self._leaf_base).reshape(n, self.num_trees)
+
+    def predict_models(self, X: np.ndarray) -> np.ndarray:
+        """Raw score of each fused model, shape (rows, models)."""
+        values = self.leaf_value[self.leaves(X)]
+        out = np.empty((values.shape[0], len(self.model_ranges)), dtype=np.float64)
+        for j, ((lo, hi), average) in enumerate(zip(self.model_ranges, self.model_average)):
+            if hi == lo:
+                out[:, j] = 0.0
+                continue
+            # Sequential sum over trees, in LightGBM's order
+            out[:, j] = np.cumsum(values[:, lo:hi], axis=1)[:, -1]
+            if average:
+                out[:, j] /= hi - lo
+        return out
+
+    def predict(self, X: np.ndarray, weights: Optional[Sequence[float]] = None) -> np.ndarray:
+        """Raw score of a single model, or the weighted sum of the fused models."""
+        preds = self.predict_models(X)
+        if weights is None:
+            if preds.shape[1] != 1:
+                raise ValueError("weights are required for fused models")
+            return preds[:, 0]
+        out = np.zeros(preds.shape[0])
+        for j, weight in enumerate(weights):
+            out += preds[:, j] * weight
+        return out
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Parallel hyper-parameter search for the LambdaMART ranker.
+
+Runs seeded random-search trials (plus train_ranker's default parameters) in
+a process pool, each boosting with early stopping on validation NDCG@k. Every
+candidate's tree count, model file size and single-request predict latency
+are then measured one at a time (the faster of LightGBM and tree_eval, as
+EnsembleRanker picks at load). Best NDCG first, candidates whose primary
+model fits the serving-latency budget get train_ranker's secondary model
+trained with their parameters, and the first whose whole EnsembleRanker
+still predicts within the budget is chosen. Its primary, secondary and a
+retrained stage-1 cascade model are written to ml/models with a new
+bundle.json, and all trials to ml/artifacts/metrics.json.
+
+Training data is train_ranker's: the hand-written profiles (cached .npz) or,
+with --synthetic N (default RANKER_SYNTHETIC_PROFILES), a generated
+ChunkStore.
+
+Usage:
+  python ml/tune_ranker.py
+  python ml/tune_ranker.py --trials 32 --parallel 4 --latency-budget-ms 2 --k 10
+  python ml/tune_ranker.py --synthetic 20000 --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import lightgbm as lgb
+import numpy as np
+
+import train_ranker
+from model_bundle import write_manifest
+from tree_eval import TreeEnsemble
+
+BASE = Path(__file__).resolve().parent
+
+# Values sampled per trial; trial 0 always runs train_ranker's defaults
+SEARCH_SPACE: Dict[str, List[Any]] = {
+    "num_leaves": [15, 31, 63, 127, 255],
+    "max_depth": [4, 6, 8, 10, 15],
+    "min_data_in_leaf": [2, 5, 10, 20, 50],
+    "learning_rate": [0.02, 0.05, 0.1],
+    "feature_fraction": [0.7, 0.85, 1.0],
+    "lambda_l2": [0.0, 0.05, 1.0],
+}
+
+# Worker-process state set by _init_worker: (train_data, valid_data, n_queries)
+_datasets: Optional[Tuple[lgb.Dataset, lgb.Dataset, int]] = None
+
+
+def sample_trials(n: int, seed: int) -> List[Dict[str, Any]]:
+    """``n`` distinct parameter overrides: the defaults, then random draws from SEARCH_SPACE."""
+    rng = random.Random(seed)
+    trials: List[Dict[str, Any]] = [{}]
+    seen = set()
+    attempts = 0
+    while len(trials) < n and attempts < n * 50:
+        attempts += 1
+        trial = {key: rng.choice(values) for key, values in SEARCH_SPACE.items()}
+        signature = tuple(sorted(trial.items()))
+        if signature not in seen:
+            seen.add(signature)
+            trials.append(trial)
+    return trials
+
+
+def _init_worker(source: Tuple[Any, ...]) -> None:
+    """Build the Datasets once per worker; every trial it runs reuses their bins."""
+    global _datasets
+    if source[0] == "store":
+        store = train_ranker.ChunkStore(source[1])
+        train_data, valid_data = store.datasets(source[2])
+        n_queries = store.n_queries
+    else:
+        _, X, y, qid_counts, feature_keys = source
+        train_data, valid_data = train_ranker.split_datasets(X, y, qid_counts, feature_keys)
+        n_queries = len(qid_counts)
+    _datasets = (train_data, valid_data, n_queries)
+
+
+def _run_trial(trial_id: int, overrides: Dict[str, Any], k: int, threads: int, max_rounds: int, out_dir: Path) -> Dict[str, Any]:
+    train_data, valid_data, n_queries = _datasets
+    if valid_data is None:
+        raise ValueError("tuning selects on validation NDCG, but the training data left no validation rows")
+    params = {**overrides, "ndcg_eval_at": [k], "num_threads": threads}
+    started = time.perf_counter()
+    model = train_ranker.train_lambdamart_datasets(train_data, valid_data, n_queries, params_override=params, max_rounds=max_rounds)["model"]
+    path = out_dir / f"trial_{trial_id:03d}.txt"
+    # Saves up to the early-stopping best iteration
+    model.save_model(str(path))
+    return {
+        "trial": trial_id,
+        "params": overrides,
+        "ndcg": float(model.best_score["validation"][f"ndcg@{k}"]),
+        "best_iteration": int(model.best_iteration),
+        "train_seconds": round(time.perf_counter() - started, 3),
+        "path": str(path),
+    }
+
+
+def median_ms(fn: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times)) * 1000.0
+
+
+def measure(result: Dict[str, Any], X_request: np.ndarray, repeat: int) -> None:
+    """Add tree count, model file size and single-request predict latency to a trial result."""
+    path = Path(result["path"])
+    booster = lgb.Booster(model_file=str(path))
+    result["trees"] = booster.num_trees()
+    result["size_bytes"] = path.stat().st_size
+    result["lightgbm_ms"] = median_ms(lambda: booster.predict(X_request, num_threads=1), repeat)
+    try:
+        forest = TreeEnsemble.from_model_file(path)
+        result["numpy_ms"] = median_ms(lambda: forest.predict(X_request, [1.0]), repeat)
+    except ValueError:
+        result["numpy_ms"] = None
+    result["latency_ms"] = min(t for t in (result["lightgbm_ms"], result["numpy_ms"]) if t is not None)
+
+
+def mark_pareto(results: List[Dict[str, Any]]) -> None:
+    """Flag results no other result beats on NDCG, latency and size at once."""
+    for r in results:
+        r["pareto"] = not any(
+            o["ndcg"] >= r["ndcg"] and o["latency_ms"] <= r["latency_ms"] and o["size_bytes"] <= r["size_bytes"]
+            and (o["ndcg"], -o["latency_ms"], -o["size_bytes"]) != (r["ndcg"], -r["latency_ms"], -r["size_bytes"])
+            for o in results
+        )
+
+
+def choose(results: List[Dict[str, Any]], budget_ms: float, fits: Callable[[Dict[str, Any]], bool] = lambda r: True) -> Optional[Dict[str, Any]]:
+    """Best NDCG within the latency budget (ties: faster, then smaller) that also passes ``fits``;
+    None if nothing does. ``fits`` is only called on candidates whose own latency is within budget."""
+    feasible = sorted(
+        (r for r in results if r["latency_ms"] <= budget_ms),
+        key=lambda r: (r["ndcg"], -r["latency_ms"], -r["size_bytes"]), reverse=True,
+    )
+    return next((r for r in feasible if fits(r)), None)
+
+
+def build_bundle(result: Dict[str, Any], bundle_dir: Path, feature_keys: List[str], max_rounds: int) -> None:
+    """Candidate model files as served: its primary plus (with advanced features) a secondary trained with its parameters."""
+    train_data, valid_data, n_queries = _datasets
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(result["path"], bundle_dir / "ranker.txt")
+    (bundle_dir / "feature_keys.json").write_text(json.dumps(feature_keys, indent=2))
+    if train_ranker.HAS_ADVANCED:
+        secondary = train_ranker.train_secondary(
+            train_ranker.lambdamart_params(result["params"]), train_data, valid_data,
+            train_ranker.boosting_rounds(n_queries, max_rounds), train_ranker.lambdamart_callbacks(valid_data),
+        )
+        secondary.save_model(str(bundle_dir / "ranker_secondary.txt"))
+
+
+def measure_ensemble(result: Dict[str, Any], bundle_dir: Path, X_request: np.ndarray, repeat: int) -> None:
+    """Add the request latency of the candidate's whole EnsembleRanker (every member, evaluator picked at load)."""
+    from ensemble_ranker import EnsembleRanker
+
+    ensemble = EnsembleRanker(bundle_dir)
+    X = np.asarray(X_request, dtype=np.float32)
+    result["ensemble_ms"] = median_ms(lambda: ensemble.predict(X), repeat)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=16)
+    parser.add_argument("--parallel", type=int, default=0, help="Concurrent trials (default: one per core, at most --trials)")
+    parser.add_argument("--k", type=int, default=10, help="Early stopping and selection on validation NDCG@k")
+    parser.add_argument("--latency-budget-ms", type=float, default=float(os.getenv("RANKER_LATENCY_BUDGET_MS", "5")), help="Per-request predict budget of the whole ensemble")
+    parser.add_argument("--max-rounds", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50, help="Timed predictions per candidate")
+    parser.add_argument("--synthetic", type=int, default=int(os.getenv("RANKER_SYNTHETIC_PROFILES", "0")))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="Report the choice without writing ml/models")
+    args = parser.parse_args()
+
+    models_dir = BASE / "models"
+    artifacts_dir = BASE / "artifacts"
+    cores = os.cpu_count() or 1
+    parallel = max(1, min(args.parallel or cores, args.trials))
+    threads = max(1, cores // parallel)
+
+    exhibits = train_ranker.fetch_exhibits(os.getenv("BACKEND_URL", "http://localhost:5000/api"))
+    if not exhibits:
+        print("Error: No exhibits found. Cannot tune ranker.")
+        return 1
+    workers = int(os.getenv("RANKER_TRAIN_WORKERS", str(cores)))
+    if args.synthetic > 0:
+        store = train_ranker.synthetic_chunk_store(
+            args.synthetic, int(os.getenv("RANKER_SYNTHETIC_SEED", "0")), exhibits, artifacts_dir / "datasets",
+            chunk_size=int(os.getenv("RANKER_SYNTHETIC_CHUNK", "1000")), use_advanced=train_ranker.HAS_ADVANCED, workers=workers,
+        )
+        if len(store.manifest["chunks"]) < 2:
+            print("Error: tuning holds out whole chunks for validation; generate at least two (RANKER_SYNTHETIC_CHUNK).")
+            return 1
+        feature_keys = store.manifest["feature_keys"]
+        source: Tuple[Any, ...] = ("store", store.path, feature_keys)
+        X_first, _, counts = next(store.iter_chunks())
+        X_request = np.asarray(X_first[: counts[0]])
+        chunks = store.iter_chunks
+    else:
+        users = train_ranker.synthetic_user_profiles()
+        X, y, qid_counts, feature_keys = train_ranker.load_or_build_training_arrays(users, exhibits, use_advanced=train_ranker.HAS_ADVANCED, workers=workers, cache_dir=artifacts_dir / "datasets")
+        source = ("arrays", X, y, qid_counts, feature_keys)
+        X_request = X[: qid_counts[0]]
+        chunks = lambda: [(X, y, qid_counts)]
+
+    trials = sample_trials(args.trials, args.seed)
+    print(f"Tuning: {len(trials)} trials, {parallel} in parallel x {threads} threads, NDCG@{args.k}, budget {args.latency_budget_ms} ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp)
+        try:
+            with ProcessPoolExecutor(max_workers=parallel, initializer=_init_worker, initargs=(source,)) as pool:
+                results = list(pool.map(
+                    _run_trial, range(len(trials)), trials, repeat(args.k), repeat(threads), repeat(args.max_rounds), repeat(out_dir),
+                ))
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+
+        # Latency is measured after the pool is gone so trials do not contend for cores
+        for r in results:
+            measure(r, X_request, args.repeat)
+        mark_pareto(results)
+
+        # The service scores with the whole ensemble: the budget applies to that, not the primary alone
+        _init_worker(source)
+
+        def ensemble_fits(r: Dict[str, Any]) -> bool:
+            bundle_dir = out_dir / f"bundle_{r['trial']:03d}"
+            print(f"Measuring the ensemble of trial {r['trial']}...")
+            build_bundle(r, bundle_dir, feature_keys, args.max_rounds)
+            measure_ensemble(r, bundle_dir, X_request, args.repeat)
+            return r["ensemble_ms"] <= args.latency_budget_ms
+
+        chosen = choose(results, args.latency_budget_ms, ensemble_fits)
+
+        print(f"\n{'trial':>5} {'ndcg@' + str(args.k):>8} {'trees':>6} {'KB':>8} {'ms':>7} {'ens ms':>7}  pareto  params")
+        for r in sorted(results, key=lambda r: -r["ndcg"]):
+            mark = "*" if chosen is r else " "
+            ensemble_ms = f"{r['ensemble_ms']:>7.3f}" if "ensemble_ms" in r else f"{'-':>7}"
+            print(f"{r['trial']:>4}{mark} {r['ndcg']:>8.4f} {r['trees']:>6} {r['size_bytes'] / 1024:>8.1f} {r['latency_ms']:>7.3f} {ensemble_ms}  {'yes' if r['pareto'] else '   '}     {r['params'] or 'defaults'}")
+        if chosen is None:
+            print(f"\nNo candidate's ensemble predicts within {args.latency_budget_ms} ms; nothing written.")
+            return 1
+        print(f"\nChosen: trial {chosen['trial']} (NDCG@{args.k} {chosen['ndcg']:.4f}, ensemble {chosen['ensemble_ms']:.3f} ms)")
+        if args.dry_run:
+            return 0
+
+        models_dir.mkdir(parents=True, exist_ok=True)
+        artifacts_dir.mkdir(parents=True, exist_ok=True)
+        bundle_dir = out_dir / f"bundle_{chosen['trial']:03d}"
+        if train_ranker.HAS_ADVANCED:
+            # Stage 1 does not depend on the trial's parameters, only on the data tuned on
+            print("Training stage-1 cascade model (base features)...")
+            if source[0] == "store":
+                stage1 = train_ranker.train_stage1(feature_keys, store)
+            else:
+                stage1 = train_ranker.train_stage1(feature_keys, X=X, y=y, qid_counts=qid_counts)
+            stage1.save_model(str(bundle_dir / "ranker_stage1.txt"))
+        # Exactly the tuned bundle: no member left over from an earlier training run
+        for name in ("ranker.txt", "ranker_secondary.txt", "ranker_stage1.txt", "feature_keys.json"):
+            if (bundle_dir / name).exists():
+                shutil.copyfile(bundle_dir / name, models_dir / name)
+            else:
+                (models_dir / name).unlink(missing_ok=True)
+        avg_top10 = train_ranker.avg_label_top10(lgb.Booster(model_file=str(models_dir / "ranker.txt")), chunks())
+
+    for r in results:
+        del r["path"]
+    tuning = {
+        "metric": f"ndcg@{args.k}",
+        "latency_budget_ms": args.latency_budget_ms,
+        "chosen": chosen["trial"],
+        "trials": results,
+    }
+    (artifacts_dir / "metrics.json").write_text(json.dumps({"avg_label_top10": avg_top10, "tuning": tuning}, indent=2))
+
+    # Written last: a running ranker service swaps in the new bundle once this appears
+    import feature_schema
+    schema = feature_schema.lookup(feature_keys) or feature_schema.FeatureSchema("unregistered", feature_keys)
+    manifest = write_manifest(models_dir, extra={"feature_schema": schema.info(), "tuning": {"trial": chosen["trial"], "params": chosen["params"]}})
+    print(f"Model bundle {manifest['version']} written to: {models_dir / 'bundle.json'}")
+    print(f"Metrics saved to: {artifacts_dir / 'metrics.json'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
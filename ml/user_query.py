@@ -0,0 +1,77 @@
+"""
+Per-request user-side feature data.
+
+Stripped and lower-cased interests, the interest keyword set, the expanded
+query and its n-grams and the categorical flags depend only on the user
+profile, so they are derived once per request and shared by every feature
+builder (scalar and batch) and by train_ranker.label_exhibit, instead of
+being rebuilt for every exhibit.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Set
+
+from features import extract_keywords
+
+
+class UserQuery:
+    """User-only derived data used by the feature builders."""
+
+    __slots__ = (
+        "user",
+        "interests",
+        "keywords_lower",
+        "interest_set",
+        "interests_text",
+        "keywords",
+        "age_band",
+        "group_type",
+        "time_budget",
+        "mobility",
+        "crowd_tolerance",
+        "_expanded",
+        "_matcher",
+    )
+
+    def __init__(self, user: Dict[str, Any]):
+        self.user = user
+        # Interests as the builders have always read them: stripped, blanks dropped
+        self.interests: List[str] = [x.strip() for x in (user.get("interests") or []) if x]
+        # Lower-cased non-empty interests, in order (the per-interest match loops)
+        self.keywords_lower: List[str] = [kw.lower() for kw in self.interests if kw]
+        self.interest_set: Set[str] = {x.lower() for x in self.interests}
+        self.interests_text = " ".join(self.interests).lower()
+        self.keywords = extract_keywords(self.interests_text)
+        self.age_band = user.get("ageBand", "")
+        self.group_type = user.get("groupType", "")
+        self.time_budget = float(user.get("timeBudget") or 0)
+        self.mobility = user.get("mobility") or ""
+        self.crowd_tolerance = user.get("crowdTolerance") or ""
+        self._expanded: Optional[List[str]] = None
+        self._matcher: Optional[Any] = None
+
+    @classmethod
+    def of(cls, user: Dict[str, Any] | "UserQuery") -> "UserQuery":
+        """``user`` itself if already compiled, else a new UserQuery for it."""
+        return user if isinstance(user, cls) else cls(user)
+
+    @property
+    def expanded(self) -> List[str]:
+        """Synonym-expanded interests (advanced_features.expand_query), built on first use."""
+        if self._expanded is None:
+            from advanced_features import expand_query
+            self._expanded = expand_query(self.interests)
+        return self._expanded
+
+    @property
+    def matcher(self) -> Any:
+        """The expanded query compiled for the per-exhibit text features (advanced_features.QueryMatcher)."""
+        if self._matcher is None:
+            from advanced_features import query_matcher
+            self._matcher = query_matcher(tuple(self.expanded))
+        return self._matcher
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Raw profile field, so code written against the request dict keeps working."""
+        return self.user.get(key, default)
@@ -5,6 +5,10 @@ Fetch exhibits from backend, call the ranker service, and print top recommendati
 Usage (PowerShell):
   $env:BACKEND_URL="http://localhost:5000/api"; $env:RANKER_URL="http://127.0.0.1:8012"; \
   python scripts/recommend_cli.py --interests physics,science --ageBand teens --groupType student --timeBudget 60
+
+Catalog mode ranks the ranker's server-resident catalog and sends only the profile
+(add --sync-catalog once to push the backend's exhibits to the ranker first):
+  python scripts/recommend_cli.py --catalog --interests astronomy --floor ground
 """
 
 import argparse
@@ -21,6 +25,18 @@ def fetch_exhibits(backend_url: str) -> List[Dict[str, Any]]:
     return data if isinstance(data, list) else (data.get("exhibits") or data.get("data") or [])
 
 
+def ranker_exhibits(exhibits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"id": ex.get("id"), "name": ex.get("name"), "description": ex.get("description"), "category": ex.get("category"), "exhibitType": ex.get("exhibitType"), "ageRange": ex.get("ageRange"), "features": ex.get("features"), "interactiveFeatures": ex.get("interactiveFeatures")}
+        for ex in exhibits
+        if ex.get("id")
+    ]
+
+
+def split_csv(value: str) -> List[str]:
+    return [x.strip() for x in value.split(",") if x.strip()]
+
+
 def main() -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--interests", type=str, default="")
@@ -31,15 +47,19 @@ def main() -> int:
     parser.add_argument("--mobility", type=str, default="none")
     parser.add_argument("--crowdTolerance", type=str, default="medium")
     parser.add_argument("--topK", type=int, default=10)
+    parser.add_argument("--catalog", action="store_true", help="Rank the ranker's resident catalog instead of posting exhibits")
+    parser.add_argument("--sync-catalog", action="store_true", help="Upsert the backend's exhibits into the ranker catalog first")
+    parser.add_argument("--ids", type=str, default="", help="Catalog mode: comma-separated exhibit ids to rank")
+    parser.add_argument("--category", type=str, default="", help="Catalog mode: comma-separated categories")
+    parser.add_argument("--floor", type=str, default="", help="Catalog mode: comma-separated floors")
     args = parser.parse_args()
 
     backend_url = os.getenv("BACKEND_URL", "http://localhost:5000/api")
     ranker_url = os.getenv("RANKER_URL", "http://127.0.0.1:8012")
 
-    exhibits = fetch_exhibits(backend_url)
-    payload = {
+    payload: Dict[str, Any] = {
         "userProfile": {
-            "interests": [x.strip() for x in args.interests.split(",") if x.strip()],
+            "interests": split_csv(args.interests),
             "ageBand": args.ageBand,
             "groupType": args.groupType,
             "groupSize": args.groupSize,
@@ -47,14 +67,24 @@ def main() -> int:
             "mobility": args.mobility,
             "crowdTolerance": args.crowdTolerance,
         },
-        "exhibits": [
-            {"id": ex.get("id"), "name": ex.get("name"), "description": ex.get("description"), "category": ex.get("category"), "exhibitType": ex.get("exhibitType"), "ageRange": ex.get("ageRange"), "features": ex.get("features"), "interactiveFeatures": ex.get("interactiveFeatures")}
-            for ex in exhibits
-            if ex.get("id")
-        ],
         "topK": args.topK,
     }
 
+    if args.catalog or args.sync_catalog:
+        if args.sync_catalog:
+            exhibits = ranker_exhibits(fetch_exhibits(backend_url))
+            r = requests.post(f"{ranker_url.rstrip('/')}/catalog/upsert", json={"exhibits": exhibits}, timeout=60)
+            r.raise_for_status()
+            info = r.json()
+            print(f"Catalog version {info.get('version')} ({info.get('size')} exhibits)")
+        if args.ids:
+            payload["exhibitIds"] = split_csv(args.ids)
+        filters = {k: split_csv(v) for k, v in (("category", args.category), ("floor", args.floor)) if v}
+        if filters:
+            payload["filter"] = filters
+    else:
+        payload["exhibits"] = ranker_exhibits(fetch_exhibits(backend_url))
+
     r = requests.post(f"{ranker_url.rstrip('/')}/rank", json=payload, timeout=60)
     r.raise_for_status()
     data = r.json()
@@ -2,7 +2,7 @@
 """
 Evaluate the ML ranker directly using backend exhibits.
 
-Reads exhibits from BACKEND_URL, calls RANKER_URL /rank, and computes
+Reads exhibits from BACKEND_URL, calls RANKER_URL /rank_batch (or /rank), and computes
 precision/recall/F1/MRR/coverage/interest-match metrics similar to the
 existing accuracy script.
 
@@ -12,7 +12,7 @@ Outputs: accuracy_ranker_report.json at repo root.
 import os
 import json
 from pathlib import Path
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 import requests
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -238,23 +238,27 @@ def create_test_cases(exhibits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return tests
 
 
+def ranker_exhibits(exhibits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            'id': ex.get('id'),
+            'name': ex.get('name'),
+            'description': ex.get('description'),
+            'category': ex.get('category'),
+            'exhibitType': ex.get('exhibitType'),
+            'ageRange': ex.get('ageRange'),
+            'features': ex.get('features'),
+            'interactiveFeatures': ex.get('interactiveFeatures'),
+            'rating': ex.get('rating'),
+            'tags': ex.get('tags')
+        } for ex in exhibits if ex.get('id')
+    ]
+
+
 def call_ranker(user_profile: Dict[str, Any], exhibits: List[Dict[str, Any]], top_k: int = 50) -> List[Dict[str, Any]]:
     payload = {
         'userProfile': user_profile,
-        'exhibits': [
-            {
-                'id': ex.get('id'),
-                'name': ex.get('name'),
-                'description': ex.get('description'),
-                'category': ex.get('category'),
-                'exhibitType': ex.get('exhibitType'),
-                'ageRange': ex.get('ageRange'),
-                'features': ex.get('features'),
-                'interactiveFeatures': ex.get('interactiveFeatures'),
-                'rating': ex.get('rating'),
-                'tags': ex.get('tags')
-            } for ex in exhibits if ex.get('id')
-        ],
+        'exhibits': ranker_exhibits(exhibits),
         'topK': top_k,
     }
     r = requests.post(f"{RANKER_URL.rstrip('/')}/rank", json=payload, timeout=60)
@@ -267,6 +271,25 @@ def call_ranker(user_profile: Dict[str, Any], exhibits: List[Dict[str, Any]], to
     return data.get('results', [])
 
 
+def call_ranker_batch(user_profiles: List[Dict[str, Any]], exhibits: List[Dict[str, Any]], top_k: int = 50) -> Optional[List[List[Dict[str, Any]]]]:
+    """All profiles in one /rank_batch request; None if the service can't batch."""
+    payload = {
+        'userProfiles': user_profiles,
+        'exhibits': ranker_exhibits(exhibits),
+        'topK': top_k,
+    }
+    try:
+        r = requests.post(f"{RANKER_URL.rstrip('/')}/rank_batch", json=payload, timeout=120)
+    except requests.RequestException:
+        return None
+    if not r.ok:
+        return None
+    data = r.json()
+    if not data.get('success'):
+        return None
+    return data.get('results', [])
+
+
 def calculate_metrics(recommended: List[str], expected: List[str], all_exhibits: Set[str]) -> Dict[str, Any]:
     recommended_set = set(recommended)
     expected_set = set(expected)
@@ -332,11 +355,13 @@ def main() -> int:
     all_ids = {ex.get('id') for ex in exhibits if ex.get('id')}
 
     print(f"\nTesting ranker at {RANKER_URL}...")
+    # One batched request for every test case; per-test /rank if batching is unavailable
+    batched = call_ranker_batch([tc['userProfile'] for tc in tests], exhibits, top_k=50)
     results = []
     for i, tc in enumerate(tests, 1):
         print(f"  Test {i}/{len(tests)}: {tc['name']}...", end=" ", flush=True)
         try:
-            ranked = call_ranker(tc['userProfile'], exhibits, top_k=50)
+            ranked = batched[i - 1] if batched is not None else call_ranker(tc['userProfile'], exhibits, top_k=50)
             rec_ids = [r.get('id') for r in ranked]
             metrics = calculate_metrics(rec_ids, tc.get('expected', []), all_ids)
             metrics['interest_match'] = interest_match_score(rec_ids, exhibits, tc.get('keywords', []))
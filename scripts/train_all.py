@@ -24,6 +24,11 @@ def main() -> int:
 		return 1
 	run([sys.executable, str(ranker_script)])
 
+	# 1b) (Optional) Hyper-parameter search; swaps in the best primary ranker within the latency budget
+	tune_script = ROOT / "ml" / "tune_ranker.py"
+	if os.getenv("RANKER_TUNE", "0") == "1" and tune_script.exists():
+		run([sys.executable, str(tune_script)])
+
 	# 2) Rebuild embeddings and FAISS for retriever/chatbot
 	build_emb = ROOT / "gemma" / "scripts" / "build_embeddings.py"
 	if build_emb.exists():